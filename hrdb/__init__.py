@@ -0,0 +1 @@
+"""Data layer for the Horse Racing Database app (no Streamlit imports in here)."""
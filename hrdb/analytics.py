@@ -0,0 +1,427 @@
+"""Columnar copy of the race results for the analytics reports.
+
+Season and age/gender statistics aggregate the whole race history. As SQL
+they are joins of RaceResults, Race and Horse that read every row on each
+request. Instead the joined rows are exported, once, into NumPy columns (one
+array per attribute, strings replaced by small integer codes):
+
+    day     race date (datetime64[D])      track   -> tracks[]      prize   float64
+    season  year of the race               gender  -> genders[]     place   index in RESULT_OPTIONS
+    race    race code (distinct races)     age     int8, -1 unknown
+
+and, for trainer performance, the ResultFacts rows (hrdb/facts.py) of each trainer,
+credited through the stable the horse ran for, summed per season:
+
+    credit_trainer  -> trainer_names[]     credit_season   credit_starts   credit_wins   credit_prize
+
+A report is then a few vectorized passes (np.bincount over combined group
+codes, a lexsort for the quantiles), which take milliseconds per million
+results and never touch the transactional database. The results of archived
+seasons are read from their files (hrdb/archive.py) and exported with the rest.
+
+The copy follows the data versions (hrdb/versions.py) of the tables it reads.
+It is checked at most every HR_ANALYTICS_REFRESH seconds (default 30), and a
+stale copy is rebuilt in a background thread while the old one keeps answering.
+The copy is also saved to HR_ANALYTICS_DIR (default analytics/, .npz), so a new
+process starts from the file instead of re-exporting, while the versions match.
+
+    python -m hrdb.analytics --sqlite /tmp/big.sqlite      # export + report timings vs SQL
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from hrdb import archive, facts, versions
+from hrdb import queries as Q
+from hrdb.backend import ROOT, has_table, make_engine
+from hrdb.rules import RESULT_OPTIONS
+
+ANALYTICS_DIR = Path(os.environ.get("HR_ANALYTICS_DIR") or ROOT / "analytics")
+REFRESH_SECONDS = float(os.environ.get("HR_ANALYTICS_REFRESH", 30))
+BATCH = 100_000
+WIN = RESULT_OPTIONS.index("first")
+
+# the tables the copy is made from (data version names)
+SOURCES = ["race", "raceresults", "horse", "trainer", "resultfacts", "archivedseasons"]
+
+EXPORT_RESULTS = """
+    SELECT r.raceId, r.raceDate, r.trackName, h.age, h.gender, rr.results, rr.prize
+    FROM RaceResults rr
+    JOIN Race  r ON r.raceId  = rr.raceId
+    JOIN Horse h ON h.horseId = rr.horseId
+"""
+# the report only filters by season, so the credits come summed per trainer and season
+_CREDITS = """
+    SELECT trainerId, {season} AS season, COUNT(*) AS starts,
+           SUM(CASE WHEN position = 1 THEN 1 ELSE 0 END) AS wins, SUM(COALESCE(prize, 0)) AS prize
+    FROM ResultFacts
+    WHERE trainerId <> ''
+    GROUP BY trainerId, {season}
+"""
+EXPORT_CREDITS = {"mysql": _CREDITS.format(season="YEAR(raceDate)"),
+                  "sqlite": _CREDITS.format(season="CAST(substr(raceDate, 1, 4) AS INTEGER)")}
+CREDIT_COLUMNS = ["trainerId", "season", "starts", "wins", "prize"]
+EXPORT_TRAINERS = "SELECT trainerId, fname, lname FROM Trainer ORDER BY trainerId"
+
+# same answer as prize_by_track_season(), as a row-store query (for the timings in main())
+SQL_PRIZE_BY_TRACK = """
+    SELECT r.trackName, SUBSTR(r.raceDate, 1, 4) AS season, COUNT(*) AS results, SUM(rr.prize) AS total
+    FROM RaceResults rr
+    JOIN Race r ON r.raceId = rr.raceId
+    GROUP BY r.trackName, SUBSTR(r.raceDate, 1, 4)
+"""
+
+
+@dataclass
+class ResultColumns:
+    """One row per race result, column by column."""
+    day: np.ndarray
+    season: np.ndarray
+    race: np.ndarray
+    track: np.ndarray
+    gender: np.ndarray
+    age: np.ndarray
+    place: np.ndarray
+    prize: np.ndarray
+    by_prize: np.ndarray                # row numbers in increasing prize order (for the quantiles)
+    tracks: np.ndarray                  # code -> label
+    genders: np.ndarray
+    trainer_names: np.ndarray           # one per trainer
+    credit_trainer: np.ndarray          # ResultFacts summed per trainer and season (-1: not in Trainer)
+    credit_season: np.ndarray
+    credit_starts: np.ndarray
+    credit_wins: np.ndarray
+    credit_prize: np.ndarray
+    versions: dict = field(default_factory=dict)
+    built: float = 0.0                  # time.time() of the export
+    seconds: float = 0.0                # how long the export took
+
+    def __len__(self):
+        return len(self.prize)
+
+    def seasons(self) -> list[int]:
+        return sorted(int(s) for s in np.unique(self.season) if s >= 0)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {f.name: getattr(self, f.name) for f in fields(self) if f.type is np.ndarray}
+        meta = {"versions": self.versions, "built": self.built, "seconds": self.seconds}
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)           # readers never see a half-written file
+
+    @classmethod
+    def load(cls, path: Path) -> "ResultColumns":
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            return cls(**{k: npz[k] for k in npz.files if k != "meta"}, **meta)
+
+
+# ---------- export ----------
+def _codes(values, lookup: dict) -> np.ndarray:
+    return np.fromiter((lookup.setdefault(v, len(lookup)) for v in values), np.int32, len(values))
+
+
+def _labels(lookup: dict) -> np.ndarray:
+    return np.array([str(k) if k is not None else "—" for k in lookup], dtype=str)
+
+
+def export(cx) -> ResultColumns:
+    """Read the joined results into columns (streamed in batches of BATCH rows)."""
+    t0 = time.perf_counter()
+    races, tracks, genders = {}, {}, {}
+    places = {p: i for i, p in enumerate(RESULT_OPTIONS)}
+    parts = {k: [] for k in _EMPTY}
+    result = cx.execute(text(EXPORT_RESULTS))
+    # the stored results, then the archived seasons' (hrdb/archive.py)
+    for rows in chain(iter(lambda: result.fetchmany(BATCH), []), archive.result_rows(cx)):
+        if not rows:
+            continue
+        race_id, day, track, age, gender, place, prize = zip(*rows)
+        parts["day"].append(np.array(day, dtype="datetime64[D]"))
+        parts["race"].append(_codes(race_id, races))
+        parts["track"].append(_codes(track, tracks).astype(np.int16))
+        parts["gender"].append(_codes(gender, genders).astype(np.int8))
+        parts["age"].append(np.fromiter((-1 if a is None else a for a in age), np.int8, len(age)))
+        parts["place"].append(np.fromiter((places.get(p, -1) for p in place), np.int8, len(place)))
+        parts["prize"].append(np.fromiter((p or 0.0 for p in prize), np.float64, len(prize)))
+
+    # the credits: the stored facts a table at a time (grouping the union of the SQLite seasons
+    # is slower), then the archived seasons'; trainers not in Trainer are left out, as in the
+    # SQL trainer reports
+    trainers = cx.execute(text(EXPORT_TRAINERS)).all()
+    codes = {tid: i for i, (tid, _, _) in enumerate(trainers)}
+    hot = (pd.DataFrame(cx.execute(text(facts.on(Q.pick(EXPORT_CREDITS, cx), table))).all(), columns=CREDIT_COLUMNS)
+           for table in facts.tables(cx))
+    for f in chain(hot, archive.credit_frames(cx)):
+        parts["credit_trainer"].append(f["trainerId"].map(codes).fillna(-1).to_numpy(np.int32))
+        parts["credit_season"].append(f["season"].to_numpy(np.int16))
+        parts["credit_starts"].append(f["starts"].to_numpy(np.int64))
+        parts["credit_wins"].append(pd.to_numeric(f["wins"]).to_numpy(np.int64))
+        parts["credit_prize"].append(pd.to_numeric(f["prize"]).to_numpy(np.float64))
+    cols = {k: np.concatenate(v) if v else np.array([], dtype=_EMPTY[k]) for k, v in parts.items()}
+
+    cols["by_prize"] = np.argsort(cols["prize"], kind="stable").astype(np.int32)
+    years = cols["day"].astype("datetime64[Y]").astype(np.int64) + 1970
+    cols["season"] = np.where(np.isnat(cols["day"]), -1, years).astype(np.int16)
+
+    return ResultColumns(
+        **cols,
+        tracks=_labels(tracks), genders=_labels(genders),
+        trainer_names=np.array([f"{f or ''} {l or ''}".strip() or tid for tid, f, l in trainers], dtype=str),
+        versions=_source_versions(cx), built=time.time(), seconds=time.perf_counter() - t0,
+    )
+
+
+_EMPTY = {"day": "datetime64[D]", "race": np.int32, "track": np.int16, "gender": np.int8, "age": np.int8,
+          "place": np.int8, "prize": np.float64, "credit_trainer": np.int32, "credit_season": np.int16,
+          "credit_starts": np.int64, "credit_wins": np.int64, "credit_prize": np.float64}
+
+
+def _source_versions(cx) -> dict:
+    if not has_table(cx, "DataVersions"):
+        return {}
+    live = versions.read(cx)
+    return {t: live.get(t, 0) for t in SOURCES}
+
+
+# ---------- vectorized reports ----------
+def _mask(c: ResultColumns, seasons) -> np.ndarray | slice:
+    """Rows in the (first, last) season range; all rows when seasons is None."""
+    if seasons is None:
+        return slice(None)
+    first, last = seasons
+    return (c.season >= first) & (c.season <= last)
+
+
+def _group(*keys: tuple[np.ndarray, int]) -> tuple[np.ndarray, int]:
+    """One group code per row from (codes, number of codes) pairs, and the number of groups."""
+    gid, n = np.zeros(len(keys[0][0]), np.int64), 1
+    for codes, size in keys:
+        gid = gid * size + codes
+        n *= size
+    return gid, n
+
+
+def _ungroup(gid: np.ndarray, *sizes: int) -> list[np.ndarray]:
+    """Inverse of _group() for the given group codes."""
+    out = []
+    for size in reversed(sizes):
+        out.append(gid % size)
+        gid = gid // size
+    return out[::-1]
+
+
+def _quantiles(gid: np.ndarray, values: np.ndarray, n: int, qs) -> list[np.ndarray]:
+    """Per-group quantiles (lower value, no interpolation) of values given in increasing order.
+
+    A stable sort of the group codes keeps each group in value order; for up to
+    65536 groups it is a radix sort, linear in the number of rows."""
+    order = np.argsort(gid.astype(np.uint16) if n <= 1 << 16 else gid, kind="stable")
+    counts = np.bincount(gid, minlength=n)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ordered = values[order]
+    out = []
+    for q in qs:
+        at = starts + np.floor(q * np.maximum(counts - 1, 0)).astype(np.int64)
+        out.append(np.where(counts > 0, ordered[np.minimum(at, len(ordered) - 1)], np.nan))
+    return out
+
+
+def prize_by_track_season(c: ResultColumns, seasons=None) -> pd.DataFrame:
+    """Prize distribution per track and season."""
+    rows = c.by_prize                                      # in prize order, for the quantiles
+    keep = c.season[rows] >= 0
+    if seasons is not None:
+        keep &= _mask(c, seasons)[rows]
+    rows = rows[keep]
+    if not len(rows):
+        return pd.DataFrame()
+    season, track, prize, race = c.season[rows], c.track[rows], c.prize[rows], c.race[rows]
+    first = int(season.min())
+    n_seasons = int(season.max()) - first + 1
+    gid, n = _group((track.astype(np.int64), len(c.tracks)), (season.astype(np.int64) - first, n_seasons))
+
+    results = np.bincount(gid, minlength=n)
+    total = np.bincount(gid, weights=prize, minlength=n)
+    paid = np.bincount(gid, weights=prize > 0, minlength=n)
+    race_group = np.full(int(race.max()) + 1, -1, np.int64)
+    race_group[race] = gid                                 # a race has one track and season
+    races = np.bincount(race_group[race_group >= 0], minlength=n)
+    median, p90 = _quantiles(gid, prize, n, (0.5, 0.9))
+
+    used = np.flatnonzero(results)
+    t, s = _ungroup(used, len(c.tracks), n_seasons)
+    return pd.DataFrame({
+        "Track": c.tracks[t],
+        "Season": s + first,
+        "Races": races[used],
+        "Results": results[used],
+        "Total Prize": total[used].round(2),
+        "Mean Prize": (total[used] / results[used]).round(2),
+        "Median Prize": median[used],
+        "90th Percentile": p90[used],
+        "Paid Share": (paid[used] / results[used]).round(3),
+    }).sort_values(["Track", "Season"], ignore_index=True)
+
+
+def win_rate_by_age_gender(c: ResultColumns, seasons=None) -> pd.DataFrame:
+    """Starts, wins and win rate per horse age and gender."""
+    m = _mask(c, seasons)
+    age, gender, place, prize = c.age[m], c.gender[m], c.place[m], c.prize[m]
+    if not len(prize):
+        return pd.DataFrame()
+    n_ages = int(age.max()) + 2                          # age -1 (unknown) -> 0
+    gid, n = _group((age.astype(np.int64) + 1, n_ages), (gender.astype(np.int64), len(c.genders)))
+    starts = np.bincount(gid, minlength=n)
+    wins = np.bincount(gid, weights=place == WIN, minlength=n)
+    total = np.bincount(gid, weights=prize, minlength=n)
+
+    used = np.flatnonzero(starts)
+    a, g = _ungroup(used, n_ages, len(c.genders))
+    return pd.DataFrame({
+        "Age": pd.array(np.where(a == 0, pd.NA, a - 1), dtype="Int64"),
+        "Gender": c.genders[g],
+        "Starts": starts[used],
+        "Wins": wins[used].astype(np.int64),
+        "Win Rate": (wins[used] / starts[used]).round(4),
+        "Mean Prize": (total[used] / starts[used]).round(2),
+    }).sort_values(["Age", "Gender"], ignore_index=True)
+
+
+def trainer_performance(c: ResultColumns, seasons=None) -> pd.DataFrame:
+    """Starts, wins and prize per trainer and season. As in the other trainer reports, a result
+    is credited to the trainers of the stable the horse ran for (the ResultFacts rows)."""
+    keep = c.credit_trainer >= 0
+    if seasons is not None:
+        keep &= (c.credit_season >= seasons[0]) & (c.credit_season <= seasons[1])
+    trainer, season = c.credit_trainer[keep], c.credit_season[keep]
+    if not keep.any():
+        return pd.DataFrame()
+    first = int(season.min())
+    n_seasons = int(season.max()) - first + 1
+    gid, n = _group((trainer.astype(np.int64), len(c.trainer_names)), (season.astype(np.int64) - first, n_seasons))
+    starts = np.bincount(gid, weights=c.credit_starts[keep], minlength=n).astype(np.int64)
+    wins = np.bincount(gid, weights=c.credit_wins[keep], minlength=n)
+    total = np.bincount(gid, weights=c.credit_prize[keep], minlength=n)
+
+    used = np.flatnonzero(starts)
+    t, s = _ungroup(used, len(c.trainer_names), n_seasons)
+    return pd.DataFrame({
+        "Trainer": c.trainer_names[t],
+        "Season": s + first,
+        "Starts": starts[used],
+        "Wins": wins[used].astype(np.int64),
+        "Win Rate": (wins[used] / starts[used]).round(4),
+        "Total Prize": total[used].round(2),
+    }).sort_values(["Trainer", "Season"], ignore_index=True)
+
+
+REPORTS = {
+    "prize-by-track-season": prize_by_track_season,
+    "win-rate-by-age-gender": win_rate_by_age_gender,
+    "trainer-performance": trainer_performance,
+}
+
+
+# ---------- the shared, refreshed copy ----------
+class Analytics:
+    """The current ResultColumns of one database, refreshed in the background when stale."""
+
+    def __init__(self, engine, refresh: float = REFRESH_SECONDS, cache_dir: Path | None = ANALYTICS_DIR):
+        self.engine = engine
+        self.refresh = refresh
+        key = hashlib.sha1(str(engine.url).encode()).hexdigest()[:12]
+        self.path = cache_dir / f"results-{key}.npz" if cache_dir else None
+        self._cols: ResultColumns | None = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding: threading.Thread | None = None
+
+    def _live_versions(self) -> dict:
+        with self.engine.connect() as cx:
+            return _source_versions(cx)
+
+    def _build(self) -> ResultColumns:
+        with self.engine.connect() as cx, cx.begin():     # one consistent read
+            cols = export(cx)
+        if self.path:
+            try:
+                cols.save(self.path)
+            except OSError:
+                pass                                       # read-only checkout: keep it in memory
+        self._cols, self._checked = cols, time.monotonic()
+        return cols
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding and self._rebuilding.is_alive():
+                return
+            self._rebuilding = threading.Thread(target=self._build, name="analytics-export", daemon=True)
+            self._rebuilding.start()
+
+    def columns(self) -> ResultColumns:
+        """The current copy. The first call loads the saved file (if still current) or exports."""
+        if self._cols is None:
+            with self._lock:
+                if self._cols is None:
+                    live = self._live_versions()
+                    if self.path and self.path.exists():
+                        try:
+                            saved = ResultColumns.load(self.path)
+                            if saved.versions == live and live:
+                                self._cols, self._checked = saved, time.monotonic()
+                        except (OSError, ValueError, KeyError, TypeError):
+                            pass                           # unreadable file or older columns: export again
+                    if self._cols is None:
+                        self._build()
+            return self._cols
+        if time.monotonic() - self._checked >= self.refresh:
+            self._checked = time.monotonic()
+            if self._live_versions() != self._cols.versions:
+                self._rebuild_in_background()
+        return self._cols
+
+    def rebuild(self) -> ResultColumns:
+        """Export again now (blocking)."""
+        with self._lock:
+            return self._build()
+
+    def report(self, name: str, seasons=None) -> pd.DataFrame:
+        return REPORTS[name](self.columns(), seasons)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    ap.add_argument("--runs", type=int, default=5, help="timed runs of each report")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    cols = Analytics(engine, cache_dir=None).columns()
+    mb = sum(getattr(cols, f.name).nbytes for f in fields(cols) if f.type is np.ndarray) / 1e6
+    print(f"exported {len(cols):,} results in {cols.seconds:.2f}s ({mb:.1f} MB of columns)")
+    for name, fn in REPORTS.items():
+        t0 = time.perf_counter()
+        for _ in range(args.runs):
+            df = fn(cols)
+        print(f"  {name:<24} {len(df):>7,} rows  {(time.perf_counter() - t0) / args.runs * 1000:8.1f} ms")
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as cx:
+            t0 = time.perf_counter()
+            cx.execute(text(SQL_PRIZE_BY_TRACK)).all()
+        print(f"  (same grouping in SQL: {(time.perf_counter() - t0) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Read-only JSON/HTTP API over the guest reports, for machine clients.
+
+    GET /reports                                    names of the reports
+    GET /reports/horses-by-owner?lname=Ahmed        paged: &size=50&after=<next from the previous page>
+    GET /reports/trainer-winners?season=2024        paged; every season without ?season
+    GET /reports/trainer-winnings?from=2024-03-01&to=2024-06-30
+    GET /reports/track-stats                        (these three take ?season or ?from&to)
+    GET /reports/horse-ratings                      paged (also trainer-ratings, stable-ratings)
+    GET /suggest/owner?q=moh                        as-you-type names (also trainer, horse): &limit=8
+
+Requests are served by Starlette on uvicorn with an asyncio engine (aiomysql,
+or aiosqlite on the SQLite file, opened read-only) and its own connection pool
+(see make_async_engine()). Every response carries an ETag built from the data
+versions (hrdb/versions.py) of the tables the report reads, so a client sending
+If-None-Match gets a 304 while nothing changed. The versions are polled at most
+every HR_API_VERSION_POLL seconds (default 1) and the last body of each
+request is kept, so a report that did not change costs no database work.
+The trainer and track reports include archived seasons (hrdb/archive.py).
+
+    pip install "sqlalchemy[asyncio]" aiosqlite starlette uvicorn    # aiomysql for MySQL
+    HR_DB_BACKEND=sqlite python -m hrdb.api --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import text
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from hrdb import archive, facts, paging
+from hrdb import queries as Q
+from hrdb.backend import make_async_engine, make_engine
+from hrdb.bootstrap import bootstrap
+from hrdb.cache import read_tables
+from hrdb.search import SOURCES, match_params, suggest
+
+MAX_PAGE = 500
+MAX_SUGGEST = 25
+BODY_CACHE_SIZE = 256
+
+
+def _owner_params(qp) -> dict:
+    lname = (qp.get("lname") or "").strip()
+    if not lname:
+        raise ValueError("lname is required")
+    params = match_params(lname)
+    if params is None:
+        raise ValueError("lname has no letters or digits")
+    return params
+
+
+def _period_params(qp) -> dict:
+    """:lo / :hi of ?season=2024 or ?from=2024-03-01&to=2024-06-30; {} when neither is given."""
+    if qp.get("season"):
+        if not qp["season"].isdigit():
+            raise ValueError("season must be a year")
+        lo, hi = facts.season_dates(int(qp["season"]))
+    elif qp.get("from") or qp.get("to"):
+        lo, hi = qp.get("from") or Q.ALL_TIME["lo"], qp.get("to") or Q.ALL_TIME["hi"]
+        date.fromisoformat(lo), date.fromisoformat(hi)      # ValueError on anything but YYYY-MM-DD
+    else:
+        return {}
+    return {"lo": lo, "hi": hi}
+
+
+# name -> (query, keyset order or None for unpaged, query-string -> SQL parameters)
+REPORTS = {
+    "horses-by-owner":  (Q.HORSES_BY_OWNER, Q.HORSES_BY_OWNER_ORDER, _owner_params),
+    "trainer-winners":  (Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER,
+                         lambda qp: _period_params(qp) or dict(Q.ALL_TIME)),
+    "trainer-winnings": (Q.TRAINER_WINNINGS, None, _period_params),
+    "track-stats":      (Q.TRACK_STATS, None, _period_params),
+    "horse-ratings":    (Q.HORSE_RATINGS_PAGE, Q.HORSE_RATINGS_ORDER, lambda qp: {}),
+    "trainer-ratings":  (Q.TRAINER_RATINGS_PAGE, Q.TRAINER_RATINGS_ORDER, lambda qp: {}),
+    "stable-ratings":   (Q.STABLE_RATINGS_PAGE, Q.STABLE_RATINGS_ORDER, lambda qp: {}),
+}
+# what the unpaged reports read when asked for a period
+PERIOD_REPORTS = {
+    "trainer-winnings": Q.TRAINER_WINNINGS_BETWEEN,
+    "track-stats":      Q.TRACK_STATS_BETWEEN,
+}
+# reports that add the archived seasons of their period (hrdb/archive.py)
+ARCHIVE_REPORTS = {
+    "trainer-winners":  archive.winners_page,
+    "trainer-winnings": archive.trainer_winnings,
+    "track-stats":      archive.track_stats,
+}
+
+
+# ---------- JSON ----------
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime, dtime)):
+        return v.isoformat()
+    if isinstance(v, timedelta):      # MySQL TIME columns
+        return str(v)
+    raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, default=_json_default, separators=(",", ":")).encode()
+
+
+def encode_cursor(key) -> str | None:
+    return base64.urlsafe_b64encode(_dumps(list(key))).decode().rstrip("=") if key is not None else None
+
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:          # bad base64 / UTF-8 / JSON
+        key = None
+    if not isinstance(key, list):
+        raise ValueError("invalid 'after' cursor")
+    return tuple(key)
+
+
+# ---------- state shared by the requests of one worker ----------
+class ApiState:
+    def __init__(self, engine, poll: float):
+        self.engine = engine
+        self.poll = poll
+        self.tables = {name: sorted(read_tables(Q.pick(sql, engine))
+                                    | read_tables(Q.pick(PERIOD_REPORTS.get(name, ""), engine))
+                                    | ({"archivedseasons"} if name in ARCHIVE_REPORTS else set()))
+                       for name, (sql, _, _) in REPORTS.items()}
+        self.bodies = OrderedDict()            # request key -> (etag, body)
+        self._versions, self._polled = {}, 0.0
+        self._lock = asyncio.Lock()
+
+    async def versions(self) -> dict:
+        """Per-table data versions, re-read at most every `poll` seconds."""
+        if time.monotonic() - self._polled < self.poll:
+            return self._versions
+        async with self._lock:                 # one query however many requests are waiting
+            if time.monotonic() - self._polled >= self.poll:
+                async with self.engine.connect() as cx:
+                    rows = await cx.execute(text("SELECT tableName, version FROM DataVersions"))
+                    self._versions = dict(rows.all())
+                self._polled = time.monotonic()
+        return self._versions
+
+    async def fetch(self, name: str, params: dict, after, size: int) -> dict:
+        sql, order, _ = REPORTS[name]
+        if params.get("lo") and name in PERIOD_REPORTS:
+            sql = PERIOD_REPORTS[name]
+        sql = Q.pick(sql, self.engine)
+        async with self.engine.connect() as cx:
+            if order is None and name in ARCHIVE_REPORTS and await cx.run_sync(
+                    archive.archived, params.get("lo", Q.ALL_TIME["lo"]), params.get("hi", Q.ALL_TIME["hi"])):
+                period = (params["lo"], params["hi"]) if params.get("lo") else None
+                return {"rows": await cx.run_sync(ARCHIVE_REPORTS[name], period)}
+            if "ResultFacts" in sql and order is None:      # just the seasons in range
+                sql = facts.on(sql, await cx.run_sync(facts.source, params["lo"], params["hi"]))
+            if order is None:
+                rows = await cx.execute(text(sql), params)
+                return {"rows": [dict(r) for r in rows.mappings()]}
+            if "ResultFacts" in sql:                        # season by season, newest first, then the archive
+                page = await cx.run_sync(ARCHIVE_REPORTS[name], sql, order, params, after, size)
+                return {"rows": page.rows, "next": encode_cursor(page.next_key)}
+            stmt = paging.keyset_sql(sql, order, after is not None)
+            rows = await cx.execute(text(stmt), paging.page_params(params, after, size))
+            page = paging.split_page(rows.mappings().all(), order, size)
+            return {"rows": page.rows, "next": encode_cursor(page.next_key)}
+
+    def remember(self, key, etag: str, body: bytes):
+        self.bodies[key] = (etag, body)
+        self.bodies.move_to_end(key)
+        while len(self.bodies) > BODY_CACHE_SIZE:
+            self.bodies.popitem(last=False)
+
+
+# ---------- endpoints ----------
+async def list_reports(request):
+    return JSONResponse({"reports": sorted(REPORTS)})
+
+
+async def report(request):
+    name = request.path_params["name"]
+    if name not in REPORTS:
+        return JSONResponse({"error": f"unknown report {name!r}"}, status_code=404)
+    state: ApiState = request.app.state.api
+    qp = request.query_params
+    try:
+        params = REPORTS[name][2](qp)
+        size = min(max(int(qp.get("size", 50)), 1), MAX_PAGE)
+        after = decode_cursor(qp["after"]) if qp.get("after") else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    versions = await state.versions()
+    key = (name, tuple(sorted(qp.items())))
+    tag = hashlib.sha1(repr((key, [versions.get(t, 0) for t in state.tables[name]])).encode()).hexdigest()[:20]
+    etag = f'W/"{tag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    cached = state.bodies.get(key)
+    if cached and cached[0] == etag:
+        return Response(cached[1], media_type="application/json", headers=headers)
+
+    body = _dumps(await state.fetch(name, params, after, size))
+    state.remember(key, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def suggest_names(request):
+    kind = request.path_params["kind"]
+    if kind not in SOURCES:
+        return JSONResponse({"error": f"unknown kind {kind!r}"}, status_code=404)
+    state: ApiState = request.app.state.api
+    q = request.query_params.get("q", "")
+    try:
+        limit = min(max(int(request.query_params.get("limit", 8)), 1), MAX_SUGGEST)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    versions = await state.versions()
+    key = ("suggest", kind, q, limit)
+    tag = hashlib.sha1(repr((key, versions.get("nameindex", 0))).encode()).hexdigest()[:20]
+    etag = f'W/"{tag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    cached = state.bodies.get(key)
+    if cached and cached[0] == etag:
+        return Response(cached[1], media_type="application/json", headers=headers)
+
+    async with state.engine.connect() as cx:
+        names = await cx.run_sync(suggest, kind, q, limit)
+    body = _dumps({"names": names})
+    state.remember(key, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def health(request):
+    return JSONResponse({"ok": True, "versions": await request.app.state.api.versions()})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if os.environ.get("HR_DB_READONLY", "") != "1":
+        # DataVersions etc. must exist; the API's own engine is read-only
+        await asyncio.to_thread(bootstrap, make_engine())
+    engine = make_async_engine()
+    app.state.api = ApiState(engine, float(os.environ.get("HR_API_VERSION_POLL", 1.0)))
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=[
+    Route("/reports", list_reports),
+    Route("/reports/{name}", report),
+    Route("/suggest/{kind}", suggest_names),
+    Route("/health", health),
+], lifespan=lifespan)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=1, help="worker processes (each with its own pool)")
+    args = ap.parse_args()
+
+    import uvicorn
+    uvicorn.run("hrdb.api:app", host=args.host, port=args.port, workers=args.workers,
+                access_log=False, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,592 @@
+"""Hot/cold tiering: old seasons move out of the database into compressed files.
+
+Race history only grows, while the pages mostly look at recent seasons. Every
+season older than the horizon (the last HR_ARCHIVE_KEEP_SEASONS seasons, default
+10) is archived, oldest first, one transaction per season. Its Race, RaceResults
+and ResultFacts rows, and the old_info rows of horses deleted that year, go to
+one zstd-compressed Parquet file per table:
+
+    HR_ARCHIVE_DIR/<database>/<season>/     (default archive/)
+        Race.parquet  RaceResults.parquet  ResultFacts.parquet  old_info.parquet  manifest.json
+
+The manifest records each file's sha256 and the row count and digest of its
+contents. The files are read back and checked against the digests before
+anything is deleted. The ArchivedSeasons table is the catalog: one row per
+season with the directory and the sha256 of its manifest.
+
+The summaries and TrainerWinnings only cover the seasons stored in the database
+(hrdb/summaries.py, hrdb/facts.py). The Winning Trainers, Trainer Winnings and
+Track Stats reports, and the analytics copy, add the archived seasons when the
+catalog has any in the requested period. Those reads take only the columns they
+need, and their per-season results are cached by file checksum (the files never
+change). A report on hot seasons doesn't look at the archive at all. Archived
+seasons are history as it was archived: deleting a horse later doesn't take its
+archived results out. Horse and stable ratings are left as they are; they
+already count the archived races.
+
+Archiving and restoring a season appends a season_archived / season_restored
+event to the outbox (hrdb/outbox.py). Archived seasons are read-only: a race
+dated in one of them is refused (Add Race, bulk import). Restoring brings back the newest archived seasons down to a
+given one, so that archived seasons are always older than the stored ones.
+Results of horses deleted since are left out.
+
+    python -m hrdb.archive run --keep 10         # or --before 2015; --compact to reclaim the space
+    python -m hrdb.archive list
+    python -m hrdb.archive verify                # checksums of every archived season, exit 1 on mismatch
+    python -m hrdb.archive restore 2012          # seasons 2012 and later back into the database
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from hrdb import facts, outbox, summaries
+from hrdb import queries as Q
+from hrdb.backend import ROOT, has_table, is_sqlite, make_engine, write_transaction
+from hrdb.snapshot import BATCH, columns, file_sha256, read_table
+
+ARCHIVE_DIR = Path(os.environ.get("HR_ARCHIVE_DIR") or ROOT / "archive")
+KEEP_SEASONS = int(os.environ.get("HR_ARCHIVE_KEEP_SEASONS", 10))
+RACE_CHUNK = 500  # races per summaries.record_races() call on restore (keeps IN lists short)
+
+ARCHIVED_SEASONS_DDL = """
+    CREATE TABLE IF NOT EXISTS ArchivedSeasons (
+      season     INT NOT NULL,
+      path       VARCHAR(255) NOT NULL,
+      races      INT NOT NULL DEFAULT 0,
+      results    INT NOT NULL DEFAULT 0,
+      sha256     CHAR(64) NOT NULL,
+      archivedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (season)
+    )
+"""
+# archived seasons between :first and :last, newest first
+ARCHIVED = """
+    SELECT season, path, sha256 FROM ArchivedSeasons
+    WHERE season BETWEEN :first AND :last
+    ORDER BY season DESC
+"""
+LAST_ARCHIVED = "SELECT MAX(season) FROM ArchivedSeasons"
+
+# the rows of one season per table (:lo / :hi its first and last day, :next the day after)
+SEASON_ROWS = {
+    "Race":        "raceDate BETWEEN :lo AND :hi",
+    "RaceResults": "raceId IN (SELECT raceId FROM Race WHERE raceDate BETWEEN :lo AND :hi)",
+    "ResultFacts": "raceDate BETWEEN :lo AND :hi",
+    "old_info":    "deleted_at >= :lo AND deleted_at < :next",
+}
+
+
+@dataclass
+class ArchiveReport:
+    seasons: list = field(default_factory=list)
+    rows: dict = field(default_factory=dict)     # table -> rows
+    bytes: int = 0
+    skipped: int = 0                             # restore: results of horses deleted since
+    seconds: float = 0.0
+
+    def add(self, season: int, rows: dict):
+        self.seasons.append(season)
+        for table, n in rows.items():
+            self.rows[table] = self.rows.get(table, 0) + n
+
+    def summary(self) -> str:
+        seasons = ", ".join(map(str, sorted(self.seasons))) or "none"
+        skipped = f", {self.skipped:,} results of deleted horses left out" if self.skipped else ""
+        return (f"seasons {seasons}: {sum(self.rows.values()):,} rows, {self.bytes / 1e6:.1f} MB"
+                f"{skipped}, {self.seconds:.2f}s")
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("The archive needs pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _dates(season: int) -> dict:
+    lo, hi = facts.season_dates(season)
+    return {"lo": lo, "hi": hi, "next": f"{season + 1:04d}-01-01"}
+
+
+def _digest(batches) -> tuple[int, str]:
+    """(rows, sha256) of row tuples, row by row (the same however they are batched)."""
+    h, n = hashlib.sha256(), 0
+    for batch in batches:
+        for row in batch:
+            h.update(repr(row).encode())
+        n += len(batch)
+    return n, h.hexdigest()
+
+
+def _file_rows(file: Path):
+    """Batches of row tuples of a Parquet file."""
+    _, pq = _arrow()
+    for batch in pq.ParquetFile(file).iter_batches(batch_size=BATCH):
+        yield list(zip(*(col.to_pylist() for col in batch.columns)))
+
+
+def default_dir(engine) -> Path:
+    """ARCHIVE_DIR/<database name>."""
+    return ARCHIVE_DIR / Path(engine.url.database or "db").stem
+
+
+# ---------- catalog ----------
+def archived(cx, lo: str = Q.ALL_TIME["lo"], hi: str = Q.ALL_TIME["hi"]) -> list[dict]:
+    """The catalog rows of the archived seasons between lo and hi (ISO dates), newest first."""
+    if not has_table(cx, "ArchivedSeasons"):
+        return []
+    rows = cx.execute(text(ARCHIVED), {"first": int(str(lo)[:4]), "last": int(str(hi)[:4])})
+    return [dict(r) for r in rows.mappings()]
+
+
+def closed_through(cx) -> str | None:
+    """Last day of the newest archived season (races up to it can't be added), or None."""
+    if not has_table(cx, "ArchivedSeasons"):
+        return None
+    season = cx.execute(text(LAST_ARCHIVED)).scalar()
+    return facts.season_dates(season)[1] if season is not None else None
+
+
+def check_open(cx, race_date):
+    """ValueError if `race_date` falls in an archived season."""
+    last = closed_through(cx)
+    if last is not None and race_date and str(race_date)[:10] <= last:
+        raise ValueError(f"Seasons up to {last[:4]} are archived; races dated {last} or earlier can't be added.")
+
+
+def read_manifest(path) -> dict:
+    return json.loads((Path(path) / "manifest.json").read_text())
+
+
+def _check_files(path: Path, manifest: dict, sha256: str | None = None) -> list[str]:
+    """What is wrong with an archived season's files (empty when they match their checksums)."""
+    problems = []
+    if sha256 is not None and file_sha256(path / "manifest.json") != sha256:
+        problems.append("manifest.json does not match its checksum in ArchivedSeasons")
+    for table, m in manifest["tables"].items():
+        file = path / m["file"]
+        if not file.exists():
+            problems.append(f"{m['file']} is missing")
+        elif file_sha256(file) != m["sha256"]:
+            problems.append(f"{m['file']} does not match its checksum in manifest.json")
+        elif _digest(_file_rows(file)) != (m["rows"], m["digest"]):
+            problems.append(f"{m['file']} does not hold the rows that were archived")
+    return problems
+
+
+# ---------- archive ----------
+def _season_tables(cx, season: int) -> dict:
+    """table -> where to read the season's rows of it from."""
+    names = facts.tables(cx, *facts.season_dates(season))
+    return {"Race": "Race", "RaceResults": "RaceResults",
+            "ResultFacts": names[0] if names else "ResultFacts", "old_info": "old_info"}
+
+
+def _write_season(cx, season: int, path: Path) -> dict:
+    """Write a season's rows to `path`; returns the manifest."""
+    pa, pq = _arrow()
+    arrow_types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+    manifest = {"season": season, "created": datetime.now().isoformat(timespec="seconds"),
+                "backend": cx.dialect.name, "tables": {}}
+    for table, source in _season_tables(cx, season).items():
+        cols = columns(cx, source)
+        schema = pa.schema([(c, arrow_types[k]) for c, k in cols])
+        file = path / f"{table}.parquet"
+        h, n = hashlib.sha256(), 0
+        with pq.ParquetWriter(file, schema, compression="zstd") as writer:
+            for batch in read_table(cx, source, cols, SEASON_ROWS[table], _dates(season)):
+                for row in batch:
+                    h.update(repr(row).encode())
+                n += len(batch)
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(v, type=schema.field(i).type) for i, v in enumerate(zip(*batch))], schema=schema))
+        manifest["tables"][table] = {"rows": n, "digest": h.hexdigest(),
+                                     "file": file.name, "sha256": file_sha256(file)}
+    (path / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def archive_season(engine, season: int, root=None) -> tuple[dict, int]:
+    """Move one season to the archive; returns ({table: rows}, bytes written)."""
+    path = Path(root or default_dir(engine)).resolve() / str(season)
+    written = False
+    try:
+        with write_transaction(engine) as cx:
+            last = closed_through(cx)
+            if last is not None and season <= int(last[:4]):
+                raise ValueError(f"season {season} is not newer than the archived seasons (up to {last[:4]})")
+            path.mkdir(parents=True, exist_ok=True)
+            written = True
+            manifest = _write_season(cx, season, path)
+            problems = _check_files(path, manifest)
+            if problems:
+                raise ValueError(f"season {season}: " + "; ".join(problems))
+            dates = _dates(season)
+            summaries.remove_season(cx, dates["lo"], dates["hi"])
+            facts.drop_season(cx, season)
+            for table in ("RaceResults", "Race", "old_info"):
+                cx.execute(text(f"DELETE FROM {table} WHERE {SEASON_ROWS[table]}"), dates)
+            rows = {t: m["rows"] for t, m in manifest["tables"].items()}
+            cx.execute(text("""
+                INSERT INTO ArchivedSeasons (season, path, races, results, sha256)
+                VALUES (:s, :p, :races, :results, :sha)
+            """), {"s": season, "p": str(path), "races": rows["Race"], "results": rows["RaceResults"],
+                   "sha": file_sha256(path / "manifest.json")})
+            outbox.append(cx, "season_archived", [(season, {"season": season, "races": rows["Race"],
+                                                            "results": rows["RaceResults"]})])
+    except BaseException:
+        if written:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    return rows, sum(f.stat().st_size for f in path.iterdir())
+
+
+def seasons_to_archive(cx, before: int) -> list[int]:
+    """Seasons with races older than `before`, oldest first."""
+    return [s for s in facts.race_seasons(cx) if s < before]
+
+
+def run(engine, keep: int | None = None, before: int | None = None, root=None) -> ArchiveReport:
+    """Archive every season before `before`, or all but the last `keep` ones (KEEP_SEASONS)."""
+    t0 = time.perf_counter()
+    if before is None:
+        before = date.today().year - (KEEP_SEASONS if keep is None else keep) + 1
+    with engine.connect() as cx:
+        todo = seasons_to_archive(cx, before)
+    report = ArchiveReport()
+    for season in todo:
+        rows, size = archive_season(engine, season, root)
+        report.add(season, rows)
+        report.bytes += size
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def compact(engine):
+    """Give the space of the archived rows back (SQLite VACUUM, MySQL OPTIMIZE TABLE)."""
+    with engine.connect() as cx:
+        if is_sqlite(cx):
+            cx.exec_driver_sql("VACUUM")
+        else:
+            cx.exec_driver_sql("OPTIMIZE TABLE Race, RaceResults, ResultFacts, old_info").all()
+
+
+# ---------- restore ----------
+def _insert(cx, table: str, names: list[str], rows: list[tuple]):
+    mark = "?" if is_sqlite(cx) else "%s"
+    for i in range(0, len(rows), BATCH):
+        cx.exec_driver_sql(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join([mark] * len(names))})",
+                           rows[i:i + BATCH])
+
+
+def _existing_horses(cx, horse_ids) -> set:
+    horse_ids, found = sorted(set(horse_ids)), set()
+    for i in range(0, len(horse_ids), RACE_CHUNK):
+        found.update(cx.execute(text("SELECT horseId FROM Horse WHERE horseId IN :ids")
+                                .bindparams(bindparam("ids", expanding=True)),
+                                {"ids": horse_ids[i:i + RACE_CHUNK]}).scalars())
+    return found
+
+
+def restore_season(engine, entry: dict) -> tuple[dict, int]:
+    """Bring one archived season back into the database; returns ({table: rows}, results left out)."""
+    _, pq = _arrow()
+    season, path = entry["season"], Path(entry["path"])
+    manifest = read_manifest(path)
+    problems = _check_files(path, manifest, entry["sha256"])
+    if problems:
+        raise ValueError(f"season {season}: " + "; ".join(problems))
+    names = {t: pq.ParquetFile(path / m["file"]).schema_arrow.names for t, m in manifest["tables"].items()}
+    data = {t: [row for batch in _file_rows(path / m["file"]) for row in batch]
+            for t, m in manifest["tables"].items()}
+
+    with write_transaction(engine) as cx:
+        if cx.execute(text(LAST_ARCHIVED)).scalar() != season:
+            raise ValueError(f"season {season} is not the newest archived season; restore the newer ones first")
+        # results of horses deleted since the season was archived stay out, as deletion would have left them
+        horse = {t: names[t].index("horseId") for t in ("RaceResults", "ResultFacts")}
+        known = _existing_horses(cx, [row[horse["RaceResults"]] for row in data["RaceResults"]])
+        skipped = sum(row[horse["RaceResults"]] not in known for row in data["RaceResults"])
+        for t in horse:
+            data[t] = [row for row in data[t] if row[horse[t]] in known]
+
+        for table in ("old_info", "Race", "RaceResults"):
+            if data[table]:
+                _insert(cx, table, names[table], data[table])
+        race_ids = [row[names["Race"].index("raceId")] for row in data["Race"]]
+        for i in range(0, len(race_ids), RACE_CHUNK):
+            summaries.record_races(cx, race_ids[i:i + RACE_CHUNK])
+        facts.load_season(cx, season, names["ResultFacts"], data["ResultFacts"])
+
+        # what is in the database now is what the files hold (less the deleted horses)
+        for table, source in _season_tables(cx, season).items():
+            cols = columns(cx, source)
+            stored = _digest(read_table(cx, source, cols, SEASON_ROWS[table], _dates(season)))
+            if stored != _digest([data[table]]):
+                raise ValueError(f"season {season}: {table} rows differ from the archive after the restore")
+        cx.execute(text("DELETE FROM ArchivedSeasons WHERE season = :s"), {"s": season})
+        outbox.append(cx, "season_restored", [(season, {"season": season, "races": len(data["Race"]),
+                                                        "results": len(data["RaceResults"])})])
+    shutil.rmtree(path, ignore_errors=True)
+    return {t: len(rows) for t, rows in data.items()}, skipped
+
+
+def restore(engine, down_to: int) -> ArchiveReport:
+    """Restore the archived seasons from the newest down to `down_to`."""
+    t0 = time.perf_counter()
+    with engine.connect() as cx:
+        entries = archived(cx, facts.season_dates(down_to)[0])
+    report = ArchiveReport()
+    for entry in entries:
+        report.bytes += sum(f.stat().st_size for f in Path(entry["path"]).iterdir())
+        rows, skipped = restore_season(engine, entry)
+        report.add(entry["season"], rows)
+        report.skipped += skipped
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def verify(engine) -> list[tuple[int, list[str]]]:
+    """(season, problems) of every archived season, newest first; no problems when its files check out."""
+    with engine.connect() as cx:
+        entries = archived(cx)
+    out = []
+    for entry in entries:
+        path = Path(entry["path"])
+        if not (path / "manifest.json").exists():
+            out.append((entry["season"], [f"{path} has no manifest.json"]))
+            continue
+        out.append((entry["season"], _check_files(path, read_manifest(path), entry["sha256"])))
+    return out
+
+
+# ---------- cold reads ----------
+def _read(path: str, table: str, cols: list[str], filters=None) -> pd.DataFrame:
+    _, pq = _arrow()
+    return pq.read_table(Path(path) / f"{table}.parquet", columns=cols, filters=filters).to_pandas()
+
+
+# Per-season results, cached by the manifest checksum (the files of a season never change).
+@lru_cache(maxsize=256)
+def _winners(path: str, sha256: str) -> pd.DataFrame:
+    """Winning results with a trainer, in Winning Trainers order."""
+    wins = _read(path, "ResultFacts", ["raceDate", "trainerId", "raceId", "horseId", "trackName"],
+                 [("position", "=", 1), ("trainerId", "!=", "")])
+    races = _read(path, "Race", ["raceId", "raceName"])
+    wins = wins.merge(races, on="raceId", how="left")
+    return wins.sort_values(["raceDate", "trainerId", "raceId", "horseId"],
+                            ascending=[False, True, True, True], ignore_index=True)
+
+
+@lru_cache(maxsize=256)
+def _trainer_days(path: str, sha256: str) -> pd.DataFrame:
+    """Prize per race day and trainer."""
+    f = _read(path, "ResultFacts", ["raceDate", "trainerId", "prize"], [("trainerId", "!=", "")])
+    return f.groupby(["raceDate", "trainerId"], as_index=False)["prize"].sum()
+
+
+@lru_cache(maxsize=256)
+def _track_days(path: str, sha256: str) -> pd.DataFrame:
+    """Races and participations per race day and track."""
+    races = _read(path, "Race", ["raceId", "raceDate", "trackName"])
+    counts = _read(path, "RaceResults", ["raceId"]).groupby("raceId").size().rename("horses")
+    races = races.join(counts, on="raceId")
+    races["horses"] = races["horses"].fillna(0).astype(int)
+    return races.groupby(["raceDate", "trackName"], as_index=False).agg(races=("raceId", "size"),
+                                                                        horses=("horses", "sum"))
+
+
+@lru_cache(maxsize=256)
+def _season_sums(days, path: str, sha256: str, by: str) -> pd.DataFrame:
+    return days(path, sha256).drop(columns="raceDate").groupby(by).sum()
+
+
+def _sums(days, by: str, entry: dict, lo, hi) -> pd.DataFrame:
+    """Sums per `by` of a season's per-day frame (`days`), over its days between lo and hi."""
+    first, last = facts.season_dates(entry["season"])
+    if str(lo) <= first and last <= str(hi):        # the whole season: summed once
+        return _season_sums(days, entry["path"], entry["sha256"], by)
+    return _between(days(entry["path"], entry["sha256"]), lo, hi).drop(columns="raceDate").groupby(by).sum()
+
+
+def _between(df: pd.DataFrame, lo, hi) -> pd.DataFrame:
+    return df[(df["raceDate"] >= str(lo)) & (df["raceDate"] <= str(hi))]
+
+
+def _after(df: pd.DataFrame, after) -> pd.DataFrame:
+    """The rows past a Winning Trainers key (raceDate DESC, trainerId, raceId, horseId)."""
+    d, t, r, h = (str(k) for k in after)
+    day, tid, rid, hid = df["raceDate"], df["trainerId"], df["raceId"], df["horseId"]
+    return df[(day < d) | ((day == d) & ((tid > t) | ((tid == t) & ((rid > r) | ((rid == r) & (hid > h))))))]
+
+
+def _names(cx, sql: str, ids) -> dict:
+    if not ids:
+        return {}
+    return dict(cx.execute(text(sql).bindparams(bindparam("ids", expanding=True)), {"ids": sorted(ids)}).all())
+
+
+def _cold_winners(cx, entries, lo, hi, after, limit) -> list[dict]:
+    """Rows of Q.TRAINER_WINNERS_PAGE (with their key columns) from the archived seasons."""
+    picked = []
+    for entry in entries:
+        wins = _between(_winners(entry["path"], entry["sha256"]), lo, hi)
+        if after is not None:
+            wins = _after(wins, after)
+        picked.append(wins.head(limit - sum(len(p) for p in picked)))
+        if sum(len(p) for p in picked) >= limit:
+            break
+    wins = pd.concat(picked) if picked else pd.DataFrame()
+    if wins.empty:
+        return []
+    trainers = {tid: (fn, ln) for tid, fn, ln in cx.execute(
+        text("SELECT trainerId, fname, lname FROM Trainer WHERE trainerId IN :ids")
+        .bindparams(bindparam("ids", expanding=True)), {"ids": sorted(set(wins["trainerId"]))})}
+    horse_ids = set(wins["horseId"])
+    horses = _names(cx, "SELECT horseId, horseName FROM Horse WHERE horseId IN :ids", horse_ids)
+    horses = {**_names(cx, "SELECT horseId, MAX(horseName) FROM old_info WHERE horseId IN :ids GROUP BY horseId",
+                       horse_ids - set(horses)), **horses}
+    day = (lambda d: d) if is_sqlite(cx) else date.fromisoformat
+    rows = []
+    for d, tid, rid, hid, track, race in wins[["raceDate", "trainerId", "raceId", "horseId", "trackName",
+                                                "raceName"]].itertuples(index=False):
+        if tid not in trainers:         # the stored seasons only list trainers that still exist
+            continue
+        rows.append({"Trainer First": trainers[tid][0], "Trainer Last": trainers[tid][1],
+                     "Winning Horse": horses.get(hid, hid), "Race Name": None if pd.isna(race) else race,
+                     "Race Date": day(d), "Track": track,
+                     "_k0": day(d), "_k1": tid, "_k2": rid, "_k3": hid})
+    return rows
+
+
+def winners_page(cx, sql, order, params, after=None, size=50):
+    """facts.page() followed by the archived seasons in the period, when there are any
+    (a drop-in fetch for the Winning Trainers pages)."""
+    entries = archived(cx, params["lo"], params["hi"])
+    if not entries:
+        return facts.page(cx, sql, order, params, after, size)
+    return facts.page(cx, sql, order, params, after, size,
+                      cold=lambda lo, hi, key, limit: _cold_winners(cx, entries, lo, hi, key, limit))
+
+
+def trainer_winnings(cx, period: tuple[str, str] | None = None) -> list[dict]:
+    """Trainer Winnings with the archived seasons of the (first, last) period (all time when None)."""
+    lo, hi = period or (Q.ALL_TIME["lo"], Q.ALL_TIME["hi"])
+    if period is None:
+        hot = cx.execute(text(Q.pick(Q.TRAINER_TOTALS, cx)))
+    else:
+        sql = facts.on(Q.pick(Q.TRAINER_TOTALS_BETWEEN, cx), facts.source(cx, lo, hi))
+        hot = cx.execute(text(sql), {"lo": lo, "hi": hi})
+    rows = [dict(r) for r in hot.mappings()]
+    cold = [_sums(_trainer_days, "trainerId", e, lo, hi) for e in archived(cx, lo, hi)]
+    if cold:
+        extra = pd.concat(cold).groupby(level=0)["prize"].sum().to_dict()
+        for r in rows:
+            r["Total Winnings"] = float(r["Total Winnings"] or 0) + float(extra.get(r["trainerId"], 0))
+        rows.sort(key=lambda r: r["Total Winnings"], reverse=True)
+    return [{k: v for k, v in r.items() if k != "trainerId"} for r in rows]
+
+
+def track_stats(cx, period: tuple[str, str] | None = None) -> list[dict]:
+    """Track Stats with the archived seasons of the (first, last) period (all time when None)."""
+    lo, hi = period or (Q.ALL_TIME["lo"], Q.ALL_TIME["hi"])
+    if period is None:
+        hot = cx.execute(text(Q.TRACK_STATS))
+    else:
+        hot = cx.execute(text(Q.TRACK_STATS_BETWEEN), {"lo": lo, "hi": hi})
+    totals = {r["Track"]: [int(r["Number of Races"]), int(r["Total Horses Participating"] or 0)]
+              for r in hot.mappings()}
+    cold = [_sums(_track_days, "trackName", e, lo, hi) for e in archived(cx, lo, hi)]
+    if cold:
+        per_track = pd.concat(cold).groupby(level=0)[["races", "horses"]].sum()
+        for track, races, horses in per_track.itertuples():
+            t = totals.setdefault(track, [0, 0])
+            t[0], t[1] = t[0] + int(races), t[1] + int(horses)
+    ordered = sorted(((t, r, h) for t, (r, h) in totals.items() if r > 0), key=lambda x: (-x[1], x[0]))
+    return [{"Track": t, "Number of Races": r, "Total Horses Participating": h} for t, r, h in ordered]
+
+
+def result_rows(cx):
+    """The archived results as rows of analytics.EXPORT_RESULTS, a season at a time. Horse
+    columns come from Horse, or old_info for horses deleted since (None when neither knows it)."""
+    entries = archived(cx)
+    if not entries:
+        return
+    horses = {hid: (age, g) for hid, age, g in cx.execute(text("SELECT horseId, age, gender FROM old_info"))}
+    horses.update({hid: (age, g) for hid, age, g in cx.execute(text("SELECT horseId, age, gender FROM Horse"))})
+    unknown = (None, None)
+    for entry in entries:
+        races = _read(entry["path"], "Race", ["raceId", "raceDate", "trackName"])
+        results = _read(entry["path"], "RaceResults", ["raceId", "horseId", "results", "prize"])
+        joined = results.merge(races, on="raceId").astype(object)
+        joined = joined.where(joined.notna(), None)
+        yield [(rid, day, track, *horses.get(hid, unknown), res, prize) for rid, hid, res, prize, day, track
+               in joined[["raceId", "horseId", "results", "prize", "raceDate", "trackName"]].itertuples(index=False)]
+
+
+def credit_frames(cx):
+    """analytics.EXPORT_CREDITS of the archived seasons, a season at a time."""
+    for entry in archived(cx):
+        f = _read(entry["path"], "ResultFacts", ["trainerId", "raceDate", "position", "prize"],
+                  [("trainerId", "!=", "")])
+        f["season"] = pd.to_datetime(f["raceDate"]).dt.year
+        f["wins"] = f["position"] == 1
+        yield (f.groupby(["trainerId", "season"], as_index=False)
+                .agg(starts=("raceDate", "size"), wins=("wins", "sum"), prize=("prize", "sum")))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("action", choices=["run", "restore", "verify", "list"])
+    ap.add_argument("season", nargs="?", type=int, help="restore: the oldest season to bring back")
+    ap.add_argument("--keep", type=int, help=f"seasons to keep in the database (default {KEEP_SEASONS})")
+    ap.add_argument("--before", type=int, help="archive the seasons before this one instead")
+    ap.add_argument("--dir", help="where to write the seasons (default: ARCHIVE_DIR/<database>)")
+    ap.add_argument("--compact", action="store_true", help="reclaim the freed space after archiving")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    from hrdb.bootstrap import bootstrap
+    bootstrap(engine)
+    if args.action == "list":
+        with engine.connect() as cx:
+            rows = cx.execute(text("SELECT season, races, results, archivedAt, path FROM ArchivedSeasons "
+                                   "ORDER BY season")).all()
+        for season, races, results, at, path in rows:
+            print(f"{season}  {races:>8,} races {results:>10,} results  {at}  {path}")
+        return
+    if args.action == "run":
+        report = run(engine, args.keep, args.before, args.dir)
+        if args.compact and report.seasons:
+            compact(engine)
+        print("archived", report.summary())
+        return
+    if args.action == "restore":
+        if args.season is None:
+            ap.error("restore needs the oldest season to bring back")
+        print("restored", restore(engine, args.season).summary())
+        return
+    bad = False
+    for season, problems in verify(engine):
+        bad |= bool(problems)
+        print(f"  {season}  {'; '.join(problems) or 'ok'}")
+    print("checksum mismatch" if bad else "all archived seasons check out")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
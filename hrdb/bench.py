@@ -0,0 +1,220 @@
+"""Headless benchmarks of every guest page query and admin write path.
+
+Each case runs `--runs` times (after a warm-up) and records p50/p99/mean
+latency, plus the peak Python memory of one extra run (tracemalloc; a DataFrame
+is built from read results, as q() does). Reads bypass the query cache, so a
+page's cold cost is measured. Writes run in a transaction that is rolled back,
+so the dataset is the same for every run and every commit.
+
+    python -m hrdb.bench --generate --results 1000000 --sqlite /tmp/bench.sqlite --out bench.json
+    python -m hrdb.bench --compare base.json bench.json      # exit 1 on a regression
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timezone
+
+import pandas as pd
+from sqlalchemy import text
+
+from hrdb import facts, ids, paging, writes
+from hrdb import queries as Q
+from hrdb.backend import ROOT, has_table, make_engine
+from hrdb.bootstrap import ensure_schema
+from hrdb.datagen import generate
+from hrdb.deletion import delete_owners
+from hrdb.search import match_params
+
+TABLES = ["Stable", "Horse", "Owner", "Owns", "Trainer", "Track", "Race", "RaceResults"]
+# the season of the *_season cases (a full one in the synthetic data)
+SEASON = dict(zip(("lo", "hi"), facts.season_dates(2024)))
+
+
+# ---------- cases: setup(engine, rnd) -> args (untimed), run(cx, *args) (timed) ----------
+def _frame(rows):
+    return pd.DataFrame([dict(r) for r in rows])
+
+
+def _read(sql, params=None):
+    return lambda cx: _frame(cx.execute(text(Q.pick(sql, cx)), params or {}).mappings().all())
+
+
+def _facts_read(sql, params):
+    """_read() of a query on ResultFacts, on the seasons between params' :lo and :hi."""
+    return lambda cx: _frame(cx.execute(text(facts.on(Q.pick(sql, cx), facts.source(cx, params["lo"], params["hi"]))),
+                                        params).mappings().all())
+
+
+def _page(sql, order, params=None, after=None, fetch=paging.fetch_page):
+    return lambda cx: pd.DataFrame(fetch(cx, sql, order, params, after, 50).rows)
+
+
+def _pick(engine, sql, rnd, k=None):
+    """Random value(s) of the first column of `sql`."""
+    with engine.connect() as cx:
+        values = cx.execute(text(sql)).scalars().all()
+    return rnd.sample(values, k) if k else rnd.choice(values)
+
+
+def _add_race_args(engine, rnd):
+    horses = _pick(engine, "SELECT horseId FROM Horse LIMIT 5000", rnd, k=8)
+    entries = [(h, res, 1000.0 * (8 - i)) for i, (h, res) in
+               enumerate(zip(horses, ["first", "second", "third", "fourth"] + ["last"] * 4))]
+    return (_pick(engine, Q.TRACK_NAMES, rnd), entries)
+
+
+def _add_race(cx, track, entries):
+    rid = ids.new_ids(cx.engine, "race")[0]   # own short transaction, as on the Add Race page
+    writes.add_race(cx, rid, "Bench Stakes", track, date.today().isoformat(), "18:00:00", entries)
+
+
+def _approve_args(engine, rnd):
+    """A pending application (approvals are rolled back, so one is reused)."""
+    with engine.begin() as cx:
+        app_id = cx.execute(text("SELECT MIN(appId) FROM TrainerApplications WHERE status = 'pending'")).scalar()
+        if app_id is None:
+            cx.execute(text("INSERT INTO TrainerApplications (fname, lname, stableId) "
+                            "SELECT 'Bench', 'Mark', MIN(stableId) FROM Stable"))
+            app_id = cx.execute(text("SELECT MAX(appId) FROM TrainerApplications")).scalar()
+    return (app_id,)
+
+
+def _move_args(engine, rnd):
+    return (_pick(engine, "SELECT horseId FROM Horse LIMIT 5000", rnd),
+            _pick(engine, "SELECT stableId FROM Stable LIMIT 1000", rnd))
+
+
+CASES = {
+    # guest pages
+    "g_horses_by_owner":      (None, _page(Q.HORSES_BY_OWNER, Q.HORSES_BY_OWNER_ORDER, match_params("Hamid"))),
+    "g_trainer_winners":      (None, _page(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, Q.ALL_TIME,
+                                           fetch=facts.page)),
+    "g_trainer_winners_deep": (None, _page(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, Q.ALL_TIME,
+                                           after=("2012-06-01", "", "", ""), fetch=facts.page)),
+    "g_trainer_winners_season": (None, _page(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, SEASON,
+                                             fetch=facts.page)),
+    "g_trainer_winnings":     (None, _read(Q.TRAINER_WINNINGS)),
+    "g_trainer_winnings_season": (None, _facts_read(Q.TRAINER_WINNINGS_BETWEEN, SEASON)),
+    "g_track_stats":          (None, _read(Q.TRACK_STATS)),
+    "g_track_stats_season":   (None, _read(Q.TRACK_STATS_BETWEEN, SEASON)),
+    "g_horse_ratings":        (None, _page(Q.HORSE_RATINGS_PAGE, Q.HORSE_RATINGS_ORDER)),
+    "g_trainer_ratings":      (None, _page(Q.TRAINER_RATINGS_PAGE, Q.TRAINER_RATINGS_ORDER)),
+    # admin writes (rolled back)
+    "add_race":               (_add_race_args, _add_race),
+    "delete_owner":           (lambda engine, rnd: (_pick(engine, "SELECT ownerId FROM Owns LIMIT 5000", rnd),),
+                               lambda cx, oid: delete_owners(cx, [oid])),
+    "move_horse":             (_move_args, writes.move_horse),
+    "approve_trainer":        (_approve_args,
+                               lambda cx, app_id: writes.approve_trainer(cx, app_id, "trainer_bench")),
+}
+
+
+# ---------- runner ----------
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def _once(engine, setup, run, rnd, trace=False) -> float:
+    """One run of a case (in a rolled-back transaction); returns seconds."""
+    args = setup(engine, rnd) if setup else ()
+    with engine.connect() as cx:
+        tx = cx.begin()
+        try:
+            if trace:
+                tracemalloc.reset_peak()
+            t0 = time.perf_counter()
+            run(cx, *args)
+            return time.perf_counter() - t0
+        finally:
+            tx.rollback()
+
+
+def bench(engine, runs=30, warmup=3, cases=None, seed=1, log=print) -> dict:
+    results = {}
+    for name, (setup, run) in CASES.items():
+        if cases and name not in cases:
+            continue
+        rnd = random.Random(seed)
+        for _ in range(warmup):
+            _once(engine, setup, run, rnd)
+        times = [_once(engine, setup, run, rnd) for _ in range(runs)]
+        tracemalloc.start()
+        _once(engine, setup, run, rnd, trace=True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            "runs": runs,
+            "p50_ms": round(_percentile(times, 0.50) * 1000, 3),
+            "p99_ms": round(_percentile(times, 0.99) * 1000, 3),
+            "mean_ms": round(sum(times) / len(times) * 1000, 3),
+            "peak_kib": round(peak / 1024, 1),
+        }
+        log(f"  {name:<24} p50 {results[name]['p50_ms']:>9.2f} ms   p99 {results[name]['p99_ms']:>9.2f} ms"
+            f"   peak {results[name]['peak_kib']:>9.1f} KiB")
+    return results
+
+
+def metadata(engine) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    with engine.connect() as cx:
+        rows = {t: cx.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar() for t in TABLES if has_table(cx, t)}
+    return {"commit": commit, "backend": engine.dialect.name, "rows": rows,
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": sys.version.split()[0]}
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    """Print both reports side by side; returns the cases whose p50 got worse by more than `threshold`."""
+    worse = []
+    print(f"{'case':<24} {'p50 base':>10} {'p50 new':>10} {'change':>8}   {'p99 base':>10} {'p99 new':>10}")
+    for name, b in base["results"].items():
+        n = new["results"].get(name)
+        if not n:
+            continue
+        change = (n["p50_ms"] - b["p50_ms"]) / b["p50_ms"] if b["p50_ms"] else 0.0
+        flag = "  <-- slower" if change > threshold else ""
+        if flag:
+            worse.append(name)
+        print(f"{name:<24} {b['p50_ms']:>10.2f} {n['p50_ms']:>10.2f} {change:>+8.0%}   "
+              f"{b['p99_ms']:>10.2f} {n['p99_ms']:>10.2f}{flag}")
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", help="benchmark this SQLite file instead of the configured backend")
+    ap.add_argument("--generate", action="store_true", help="(re)generate the dataset first (hrdb.datagen)")
+    ap.add_argument("--results", type=int, default=1_000_000, help="dataset size with --generate")
+    ap.add_argument("--runs", type=int, default=30)
+    ap.add_argument("--case", action="append", help="only these cases (repeatable)")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two JSON reports")
+    ap.add_argument("--threshold", type=float, default=0.20, help="p50 slowdown that counts as a regression")
+    args = ap.parse_args()
+
+    if args.compare:
+        base, new = (json.loads(open(p, encoding="utf-8").read()) for p in args.compare)
+        sys.exit(1 if compare(base, new, args.threshold) else 0)
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    if args.generate:
+        generate(engine, args.results)
+    ensure_schema(engine)   # tables the pages expect besides db.sql's
+    report = {"meta": metadata(engine)}
+    report["results"] = bench(engine, args.runs, cases=args.case)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""One-time schema bootstrap: everything the pages expect besides db.sql's tables.
+
+Creates (if missing) the ID sequences, secondary indexes, summary tables,
+horse/stable ratings, TrainerApplications, the Horse.version column,
+the HorseTransfers history, DataVersions, the NameIndex search index, the old_info archive and its trigger,
+the ArchivedSeasons catalog and the change-event outbox, and on MySQL drops
+the old delete_owner_and_related procedure (owners are deleted by
+hrdb/deletion.py); the bundled SQLite file is loaded from db.sql the first time. It is idempotent but not free (DDL and
+information_schema lookups), so bootstrap() runs it at most once per process
+and database; the Streamlit script used to run it on every rerun.
+
+    python -m hrdb.bootstrap --budget-ms 2000    # cold vs. warm cost, exit 1 over budget
+"""
+import argparse
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+from hrdb import archive, facts, ids, outbox, ratings, search, summaries, versions
+from hrdb import queries as Q
+from hrdb.backend import SQLITE_TRIGGER, has_table, is_sqlite, make_engine
+from hrdb.schema import HORSE_TRANSFERS_DDL, TRAINER_APPLICATIONS_DDL, ensure_columns, ensure_indexes, load_sql_script
+
+OLD_INFO_DDL = """
+    CREATE TABLE IF NOT EXISTS old_info (
+      horseId      VARCHAR(15) NOT NULL,
+      horseName    VARCHAR(15) NOT NULL,
+      age          INT,
+      gender       CHAR(1),
+      registration INT NOT NULL,
+      stableId     VARCHAR(30) NOT NULL,
+      deleted_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# ---------- MySQL programs ----------
+# Trigger: copy deleted horses into old_info
+MYSQL_TRIGGER = """
+    CREATE TRIGGER trg_horse_to_oldinfo
+    AFTER DELETE ON Horse
+    FOR EACH ROW
+    BEGIN
+      INSERT INTO old_info
+        (horseId, horseName, age, gender, registration, stableId, deleted_at)
+      VALUES
+        (OLD.horseId, OLD.horseName, OLD.age, OLD.gender, OLD.registration, OLD.stableId, NOW());
+    END
+"""
+
+_lock = threading.Lock()
+_done = set()   # URLs of the databases bootstrapped by this process
+
+
+def ensure_schema(engine):
+    """Create whatever is missing (safe to run any number of times)."""
+    # The bundled SQLite file ships without the sample data: load db.sql on first run
+    if is_sqlite(engine) and not has_table(engine, "Horse"):
+        load_sql_script(engine)
+
+    # Race / trainer ID sequences (seeded from the existing IDs the first time)
+    ids.ensure_sequences(engine)
+
+    with engine.begin() as cx:
+        # Pending trainer applications (before the indexes: one of them is on this table)
+        cx.execute(text(Q.pick(TRAINER_APPLICATIONS_DDL, cx)))
+
+        # Row versions for the compare-and-swap writes (hrdb/concurrency.py)
+        ensure_columns(cx)
+
+        # Stable move history (before the indexes: one of them is on this table)
+        cx.execute(text(Q.pick(HORSE_TRANSFERS_DDL, cx)))
+
+        # Horse / stable ratings (rated from scratch the first time; before the indexes: two are on these tables)
+        ratings.ensure_rating_tables(cx)
+
+        # Race-time results facts (backfilled the first time; after HorseTransfers, before the indexes)
+        facts.ensure_fact_tables(cx)
+
+        # Secondary indexes for the joins the pages use (db.sql only has primary keys)
+        ensure_indexes(cx)
+
+        # Materialized track stats (built from scratch the first time)
+        summaries.ensure_summary_tables(cx)
+
+        # Owner / trainer / horse name search terms (built from scratch the first time)
+        search.ensure_name_index(cx)
+
+        # Archive table for the trigger
+        cx.execute(text(OLD_INFO_DDL))
+
+        # Catalog of the seasons moved out to compressed files (hrdb/archive.py)
+        cx.execute(text(archive.ARCHIVED_SEASONS_DDL))
+
+        # Change events of the admin writes and their subscribers' checkpoints (hrdb/outbox.py)
+        outbox.ensure_outbox_tables(cx)
+
+        # Per-table change counters (ETags of the HTTP API)
+        versions.ensure_versions(cx)
+
+        # SQLite: same trigger in SQLite syntax
+        if is_sqlite(cx):
+            cx.execute(text(SQLITE_TRIGGER))
+            return
+
+        trig_exists = cx.execute(text("""
+            SELECT COUNT(*) FROM information_schema.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE()
+              AND TRIGGER_NAME   = 'trg_horse_to_oldinfo'
+        """)).scalar()
+        if not trig_exists:
+            cx.execute(text("DROP TRIGGER IF EXISTS trg_horse_to_oldinfo"))
+            cx.execute(text(MYSQL_TRIGGER))
+
+        # Owners are deleted by hrdb/deletion.py on both backends. The old procedure skipped the
+        # upkeep of NameIndex, the summaries, ratings, ResultFacts and the outbox: don't leave it callable.
+        cx.execute(text("DROP PROCEDURE IF EXISTS delete_owner_and_related"))
+
+
+def bootstrap(engine, force: bool = False) -> bool:
+    """ensure_schema() once per process and database; force=True runs it again
+    (after a reload dropped the tables). Returns True if it ran."""
+    key = str(engine.url)
+    if key in _done and not force:
+        return False
+    with _lock:
+        if key in _done and not force:
+            return False
+        ensure_schema(engine)
+        _done.add(key)
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    ap.add_argument("--budget-ms", type=float, default=2000, help="allowed cold-start time")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    t0 = time.perf_counter()
+    bootstrap(engine)
+    cold = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    bootstrap(engine)
+    warm = (time.perf_counter() - t0) * 1000
+    print(f"cold start {cold:.1f} ms (budget {args.budget_ms:.0f} ms), later calls {warm:.3f} ms")
+    sys.exit(1 if cold > args.budget_ms else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Bulk race-results import (race cards, historical seasons).
+
+One input row per result:
+
+    raceKey, raceName, trackName, raceDate, raceTime, horseId, results, prize
+
+`raceKey` groups the rows of one race (when absent, raceName + trackName +
+raceDate + raceTime is used) and rows of the same race must be adjacent.
+The file is read in chunks (CSV, JSONL or Parquet), each race is validated
+with the same rules as the Add Race page, race IDs are allocated a block at a
+time and rows are written with executemany in transactions of about
+`chunk_rows` rows (always whole races, so summaries stay consistent). A chunk
+that meets a lock is retried like the other writes (hrdb/concurrency.py).
+
+    python -m hrdb.bulk_import season_2024.csv --chunk-rows 5000
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from datetime import date
+from datetime import time as time_of_day
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import bindparam, text
+
+from hrdb import archive, concurrency, ids
+from hrdb import queries as Q
+from hrdb import facts, ratings, summaries
+from hrdb.backend import make_engine
+from hrdb.rules import validate_results
+from hrdb.writes import INSERT_RACE, INSERT_RESULT, record_events
+
+MAX_ERRORS = 200  # keep the report readable on a badly broken file
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    races: int = 0
+    skipped_races: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.rows:,} results in {self.races:,} races imported in {self.seconds:.2f}s "
+                f"({self.rows_per_sec:,.0f} rows/sec); {self.skipped_races} race(s) skipped")
+
+
+# ---------- readers (all yield dict rows) ----------
+def _fmt_of(source, fmt):
+    if fmt:
+        return fmt.lower()
+    name = str(getattr(source, "name", source)).lower()
+    for ext in ("csv", "jsonl", "parquet"):
+        if name.endswith("." + ext) or (ext == "jsonl" and name.endswith(".ndjson")):
+            return ext
+    raise ValueError(f"Can't tell the format of {name!r}; pass fmt='csv' | 'jsonl' | 'parquet'")
+
+
+def _text_stream(source):
+    if isinstance(source, (str, Path)):
+        return open(source, encoding="utf-8", newline="")
+    raw = source.read() if hasattr(source, "read") else source
+    return io.StringIO(raw.decode("utf-8") if isinstance(raw, bytes) else raw, newline="")
+
+
+def read_rows(source, fmt=None, batch_size=10_000):
+    """Stream rows from a path or an uploaded file object."""
+    fmt = _fmt_of(source, fmt)
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet import needs pyarrow (pip install pyarrow)") from e
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+        return
+    with _text_stream(source) as fh:
+        if fmt == "csv":
+            yield from csv.DictReader(fh)
+        else:
+            for ln in fh:
+                if ln.strip():
+                    yield json.loads(ln)
+
+
+# ---------- grouping / validation ----------
+def _race_key(row) -> tuple:
+    if row.get("raceKey") not in (None, ""):
+        return ("key", str(row["raceKey"]))
+    return (row.get("raceName"), row.get("trackName"), str(row.get("raceDate")), str(row.get("raceTime")))
+
+
+def _races(rows):
+    """Group adjacent rows into races: yields (key, [rows])."""
+    done, key, bucket = set(), None, []
+    for row in rows:
+        k = _race_key(row)
+        if k != key:
+            if bucket:
+                yield key, bucket
+            if k in done:
+                raise ValueError(f"Rows of race {k} are not adjacent in the input")
+            done.add(key)
+            key, bucket = k, []
+        bucket.append(row)
+    if bucket:
+        yield key, bucket
+
+
+def _day(value) -> str:
+    """raceDate as YYYY-MM-DD (the date part of a timestamp too); ValueError if it is no date."""
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid raceDate {value!r}.") from None
+
+
+def _clock(value) -> str | None:
+    """raceTime as HH:MM:SS, as the Add Race page stores it; ValueError if it is no time of day."""
+    if value in (None, ""):
+        return None
+    try:
+        return time_of_day.fromisoformat(str(value).strip()).strftime("%H:%M:%S")
+    except ValueError:
+        raise ValueError(f"Invalid raceTime {value!r}.") from None
+
+
+def _clean(rows):
+    """(race fields, [(horseId, result, prize)]) from raw rows; raises ValueError on bad values."""
+    first = rows[0]
+    race = {
+        "nm": (first.get("raceName") or None),
+        "trk": (first.get("trackName") or "").strip(),
+        "dt": first.get("raceDate") or "",
+        "tm": _clock(first.get("raceTime")),
+    }
+    if not race["trk"] or not race["dt"]:
+        raise ValueError("trackName and raceDate are required")
+    race["dt"] = _day(race["dt"])
+    entries = []
+    for r in rows:
+        prize = r.get("prize")
+        entries.append((str(r.get("horseId") or "").strip(),
+                        str(r.get("results") or "").strip().lower(),
+                        float(prize) if prize not in (None, "") else 0.0))
+    return race, entries
+
+
+# ---------- import ----------
+def _write_chunk(engine, chunk, tracks: set, report: ImportReport):
+    """Validate and insert a list of (key, race fields, entries) in one transaction."""
+    # block of race IDs for the whole chunk, reserved up front so the sequence row
+    # isn't locked for the length of the chunk (IDs of skipped races are just unused)
+    first = ids.reserve(engine, "race", len(chunk))
+
+    def write(cx):      # retried on lock errors (hrdb/concurrency.py): nothing outside cx
+        horse_ids = sorted({hid for _, _, entries in chunk for hid, _, _ in entries})
+        known = set(cx.execute(text(Q.pick(Q.LOCK_HORSES, cx))     # locked: see ratings.record_races
+                               .bindparams(bindparam("ids", expanding=True)), {"ids": horse_ids}).scalars())
+        closed = archive.closed_through(cx)      # archived seasons take no new races
+
+        good, skipped = [], []
+        for key, race, entries in chunk:
+            errs = validate_results(entries)
+            if race["trk"] not in tracks:
+                errs.append(f"Unknown track {race['trk']!r}.")
+            errs += [f"Unknown horse {hid!r}." for hid, _, _ in entries if hid not in known]
+            if closed is not None and race["dt"] <= closed:
+                errs.append(f"Race date {race['dt']} is in an archived season (up to {closed[:4]}).")
+            if errs:
+                skipped.append((key, errs))
+            else:
+                good.append((race, entries))
+
+        race_rows, result_rows = [], []
+        for n, (race, entries) in enumerate(good, start=first):
+            rid = f"race{n}"
+            race_rows.append({"id": rid, **race})
+            result_rows += [{"rid": rid, "hid": hid, "res": res, "pr": prize} for hid, res, prize in entries]
+        if race_rows:
+            cx.execute(text(INSERT_RACE), race_rows)        # executemany
+            cx.execute(text(INSERT_RESULT), result_rows)
+            summaries.record_races(cx, [r["id"] for r in race_rows])
+            facts.record_races(cx, [r["id"] for r in race_rows])
+            ratings.record_races(cx, [r["id"] for r in race_rows])
+            record_events(cx, race_rows, result_rows)
+        return skipped, len(race_rows), len(result_rows)
+
+    skipped, races, rows = concurrency.transact(engine, "bulk_import", write)
+    for key, errs in skipped:
+        report.skipped_races += 1
+        report.errors += [f"race {key}: {e}" for e in errs][:max(0, MAX_ERRORS - len(report.errors))]
+    report.races += races
+    report.rows += rows
+
+
+def import_results(engine, source, fmt=None, chunk_rows=5_000, progress=None) -> ImportReport:
+    """Import a results file; `progress(report)` is called after every committed chunk."""
+    report = ImportReport()
+    t0 = time.perf_counter()
+    ids.ensure_sequences(engine)
+    with engine.begin() as cx:
+        tracks = set(cx.execute(text(Q.TRACK_NAMES)).scalars())
+
+    chunk, chunk_len = [], 0
+    for key, rows in _races(read_rows(source, fmt)):
+        try:
+            race, entries = _clean(rows)
+        except (TypeError, ValueError) as e:
+            report.skipped_races += 1
+            report.errors.append(f"race {key}: {e}")
+            continue
+        chunk.append((key, race, entries))
+        chunk_len += len(entries)
+        if chunk_len >= chunk_rows:
+            _write_chunk(engine, chunk, tracks, report)
+            chunk, chunk_len = [], 0
+            report.seconds = time.perf_counter() - t0
+            if progress:
+                progress(report)
+    if chunk:
+        _write_chunk(engine, chunk, tracks, report)
+    report.seconds = time.perf_counter() - t0
+    if progress:
+        progress(report)
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=["csv", "jsonl", "parquet"], help="default: from the file extension")
+    ap.add_argument("--chunk-rows", type=int, default=5_000, help="rows per transaction (whole races)")
+    args = ap.parse_args()
+
+    report = import_results(make_engine(), args.path, args.format, args.chunk_rows,
+                            progress=lambda r: print(f"  {r.rows:>12,} rows  {r.rows_per_sec:>10,.0f} rows/sec"))
+    for err in report.errors:
+        print("  !", err)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
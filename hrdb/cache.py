@@ -0,0 +1,164 @@
+"""Result cache for read queries (the q() helper in app.py).
+
+Entries are keyed by normalized SQL + parameters, expire after a TTL, are
+evicted LRU when the cache is full, and are dropped as soon as a write
+touches one of the tables they read. Writes are noticed with SQLAlchemy
+engine events, so x() and ENGINE.begin() blocks are all covered without
+changes at the call sites.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+_WS_RE = re.compile(r"\s+")
+_READ_TABLES_RE = re.compile(r"\b(?:FROM|JOIN)\s+`?([A-Za-z_]\w*)", re.I)
+_WRITE_TABLES_RE = re.compile(
+    r"\b(?:INTO|UPDATE|FROM|JOIN|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+[`\"]?([A-Za-z_]\w*)", re.I)
+_VERB_RE = re.compile(r"\s*(\w+)")
+_VALUES_RE = re.compile(r"\bVALUES\s*\(", re.I)
+_WRITE_VERBS = ("insert", "update", "delete", "replace", "drop", "truncate", "alter")
+
+# Tables written behind the scenes by triggers
+TRIGGER_TABLES = {
+    "horse": {"old_info"},      # trg_horse_to_oldinfo
+}
+# The season tables of ResultFacts on SQLite (hrdb/facts.py) count as ResultFacts itself
+_SEASON_TABLE_RE = re.compile(r"^(resultfacts)_\d{4}$")
+
+
+def _table(name: str) -> str:
+    name = name.lower()
+    season = _SEASON_TABLE_RE.match(name)
+    return season.group(1) if season else name
+
+
+def normalize(sql: str) -> str:
+    return _WS_RE.sub(" ", sql).strip()
+
+
+def read_tables(sql: str) -> frozenset:
+    return frozenset(_table(t) for t in _READ_TABLES_RE.findall(sql))
+
+
+def written_tables(sql: str) -> set:
+    """Tables a write statement may change (empty set for reads)."""
+    verb = _VERB_RE.match(sql)
+    verb = verb.group(1).lower() if verb else ""
+    if verb not in _WRITE_VERBS:
+        return set()
+    if verb in ("insert", "replace"):
+        values = _VALUES_RE.search(sql)
+        if values:
+            sql = sql[:values.start()]       # the rows can't name tables (bulk loads send MBs of them)
+    tables = {_table(t) for t in _WRITE_TABLES_RE.findall(sql)}
+    for t in list(tables):
+        tables |= TRIGGER_TABLES.get(t, set())
+    return tables
+
+
+class QueryCache:
+    """Size-bounded LRU + TTL cache with per-table invalidation."""
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None):
+        self.maxsize = maxsize or int(os.environ.get("HR_CACHE_SIZE", 256))
+        self.ttl = ttl if ttl is not None else float(os.environ.get("HR_CACHE_TTL", 30))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()      # key -> (expires_at, tables, value)
+        self._by_table = {}                # table -> set(keys)
+        self._generation = {}              # table -> write counter
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    # ---------- reads ----------
+    def fetch(self, sql: str, params: dict | None, load):
+        """Cached result of `sql`, or load() it and remember the result."""
+        key = (normalize(sql), repr(sorted((params or {}).items())))
+        tables = read_tables(sql)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                self._drop(key)
+            self.misses += 1
+            seen = self._gens(tables)
+
+        value = load()
+
+        with self._lock:
+            # a write landed while we were loading: don't cache a possibly stale result
+            if self._gens(tables) != seen:
+                return value
+            self._entries[key] = (now + self.ttl, tables, value)
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    # ---------- writes ----------
+    def invalidate(self, tables):
+        """Drop every entry that read any of `tables`."""
+        with self._lock:
+            for t in tables:
+                t = t.lower()
+                self._generation[t] = self._generation.get(t, 0) + 1
+                for key in list(self._by_table.get(t, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for t in list(self._by_table):
+                self._generation[t] = self._generation.get(t, 0) + 1
+            self._entries.clear()
+            self._by_table.clear()
+
+    def watch(self, engine):
+        """Invalidate on every write executed through `engine`, and again once the
+        connection goes back to the pool (i.e. after COMMIT), so a reader that
+        raced the open transaction can't keep its old data."""
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_execute(conn, _cursor, statement, _params, _context, _many):
+            tables = written_tables(statement)
+            if tables:
+                conn.info.setdefault("hr_dirty_tables", set()).update(tables)
+                self.invalidate(tables)
+
+        @event.listens_for(engine.pool, "checkin")
+        def _on_checkin(_dbapi_conn, record):
+            dirty = record.info.pop("hr_dirty_tables", None) if record is not None else None
+            if dirty:
+                self.invalidate(dirty)
+
+    # ---------- stats ----------
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    # ---------- internals (lock held) ----------
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            for t in entry[1]:
+                keys = self._by_table.get(t)
+                if keys:
+                    keys.discard(key)
+
+    def _gens(self, tables) -> tuple:
+        return tuple(self._generation.get(t, 0) for t in sorted(tables))
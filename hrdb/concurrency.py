@@ -0,0 +1,285 @@
+"""Concurrent admin writes: row versions, compare-and-swap, bounded retry.
+
+The admin pages act on rows loaded on an earlier rerun, and several admins
+can work at once. Move Horse used to update whatever stable the horse was in
+by the time of the click, and a rejection could overwrite an approval another
+admin had just made. Now:
+
+- Horse has a `version` column that every move bumps. The page passes the
+  version it showed, and the move only applies WHERE version = :seen
+  (compare-and-swap). If the version no longer matches, ConflictError is
+  raised and the page reloads instead of overwriting.
+- A trainer application is claimed with UPDATE ... WHERE status = 'pending'
+  before anything else happens. Its status acts as its version.
+- Write transactions take their locks before they read. On MySQL that is
+  SELECT ... FOR UPDATE. On SQLite, which has no row locks, it is BEGIN
+  IMMEDIATE (backend.write_transaction).
+- transact() retries deadlocks, lock-wait timeouts and "database is locked"
+  up to HR_WRITE_ATTEMPTS times (default 5), with jittered exponential backoff.
+  A ConflictError is never retried: the caller's decision was based on stale
+  data. Calls, retries, conflicts and latency per write go to CONTENTION,
+  which is shown on the Diagnostics page.
+
+The hammer runs random moves (single and batched), approvals, rejections and
+new races from a thread pool, half of the moves from stale page data. It then
+checks for lost updates, double decisions, gaps in the transfer history,
+ratings that missed a race and drifted summaries. It writes to the database, so point it at a
+scratch copy. It exits with 1 on any violation.
+
+    python -m hrdb.concurrency --sqlite /tmp/hammer.sqlite --threads 16 --ops 2000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from hrdb.backend import make_engine, write_transaction
+from hrdb.metrics import ContentionMetrics
+from hrdb.rules import RESULT_OPTIONS
+
+ATTEMPTS = int(os.environ.get("HR_WRITE_ATTEMPTS", 5))
+BACKOFF_S = 0.02        # first retry waits up to 20 ms, doubling per attempt
+BACKOFF_MAX_S = 0.5
+
+LOCK_ERRORS = {1205: "lock wait timeout", 1213: "deadlock"}   # MySQL error codes
+
+CONTENTION = ContentionMetrics()
+
+
+class ConflictError(ValueError):
+    """The row changed since the caller read it; reload and decide again."""
+
+
+def lock_error(exc: Exception) -> str | None:
+    """Kind of a transient lock error worth retrying, or None."""
+    orig = getattr(exc, "orig", None)
+    code = orig.args[0] if orig is not None and orig.args else None
+    if code in LOCK_ERRORS:
+        return LOCK_ERRORS[code]
+    if isinstance(exc, OperationalError) and "locked" in str(orig):
+        return "database locked"
+    return None
+
+
+def transact(engine, op: str, fn, attempts: int = ATTEMPTS, stats: ContentionMetrics = CONTENTION):
+    """fn(cx) in a write transaction, retried on lock errors; returns its result.
+
+    `fn` may run more than once, so it must not have side effects outside the
+    transaction.
+    """
+    t0, errors = time.perf_counter(), []
+    for attempt in range(1, attempts + 1):
+        try:
+            with write_transaction(engine) as cx:
+                result = fn(cx)
+        except ConflictError:
+            stats.record(op, "conflict", attempt, time.perf_counter() - t0, errors)
+            raise
+        except DBAPIError as e:
+            kind = lock_error(e)
+            if kind is None:
+                stats.record(op, "failed", attempt, time.perf_counter() - t0, errors)
+                raise
+            errors.append(kind)
+            if attempt == attempts:
+                stats.record(op, "failed", attempt, time.perf_counter() - t0, errors)
+                raise
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_S * 2 ** (attempt - 1))))
+            continue
+        stats.record(op, "ok", attempt, time.perf_counter() - t0, errors)
+        return result
+
+
+# ---------- hammer ----------
+def hammer(repo, threads: int = 16, ops: int = 2000, horses: int = 20, stale: float = 0.5,
+           seed: int = 7, log=print) -> list[str]:
+    """Random moves of `horses` hot horses, races between them and decisions on fresh
+    applications from a thread pool; a `stale` share of the moves use the versions
+    read before the start. Returns the invariant violations found afterwards (empty
+    when all is well)."""
+    repo.ready()
+    engine, rnd = repo.engine, random.Random(seed)
+    with engine.connect() as cx:
+        hot = {r.horseId: r.version for r in cx.execute(
+            text("SELECT horseId, version FROM Horse ORDER BY horseId LIMIT :n"), {"n": horses})}
+        stables = cx.execute(text("SELECT stableId FROM Stable ORDER BY stableId LIMIT 10")).scalars().all()
+        track = cx.execute(text("SELECT trackName FROM Track ORDER BY trackName LIMIT 1")).scalar()
+        rated = dict(cx.execute(text("SELECT horseId, races FROM HorseRatings WHERE horseId IN :ids")
+                                .bindparams(bindparam("ids", expanding=True)), {"ids": list(hot)}).all())
+    with engine.begin() as cx:
+        last = cx.execute(text("SELECT COALESCE(MAX(appId), 0) FROM TrainerApplications")).scalar()
+        history = cx.execute(text("SELECT COALESCE(MAX(transferId), 0) FROM HorseTransfers")).scalar()
+        cx.execute(text("INSERT INTO TrainerApplications (fname, lname, stableId) VALUES ('Hammer', :ln, :sid)"),
+                   [{"ln": f"App{i}", "sid": rnd.choice(stables)} for i in range(max(1, ops // 8))])
+        apps = cx.execute(text("SELECT appId FROM TrainerApplications WHERE appId > :a"),
+                          {"a": last}).scalars().all()
+
+    lock = threading.Lock()
+    moves, decisions, conflicts, errors = defaultdict(list), defaultdict(list), Counter(), []
+    raced = Counter()
+
+    def one(i):
+        r = random.Random(seed * 1_000_003 + i)
+        kind = r.random()
+        try:
+            if kind < 0.5:
+                # one horse, or a batch of 2-5 moved all or nothing
+                batch, target = r.sample(list(hot), 1 if kind < 0.375 else r.randint(2, 5)), r.choice(stables)
+                if r.random() < stale:
+                    versions = {hid: hot[hid] for hid in batch}    # page loaded before everyone else's moves
+                else:
+                    versions = {hid: repo.rows("SELECT version FROM Horse WHERE horseId = :hid",
+                                               {"hid": hid}, cache=False)[0]["version"] for hid in batch}
+                if len(batch) == 1:
+                    hid = batch[0]
+                    moved = [hid] if repo.horses.move(hid, target, versions[hid]) != target else []
+                else:
+                    moved = repo.horses.transfer(batch, target, versions)
+                with lock:
+                    for hid in moved:
+                        moves[hid].append(versions[hid])
+            elif kind < 0.7:
+                app = r.choice(apps)
+                tid = repo.trainers.approve(app)
+                with lock:
+                    decisions[app].append(("approved", tid))
+            elif kind < 0.8:
+                app = r.choice(apps)
+                repo.trainers.reject(app, "hammer")
+                with lock:
+                    decisions[app].append(("rejected", None))
+            else:
+                # 2-5 hot horses in finishing order: their ratings must take in every race
+                field = r.sample(list(hot), r.randint(2, 5))
+                repo.races.add(f"Hammer {i}", track, date.today().isoformat(), "12:00:00",
+                               [(hid, RESULT_OPTIONS[n], 100 * (5 - n)) for n, hid in enumerate(field)])
+                with lock:
+                    raced.update(field)
+        except ConflictError:
+            with lock:
+                conflicts["move" if kind < 0.5 else "decision"] += 1
+        except Exception as e:
+            with lock:
+                errors.append(f"op {i}: {e!r}"[:300])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(ops)))
+    elapsed = time.perf_counter() - t0
+    log(f"{ops:,} operations on {threads} threads in {elapsed:.1f}s ({ops / elapsed:,.0f} ops/sec); "
+        f"{sum(map(len, moves.values()))} moves, {sum(map(len, decisions.values()))} decisions, "
+        f"{sum(raced.values())} race entries, conflicts {dict(conflicts)}")
+    return errors + _violations(engine, hot, moves, decisions, history, rated, raced)
+
+
+def _violations(engine, hot: dict, moves: dict, decisions: dict, history: int, rated: dict,
+                raced: Counter) -> list[str]:
+    out = []
+    with engine.connect() as cx:
+        # no lost updates: each version of a horse was moved away from exactly once
+        now = dict(cx.execute(text("SELECT horseId, version FROM Horse WHERE horseId IN :ids")
+                              .bindparams(bindparam("ids", expanding=True)), {"ids": list(hot)}).all())
+        for hid, before in hot.items():
+            if sorted(moves[hid]) != list(range(before, now[hid])):
+                out.append(f"horse {hid}: moves succeeded from versions {sorted(moves[hid])}, "
+                           f"its version went {before} -> {now[hid]}")
+
+        # one history row per move, chained from stable to stable up to the current one
+        logged = defaultdict(list)
+        for hid, frm, to in cx.execute(text("""
+            SELECT horseId, fromStable, toStable FROM HorseTransfers
+            WHERE transferId > :t ORDER BY transferId
+        """), {"t": history}):
+            logged[hid].append((frm, to))
+        current = dict(cx.execute(text("SELECT horseId, stableId FROM Horse WHERE horseId IN :ids")
+                                  .bindparams(bindparam("ids", expanding=True)), {"ids": list(hot)}).all())
+        for hid in hot:
+            chain = logged[hid]
+            if len(chain) != len(moves[hid]):
+                out.append(f"horse {hid}: {len(moves[hid])} moves but {len(chain)} history rows")
+            elif chain and (any(a[1] != b[0] for a, b in zip(chain, chain[1:])) or chain[-1][1] != current[hid]):
+                out.append(f"horse {hid}: history {chain} does not end in its stable {current[hid]}")
+
+        # each application decided once, and as reported
+        rows = {r.appId: r for r in cx.execute(text(
+            "SELECT appId, status, approvedTrainerId FROM TrainerApplications WHERE fname = 'Hammer'"))}
+        trainers = set(cx.execute(text("SELECT trainerId FROM Trainer")).scalars())
+        for app, made in decisions.items():
+            row = rows[app]
+            if len(made) > 1:
+                out.append(f"application {app} decided {len(made)} times: {made}")
+            elif made[0][0] != row.status or made[0][1] != row.approvedTrainerId:
+                out.append(f"application {app}: reported {made[0]}, stored ({row.status}, {row.approvedTrainerId})")
+            elif row.status == "approved" and row.approvedTrainerId not in trainers:
+                out.append(f"application {app}: trainer {row.approvedTrainerId} missing")
+
+        # no lost rating updates: every race a horse ran counted once on top of the rating it had
+        now = dict(cx.execute(text("SELECT horseId, races FROM HorseRatings WHERE horseId IN :ids")
+                              .bindparams(bindparam("ids", expanding=True)), {"ids": list(hot)}).all())
+        for hid in hot:
+            if now.get(hid, 0) != rated.get(hid, 0) + raced[hid]:
+                out.append(f"horse {hid}: rated in {now.get(hid, 0)} races, "
+                           f"expected {rated.get(hid, 0)} + {raced[hid]}")
+
+        # the per-stable summaries moved along with the horses
+        drift = cx.execute(text("""
+            SELECT s.stableId, COALESCE(sr.horses, 0), COALESCE(x.n, 0)
+            FROM Stable s
+            LEFT JOIN StableRatings sr ON sr.stableId = s.stableId
+            LEFT JOIN (SELECT h.stableId, COUNT(*) AS n
+                       FROM HorseRatings hr JOIN Horse h ON h.horseId = hr.horseId
+                       WHERE hr.races > 0
+                       GROUP BY h.stableId) x ON x.stableId = s.stableId
+            WHERE COALESCE(sr.horses, 0) <> COALESCE(x.n, 0)
+        """)).all()
+        out += [f"StableRatings {sid}: {kept} rated horses kept, {actual} actual" for sid, kept, actual in drift]
+        drift = cx.execute(text("""
+            SELECT s.stableId, COALESCE(sr.races, 0), COALESCE(x.n, 0), COALESCE(sr.ratingSum, 0), COALESCE(x.s, 0)
+            FROM Stable s
+            LEFT JOIN StableRatings sr ON sr.stableId = s.stableId
+            LEFT JOIN (SELECT h.stableId, SUM(hr.races) AS n, SUM(hr.rating * hr.races) AS s
+                       FROM HorseRatings hr JOIN Horse h ON h.horseId = hr.horseId
+                       GROUP BY h.stableId) x ON x.stableId = s.stableId
+            WHERE COALESCE(sr.races, 0) <> COALESCE(x.n, 0)
+               OR ABS(COALESCE(sr.ratingSum, 0) - COALESCE(x.s, 0)) > 0.01
+        """)).all()
+        out += [f"StableRatings {sid}: {n} races / {s:.2f} rating sum kept, {an} / {as_:.2f} actual"
+                for sid, n, an, s, as_ in drift]
+    return out
+
+
+def main():
+    # through the imported module: under `python -m` this one is __main__, and its
+    # ConflictError would not be the class hrdb.writes raises
+    from hrdb import concurrency
+    from hrdb.repository import Repository
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--horses", type=int, default=20, help="hot horses the moves pick from")
+    ap.add_argument("--stale", type=float, default=0.5, help="share of moves made from stale versions")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    problems = concurrency.hammer(Repository(engine), args.threads, args.ops, args.horses, args.stale, args.seed)
+    for row in concurrency.CONTENTION.summary():
+        print("  " + "  ".join(f"{k}={v}" for k, v in row.items()))
+    for p in problems:
+        print("VIOLATION", p)
+    print("OK" if not problems else f"{len(problems)} violation(s)")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Synthetic data generator (for query-plan checks and benchmarks).
+
+Builds the db.sql schema and fills it with referentially consistent rows
+whose IDs look like the sample data (stable1, horse1, race1, ...). Every table
+can be scaled on its own (the defaults derive from --results):
+
+    python -m hrdb.datagen --results 1000000 --sqlite /tmp/big.sqlite
+    python -m hrdb.datagen --stables 10000 --horses 1000000 --results 50000000
+
+Distributions are skewed the way real racing data is: a few big stables and
+owners hold most horses, most horses have one owner, horses of 3-6 race most,
+busy tracks host most races, the season runs October-April, fields have 6-14
+runners and the purse is split 60/20/10/6/4 down the placings. Rows are
+generated and inserted in batches, so memory stays flat whatever the scale.
+"""
+import argparse
+import itertools
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from hrdb import facts, ratings, search
+from hrdb.backend import fk_checks_off, has_table, is_sqlite, make_engine
+from hrdb.ids import reseed
+from hrdb.schema import ensure_indexes, load_sql_script
+
+BATCH = 20_000
+
+FIRST_NAMES = ["Ahmed", "Mohammed", "Khalid", "Faisal", "Saeed", "Fahd", "Ali", "Omar", "Hamid", "Saleh",
+               "Nasser", "Sultan", "Abdullah", "Majed", "Turki", "Yousef", "Hassan", "Ibrahim", "Waleed",
+               "Salman", "Mona", "Sara", "Noura", "Reem", "Hessa", "Latifa", "Maryam", "Fatima", "Aisha", "Lama"]
+FAMILY_NAMES = ["Mohammed", "Ahmed", "Saeed", "Al Saud", "Al Thani", "Al Nahyan", "Al Maktoum", "Khalid",
+                "Hamid", "Saleh", "Faisal", "Sheikh", "Mahmood", "Khan", "Nasr", "Abed", "Jabr", "Faleh",
+                "Al Otaibi", "Al Harbi", "Al Qahtani", "Al Ghamdi", "Al Zahrani", "Al Dosari", "Al Shehri",
+                "Al Mutairi", "Al Shammari", "Al Anazi", "Al Subaie", "Al Rashid", "Al Suwaidi", "Al Mansoori",
+                "Al Kaabi", "Al Marri", "Al Kuwari", "Al Khalifa", "Al Sabah", "Al Hashimi", "Al Jaber", "Hassan"]
+HORSE_WORDS = ["Desert", "Storm", "Golden", "Falcon", "Wind", "Star", "Dune", "Royal", "Swift", "Pearl",
+               "Silver", "Arrow", "Night", "Fire", "Sand", "Moon", "Blaze", "Thunder", "Sea", "Dawn",
+               "Red", "Eagle", "Noble", "Spirit", "Jewel", "Rain", "Flash", "Bold", "Dream", "Sky"]
+CITIES = [("Riyadh", "SA"), ("Jeddah", "SA"), ("Dammam", "SA"), ("Jubail", "SA"), ("Yanbu", "SA"),
+          ("Taif", "SA"), ("Dhahran", "SA"), ("Dubai", "UE"), ("Abu Dhabi", "UE"), ("Sharjah", "UE"),
+          ("Ajman", "UE"), ("Al Ain", "UE"), ("Doha", "QT"), ("Manama", "BH"), ("Bahrain", "BH"),
+          ("Kuwait", "KW"), ("Muscat", "OM"), ("Salalah", "OM")]
+COLORS = ["orange", "kiwi", "cinnamon", "lemon", "bright blue", "green", "maroon", "white", "gold", "navy"]
+RACE_NAMES = ["Handicap", "Maiden", "Kings Cup", "Derby", "Guineas", "Sprint", "Claiming Stake",
+              "Crown Prince Cup", "Gold Cup", "Oaks"]
+AGE_WEIGHTS = {2: 15, 3: 22, 4: 20, 5: 15, 6: 10, 7: 7, 8: 5, 9: 3, 10: 3}
+RUN_WEIGHTS = {2: 0.6, 3: 1.4, 4: 1.5, 5: 1.3, 6: 1.0, 7: 0.6, 8: 0.4, 9: 0.2, 10: 0.1}  # how often each age races
+MONTH_WEIGHTS = [1.3, 1.3, 1.2, 1.0, 0.4, 0.1, 0.05, 0.05, 0.2, 0.9, 1.2, 1.3]          # Jan..Dec
+PLACINGS = [("first", 0.60), ("second", 0.20), ("third", 0.10), ("fourth", 0.06), ("last", 0.04)]
+YEARS = 25
+
+
+def _zipf_cum(n: int, s: float) -> list[float]:
+    """Cumulative Zipf weights over n items (item 1 heaviest)."""
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def _insert(cx, table: str, rows: list[tuple]):
+    """INSERT rows with executemany, BATCH rows at a time."""
+    if not rows:
+        return
+    marks = ", ".join(["?" if is_sqlite(cx) else "%s"] * len(rows[0]))
+    sql = f"INSERT INTO {table} VALUES ({marks})"
+    for i in range(0, len(rows), BATCH):
+        cx.exec_driver_sql(sql, rows[i:i + BATCH])
+
+
+def scale(results: int = 1_000_000, horses=None, stables=None, owners=None, tracks=None) -> dict:
+    """Row counts per table; unset counts are derived from `results`."""
+    horses = horses or max(26, results // 10)
+    return {
+        "results": results,
+        "horses": horses,
+        "stables": stables or max(6, horses // 100),
+        "owners": owners or max(20, horses // 2),
+        "tracks": tracks or 40,
+    }
+
+
+def generate(engine, results: int = 1_000_000, seed: int = 7, log=print, *,
+             horses=None, stables=None, owners=None, tracks=None, start=date(2000, 1, 1)) -> dict:
+    """Recreate the schema and fill it; returns the row count of every table."""
+    n = scale(results, horses, stables, owners, tracks)
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    counts = {}
+    load_sql_script(engine, ddl_only=True)
+
+    def put(table, rows):
+        counts[table] = counts.get(table, 0) + len(rows)
+        with fk_checks_off(engine) as cx:       # parents are always generated first
+            _insert(cx, table, rows)
+
+    # ---------- Stable ----------
+    put("Stable", [(f"stable{i}", f"{rnd.choice(FAMILY_NAMES)} Stables", rnd.choice(CITIES)[0],
+                    rnd.choice(COLORS)) for i in range(1, n["stables"] + 1)])
+    stable_ids, stable_cum = range(1, n["stables"] + 1), _zipf_cum(n["stables"], 0.9)
+
+    # ---------- Horse ----------
+    ages, age_w = list(AGE_WEIGHTS), list(AGE_WEIGHTS.values())
+    run_cum, total, per_stable, batch = [], 0.0, Counter(), []
+    for i in range(1, n["horses"] + 1):
+        age = rnd.choices(ages, age_w)[0]
+        gender = rnd.choice("CF") if age <= 4 else rnd.choices("MSG", [40, 15, 45])[0]
+        stable = rnd.choices(stable_ids, cum_weights=stable_cum)[0]
+        per_stable[stable] += 1
+        total += RUN_WEIGHTS[age]
+        run_cum.append(total)
+        batch.append((f"horse{i}", f"{rnd.choice(HORSE_WORDS)} {rnd.choice(HORSE_WORDS)}"[:15],
+                      age, gender, 10_000 + i, f"stable{stable}"))
+        if len(batch) >= BATCH:
+            put("Horse", batch)
+            batch = []
+    put("Horse", batch)
+
+    # ---------- Trainer: one per stable, plus one per 50 horses (at most 4) ----------
+    trainers = []
+    for s in stable_ids:
+        for _ in range(1 + min(3, per_stable[s] // 50)):
+            trainers.append((f"trainer{len(trainers) + 1}", rnd.choice(FAMILY_NAMES),
+                             rnd.choice(FIRST_NAMES), f"stable{s}"))
+    put("Trainer", trainers)
+
+    # ---------- Owner / Owns ----------
+    batch = []
+    for i in range(1, n["owners"] + 1):
+        batch.append((f"owner{i}", rnd.choice(FAMILY_NAMES)[:15], rnd.choice(FIRST_NAMES)))
+        if len(batch) >= BATCH:
+            put("Owner", batch)
+            batch = []
+    put("Owner", batch)
+    owner_ids, owner_cum, batch = range(1, n["owners"] + 1), _zipf_cum(n["owners"], 0.8), []
+    for h in range(1, n["horses"] + 1):
+        k = rnd.choices([1, 2, 3], [80, 15, 5])[0]
+        for o in set(rnd.choices(owner_ids, cum_weights=owner_cum, k=k)):
+            batch.append((f"owner{o}", f"horse{h}"))
+        if len(batch) >= BATCH:
+            put("Owns", batch)
+            batch = []
+    put("Owns", batch)
+
+    # ---------- Track ----------
+    tracks = [CITIES[i % len(CITIES)][0] + (f" {i // len(CITIES) + 1}" if i >= len(CITIES) else "")
+              for i in range(n["tracks"])]
+    put("Track", [(name, CITIES[i % len(CITIES)][1], rnd.randint(12, 24)) for i, name in enumerate(tracks)])
+    track_cum = _zipf_cum(n["tracks"], 0.8)
+
+    # ---------- Race / RaceResults: day by day from `start`, busier in season ----------
+    horse_ids = range(1, n["horses"] + 1)
+    per_day = n["results"] / 10 / (365 * YEARS * sum(MONTH_WEIGHTS) / 12)   # ~10 runners per race
+    day, made = start, 0
+    races, race_results = [], []
+    while made < n["results"]:
+        for _ in range(int(per_day * MONTH_WEIGHTS[day.month - 1] + rnd.random())):
+            rid = f"race{counts.get('Race', 0) + len(races) + 1}"
+            races.append((rid, rnd.choice(RACE_NAMES), rnd.choices(tracks, cum_weights=track_cum)[0],
+                          day.isoformat(), f"{rnd.randint(14, 21)}:{rnd.choice(['00', '30'])}:00"))
+            size = min(rnd.randint(6, 14), n["horses"], n["results"] - made)
+            field = list(dict.fromkeys(rnd.choices(horse_ids, cum_weights=run_cum, k=size * 2)))[:size]
+            purse = round(rnd.lognormvariate(10.8, 0.8), -2)
+            for pos, h in enumerate(field):
+                if pos < len(PLACINGS) and pos < len(field) - 1:
+                    res, prize = PLACINGS[pos][0], round(purse * PLACINGS[pos][1], 2)
+                else:
+                    res, prize = ("no show" if rnd.random() < 0.03 else "last"), 0.0
+                race_results.append((rid, f"horse{h}", res, prize))
+            made += len(field)
+            if made >= n["results"]:
+                break
+        if len(race_results) >= BATCH:
+            put("Race", races)
+            put("RaceResults", race_results)
+            races, race_results = [], []
+            log(f"  {made:>12,} results (up to {day.isoformat()})")
+        day += timedelta(days=1)
+    put("Race", races)
+    put("RaceResults", race_results)
+
+    with engine.begin() as cx:
+        ensure_indexes(cx)
+        reseed(cx)    # an existing IdSequences must not hand out the generated IDs again
+        if has_table(cx, "NameIndex"):
+            search.rebuild(cx)    # otherwise bootstrap builds it
+        if has_table(cx, "HorseRatings"):
+            ratings.recompute(cx)
+        if has_table(cx, "HorseTransfers"):
+            cx.execute(text("DELETE FROM HorseTransfers"))   # moves of the horses that were replaced
+        if has_table(cx, "TrainerWinnings"):     # otherwise bootstrap builds the facts
+            facts.ensure_partitions(cx)
+            facts.rebuild(cx)
+        if is_sqlite(cx):
+            cx.execute(text("ANALYZE"))
+        else:
+            cx.execute(text("ANALYZE TABLE Stable, Horse, Owner, Owns, Trainer, Track, Race, RaceResults"))
+
+    for table, rows in counts.items():
+        log(f"  {table:<12} {rows:>12,} rows")
+    log(f"generated in {time.perf_counter() - t0:.1f}s")
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--results", type=int, default=1_000_000, help="number of RaceResults rows")
+    ap.add_argument("--horses", type=int, help="default: results / 10")
+    ap.add_argument("--stables", type=int, help="default: horses / 100")
+    ap.add_argument("--owners", type=int, help="default: horses / 2")
+    ap.add_argument("--tracks", type=int, help="default: 40")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--sqlite", help="write to this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    generate(engine, args.results, args.seed, horses=args.horses, stables=args.stables,
+             owners=args.owners, tracks=args.tracks)
+
+
+if __name__ == "__main__":
+    main()
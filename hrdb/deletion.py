@@ -0,0 +1,143 @@
+"""Owner deletion (replaces the delete_owner_and_related procedure, which bootstrap drops).
+
+The old procedure found the horses to delete by grouping ALL of Horse against
+Owns, so its cost grew with the database and it also deleted horses that had
+been unowned before. Here only the horses the deleted owners held are looked
+at: they are staged in a temp table, and the ones that still have another
+owner are dropped from it. Any number of owners can be deleted in one
+transaction, every phase is timed, and each deleted owner is appended to the
+outbox as an owner_deleted event with the horses that went with it (hrdb/outbox.py):
+
+    python -m hrdb.deletion owner12 owner40 --dry-run
+"""
+import argparse
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+
+from hrdb import facts, outbox, ratings, search, summaries
+from hrdb.backend import make_engine
+
+REMOVE_CHUNK = 500  # horses per remove_horses call (keeps IN lists short)
+
+
+@dataclass
+class DeleteReport:
+    owners: int = 0
+    links: int = 0
+    horses: int = 0
+    results: int = 0
+    timings: dict = field(default_factory=dict)   # phase -> seconds
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in self.timings.items())
+        return (f"{self.owners} owner(s), {self.links} ownership link(s), {self.horses} horse(s) "
+                f"and {self.results} result(s) deleted ({phases})")
+
+
+@contextmanager
+def _timed(report: DeleteReport, phase: str):
+    t0 = time.perf_counter()
+    yield
+    report.timings[phase] = time.perf_counter() - t0
+
+
+def delete_owners(cx, owner_ids) -> DeleteReport:
+    """Delete owners, their ownership links, and the horses (with their results)
+    left without any owner. Runs inside the caller's transaction."""
+    report = DeleteReport()
+    owner_ids = list(dict.fromkeys(owner_ids))
+    if not owner_ids:
+        return report
+
+    with _timed(report, "stage"):
+        for name, col in (("_del_owners", "ownerId"), ("_del_horses", "horseId")):
+            cx.execute(text(f"CREATE TEMPORARY TABLE IF NOT EXISTS {name} ({col} VARCHAR(15) PRIMARY KEY)"))
+            cx.execute(text(f"DELETE FROM {name}"))
+        cx.execute(text("INSERT INTO _del_owners (ownerId) VALUES (:oid)"),
+                   [{"oid": oid} for oid in owner_ids])
+
+    with _timed(report, "links"):
+        existing = cx.execute(text(
+            "SELECT ownerId FROM Owner WHERE ownerId IN (SELECT ownerId FROM _del_owners)")).scalars().all()
+        held = cx.execute(text(
+            "SELECT ownerId, horseId FROM Owns WHERE ownerId IN (SELECT ownerId FROM _del_owners)")).all()
+        # candidates: the horses these owners hold (Owns PK starts with ownerId)
+        cx.execute(text("""
+            INSERT INTO _del_horses (horseId)
+            SELECT DISTINCT horseId
+            FROM Owns
+            WHERE ownerId IN (SELECT ownerId FROM _del_owners)
+        """))
+        report.links = cx.execute(text(
+            "DELETE FROM Owns WHERE ownerId IN (SELECT ownerId FROM _del_owners)")).rowcount
+
+    with _timed(report, "orphans"):
+        # keep only candidates nobody else owns (idx_owns_horse)
+        cx.execute(text("""
+            DELETE FROM _del_horses
+            WHERE EXISTS (SELECT 1 FROM Owns o WHERE o.horseId = _del_horses.horseId)
+        """))
+        doomed = cx.execute(text("SELECT horseId FROM _del_horses")).scalars().all()
+
+    with _timed(report, "search"):
+        search.remove(cx, "owner", "SELECT ownerId FROM _del_owners")
+        search.remove(cx, "horse", "SELECT horseId FROM _del_horses")
+
+    with _timed(report, "summaries"):
+        # before the results go: remove_horses reads them
+        for i in range(0, len(doomed), REMOVE_CHUNK):
+            summaries.remove_horses(cx, doomed[i:i + REMOVE_CHUNK])
+
+    with _timed(report, "ratings"):
+        for i in range(0, len(doomed), REMOVE_CHUNK):
+            ratings.remove_horses(cx, doomed[i:i + REMOVE_CHUNK])
+
+    with _timed(report, "facts"):
+        for i in range(0, len(doomed), REMOVE_CHUNK):
+            facts.remove_horses(cx, doomed[i:i + REMOVE_CHUNK])
+
+    with _timed(report, "results"):
+        report.results = cx.execute(text(
+            "DELETE FROM RaceResults WHERE horseId IN (SELECT horseId FROM _del_horses)")).rowcount
+
+    with _timed(report, "horses"):
+        # trg_horse_to_oldinfo archives each row into old_info
+        report.horses = cx.execute(text(
+            "DELETE FROM Horse WHERE horseId IN (SELECT horseId FROM _del_horses)")).rowcount
+
+    with _timed(report, "owners"):
+        report.owners = cx.execute(text(
+            "DELETE FROM Owner WHERE ownerId IN (SELECT ownerId FROM _del_owners)")).rowcount
+
+    with _timed(report, "events"):
+        gone = set(doomed)
+        events = {oid: {"ownerId": oid, "links": 0, "horses": []} for oid in existing}
+        for oid, hid in held:
+            if oid in events:
+                events[oid]["links"] += 1
+                if hid in gone:
+                    events[oid]["horses"].append(hid)
+        outbox.append(cx, "owner_deleted", events.items())
+
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("owner_ids", nargs="+")
+    ap.add_argument("--dry-run", action="store_true", help="roll back instead of committing")
+    args = ap.parse_args()
+
+    with make_engine().connect() as cx:
+        with cx.begin() as tx:
+            report = delete_owners(cx, args.owner_ids)
+            if args.dry_run:
+                tx.rollback()
+    print(report.summary() + (" [rolled back]" if args.dry_run else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""Race-time fact table behind the Winning Trainers and Trainer Winnings reports.
+
+    ResultFacts     (raceId, horseId, trainerId)  one row per result and trainer of the horse's
+                                                  stable at the time the result was recorded
+    TrainerWinnings (trainerId)                   total prize of those rows per trainer
+
+Each row snapshots the race date and track, the horse's stable and its trainers,
+the horse's owners, the finishing position as a number and the prize. The reports
+aggregate this one table through its indexes instead of joining
+RaceResults → Horse → Trainer on the stable the horse is in today. A win stays
+credited to the stable and trainers the horse ran for, however often it moves
+afterwards. A stable with no trainer gets a single row with trainerId ''. A
+result counts once per trainer, so sum prizes per trainer, not across trainers.
+
+ResultFacts is partitioned by season (the year of the race). On MySQL it is one
+table with native RANGE COLUMNS(raceDate) partitions, and the engine prunes the
+seasons a raceDate range doesn't touch. On SQLite every season is a table of its
+own (ResultFacts_2024, ...) and ResultFacts is a UNION ALL view over them for
+ad-hoc reads. The reports don't read the view: source() and page() point a query
+at just the seasons in its date range, and page() walks them newest first,
+stopping as soon as the page is full. A report on one season costs the same
+however many seasons are stored.
+
+record_races() adds the rows (and their prizes to TrainerWinnings) in the same
+transaction as the results, creating the race's season table on SQLite if it is
+the first race of that season. remove_horses() takes deleted horses out of both
+tables. The seasons that have races, this one and the next are created when the
+schema is checked. drop_season() and load_season() move a whole season out to the
+archive and back (hrdb/archive.py); TrainerWinnings only totals the seasons stored here.
+
+backfill() adds the results that have no facts yet (a database from before this
+table, or rows loaded outside the app). It places each horse in the stable
+HorseTransfers says it was in on the race day, and credits that stable's current
+trainers (trainer moves are not recorded). Results of races without a date are
+left out. rebuild() starts over from scratch that way:
+
+    python -m hrdb.facts --rebuild            # --sqlite FILE
+"""
+import argparse
+import re
+import time
+from datetime import date
+
+from sqlalchemy import bindparam, text
+
+from hrdb import queries as Q
+from hrdb.backend import has_table, is_sqlite, make_engine
+from hrdb.paging import Page, keyset_sql, page_params, split_page
+from hrdb.rules import RESULT_OPTIONS
+from hrdb.schema import ensure_indexes
+from hrdb.summaries import upsert_add
+
+FACTS_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+      raceId    VARCHAR(15) NOT NULL,
+      horseId   VARCHAR(15) NOT NULL,
+      trainerId VARCHAR(15) NOT NULL DEFAULT '',
+      raceDate  DATE NOT NULL,
+      trackName VARCHAR(30),
+      stableId  VARCHAR(30),
+      ownerIds  VARCHAR(255),
+      position  INT NULL,
+      prize     DOUBLE NOT NULL DEFAULT 0,
+      PRIMARY KEY (raceId, horseId, trainerId, raceDate)
+    ) {partitions}
+"""
+TRAINER_WINNINGS_DDL = """
+    CREATE TABLE IF NOT EXISTS TrainerWinnings (
+      trainerId  VARCHAR(15) NOT NULL,
+      totalPrize DOUBLE NOT NULL DEFAULT 0,
+      PRIMARY KEY (trainerId)
+    )
+"""
+# (name, columns) of the indexes of ResultFacts, or of every season table on SQLite
+FACT_INDEXES = [
+    ("idx_facts_winners", "position, raceDate DESC, trainerId, raceId, horseId"),  # wins, newest first
+    ("idx_facts_dates",   "raceDate, trainerId, prize"),     # winnings between two dates (covering)
+    ("idx_facts_horse",   "horseId"),                        # facts of deleted horses
+]
+
+# 'first'..'last' -> 1..5 (the finishing order hrdb/ratings.py rates by), 'no show' -> NULL
+PLACES = [p for p in RESULT_OPTIONS if p != "no show"]
+POSITION = "CASE rr.results " + " ".join(f"WHEN '{p}' THEN {n}" for n, p in enumerate(PLACES, start=1)) + " END"
+
+OWNER_IDS = {
+    "mysql": "(SELECT GROUP_CONCAT(o.ownerId ORDER BY o.ownerId SEPARATOR ',') "
+             "FROM Owns o WHERE o.horseId = rr.horseId)",
+    "sqlite": "(SELECT GROUP_CONCAT(ownerId, ',') "
+              "FROM (SELECT o.ownerId FROM Owns o WHERE o.horseId = rr.horseId ORDER BY o.ownerId))",
+}
+
+# Stable of the horse at the end of the race day (as Q.STABLE_ON_DATE, per result)
+DAY_AFTER = {"mysql": "DATE_ADD(r.raceDate, INTERVAL 1 DAY)", "sqlite": "date(r.raceDate, '+1 day')"}
+STABLE_ON_RACE_DAY = """COALESCE(
+        (SELECT toStable FROM HorseTransfers
+         WHERE horseId = rr.horseId AND movedAt < {day_after}
+         ORDER BY movedAt DESC, transferId DESC LIMIT 1),
+        (SELECT fromStable FROM HorseTransfers
+         WHERE horseId = rr.horseId AND movedAt >= {day_after}
+         ORDER BY movedAt, transferId LIMIT 1),
+        h.stableId)"""
+
+# the results of races between :lo and :hi; `where` narrows them down further
+INSERT_FACTS = """
+    INSERT INTO {table} (raceId, horseId, trainerId, raceDate, trackName, stableId, ownerIds, position, prize)
+    SELECT b.raceId, b.horseId, COALESCE(t.trainerId, ''), b.raceDate, b.trackName, b.stableId,
+           b.ownerIds, b.position, b.prize
+    FROM (
+        SELECT rr.raceId, rr.horseId, r.raceDate, r.trackName, {stable} AS stableId,
+               {owners} AS ownerIds, {position} AS position, COALESCE(rr.prize, 0) AS prize
+        FROM RaceResults rr
+        JOIN Race  r ON r.raceId  = rr.raceId
+        JOIN Horse h ON h.horseId = rr.horseId
+        WHERE r.raceDate BETWEEN :lo AND :hi AND {where}
+    ) b
+    LEFT JOIN Trainer t ON t.stableId = b.stableId
+"""
+
+
+def _insert(cx, table: str, stable: str, where: str):
+    dialect = "sqlite" if is_sqlite(cx) else "mysql"
+    return INSERT_FACTS.format(table=table, stable=stable.format(day_after=DAY_AFTER[dialect]),
+                               owners=OWNER_IDS[dialect], position=POSITION, where=where)
+
+
+# ---------- seasons ----------
+def season_dates(season: int) -> tuple[str, str]:
+    """(first, last) day of a season, as ISO dates."""
+    return f"{season:04d}-01-01", f"{season:04d}-12-31"
+
+
+def partition(season: int) -> str:
+    """The SQLite table of a season."""
+    return f"ResultFacts_{season}"
+
+
+_PARTITION_RE = re.compile(r"^ResultFacts_(\d{4})$")
+_FACTS_RE = re.compile(r"\bResultFacts\b")
+
+
+def seasons(cx) -> list[int]:
+    """Seasons that have a table (SQLite), oldest first."""
+    names = cx.execute(text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'ResultFacts%'"))
+    return sorted(int(m.group(1)) for name in names.scalars() if (m := _PARTITION_RE.match(name)))
+
+
+def tables(cx, lo: str = Q.ALL_TIME["lo"], hi: str = Q.ALL_TIME["hi"]) -> list[str]:
+    """The tables holding the facts of races between lo and hi (ISO dates), newest first.
+    On MySQL that is ResultFacts itself, whose partitions the engine prunes."""
+    if not is_sqlite(cx):
+        return ["ResultFacts"]
+    first, last = int(str(lo)[:4]), int(str(hi)[:4])
+    return [partition(s) for s in reversed(seasons(cx)) if first <= s <= last]
+
+
+def union(names: list[str]) -> str:
+    """One table name, or a derived table reading several of them."""
+    if not names:
+        return "ResultFacts"        # no season in range: the (SQLite) view, which finds nothing either
+    if len(names) == 1:
+        return names[0]
+    return "(" + " UNION ALL ".join(f"SELECT * FROM {name}" for name in names) + ")"
+
+
+def source(cx, lo: str = Q.ALL_TIME["lo"], hi: str = Q.ALL_TIME["hi"]) -> str:
+    """What a query should read instead of ResultFacts for races between lo and hi."""
+    return union(tables(cx, lo, hi))
+
+
+def on(sql: str, src: str) -> str:
+    """`sql` reading `src` (from source()) wherever it names ResultFacts."""
+    return _FACTS_RE.sub(src, sql)
+
+
+def page(cx, sql, order, params, after=None, size=50, cold=None) -> Page:
+    """One keyset page of a query on ResultFacts whose order starts with raceDate DESC and whose
+    params carry its :lo / :hi dates (a drop-in for paging.fetch_page). Seasons are read newest
+    first, and only until the page is full. `cold(lo, hi, after, limit)` returns the rows that
+    follow the database's, up to `limit` (the archived seasons, hrdb/archive.py)."""
+    hi = min(str(params["hi"]), str(after[0])) if after is not None else params["hi"]
+    rows = []
+    for table in tables(cx, params["lo"], hi):
+        stmt = keyset_sql(on(Q.pick(sql, cx), table), order, after is not None)
+        result = cx.execute(text(stmt), page_params(params, after, size - len(rows)))
+        rows += [dict(r) for r in result.mappings()]
+        if len(rows) > size:
+            break
+    if cold is not None and len(rows) <= size:
+        rows += cold(params["lo"], params["hi"], after, size + 1 - len(rows))
+    return split_page(rows, order, size)
+
+
+def race_seasons(cx) -> list[int]:
+    """Seasons that have races, oldest first (one probe of idx_race_date per season)."""
+    found, day = [], cx.execute(text("SELECT MIN(raceDate) FROM Race")).scalar()
+    while day is not None:
+        found.append(int(str(day)[:4]))
+        day = cx.execute(text("SELECT MIN(raceDate) FROM Race WHERE raceDate >= :d"),
+                         {"d": f"{found[-1] + 1:04d}-01-01"}).scalar()
+    return found
+
+
+def _seasons_of(cx, race_ids) -> list[int]:
+    rows = cx.execute(text("SELECT DISTINCT raceDate FROM Race WHERE raceId IN :ids AND raceDate IS NOT NULL")
+                      .bindparams(bindparam("ids", expanding=True)), {"ids": list(race_ids)}).scalars()
+    return sorted({int(str(d)[:4]) for d in rows})
+
+
+def _horse_seasons(cx, horse_ids) -> list[int]:
+    rows = cx.execute(text("""
+        SELECT DISTINCT r.raceDate FROM RaceResults rr JOIN Race r ON r.raceId = rr.raceId
+        WHERE rr.horseId IN :ids AND r.raceDate IS NOT NULL
+    """).bindparams(bindparam("ids", expanding=True)), {"ids": list(horse_ids)}).scalars()
+    return sorted({int(str(d)[:4]) for d in rows})
+
+
+def _add_seasons(cx, new):
+    """Create the tables of new seasons (SQLite) and the view over all of them."""
+    for season in new:
+        cx.execute(text(FACTS_DDL.format(table=partition(season), partitions="")))
+    ensure_indexes(cx, [(f"{name}_{season}", partition(season), cols)
+                        for season in new for name, cols in FACT_INDEXES])
+    _create_view(cx)
+
+
+def _create_view(cx):
+    names = [partition(s) for s in seasons(cx)]
+    cx.execute(text("DROP VIEW IF EXISTS ResultFacts"))
+    cx.execute(text("CREATE VIEW ResultFacts AS " + " UNION ALL ".join(f"SELECT * FROM {n}" for n in names)))
+
+
+def targets(cx, wanted) -> list[tuple[str, str, str]]:
+    """(table, lo, hi) to write the facts of races in the `wanted` seasons to, creating
+    the missing season tables on SQLite; (ResultFacts, all time) on MySQL."""
+    if not is_sqlite(cx):
+        return [("ResultFacts", Q.ALL_TIME["lo"], Q.ALL_TIME["hi"])]
+    new = sorted(set(wanted) - set(seasons(cx)))
+    if new:
+        _add_seasons(cx, new)
+    return [(partition(s), *season_dates(s)) for s in sorted(set(wanted))]
+
+
+# ---------- schema ----------
+def _mysql_partitions(cx) -> list[str]:
+    return cx.execute(text("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ResultFacts' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)).scalars().all()
+
+
+def _partition_clause(first: int, last: int) -> str:
+    parts = [f"PARTITION p{s} VALUES LESS THAN ('{s + 1}-01-01')" for s in range(first, last + 1)]
+    return ("PARTITION BY RANGE COLUMNS(raceDate) ("
+            + ", ".join(parts + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + ")")
+
+
+def ensure_partitions(cx):
+    """Make sure every season with races, this one and the next have a partition."""
+    this = date.today().year
+    wanted = sorted(set(race_seasons(cx)) | {this, this + 1})
+    first, last = wanted[0], wanted[-1]      # MySQL: every season in between too
+    if is_sqlite(cx):
+        if has_table(cx, "ResultFacts") and not seasons(cx):
+            _split_flat_table(cx, wanted)
+        targets(cx, wanted)
+        return
+    if not has_table(cx, "ResultFacts"):
+        cx.execute(text(FACTS_DDL.format(table="ResultFacts", partitions=_partition_clause(first, last))))
+    elif not _mysql_partitions(cx):
+        # a table from before the partitioning: raceDate joins the primary key, as MySQL requires
+        cx.execute(text("DELETE FROM ResultFacts WHERE raceDate IS NULL"))
+        cx.execute(text("ALTER TABLE ResultFacts MODIFY raceDate DATE NOT NULL, DROP PRIMARY KEY, "
+                        "ADD PRIMARY KEY (raceId, horseId, trainerId, raceDate)"))
+        cx.execute(text("ALTER TABLE ResultFacts " + _partition_clause(first, last)))
+    else:
+        named = {int(p[1:]) for p in _mysql_partitions(cx) if p[1:].isdigit()}
+        new = list(range(max(named) + 1 if named else first, last + 1))
+        if new:
+            parts = [f"PARTITION p{s} VALUES LESS THAN ('{s + 1}-01-01')" for s in new]
+            cx.execute(text("ALTER TABLE ResultFacts REORGANIZE PARTITION pmax INTO ("
+                            + ", ".join(parts + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + ")"))
+    ensure_indexes(cx, [(name, "ResultFacts", cols) for name, cols in FACT_INDEXES])
+
+
+def _split_flat_table(cx, wanted):
+    """Move the rows of an unpartitioned SQLite ResultFacts into season tables."""
+    cx.execute(text("ALTER TABLE ResultFacts RENAME TO ResultFacts_flat"))
+    for name, _ in FACT_INDEXES:
+        cx.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    found = cx.execute(text("SELECT DISTINCT substr(raceDate, 1, 4) FROM ResultFacts_flat "
+                            "WHERE raceDate IS NOT NULL")).scalars().all()
+    for table, lo, hi in targets(cx, sorted(set(wanted) | {int(s) for s in found})):
+        cx.execute(text(f"INSERT INTO {table} SELECT * FROM ResultFacts_flat WHERE raceDate BETWEEN :lo AND :hi"),
+                   {"lo": lo, "hi": hi})
+    cx.execute(text("DROP TABLE ResultFacts_flat"))
+
+
+def ensure_fact_tables(cx):
+    """Create the fact tables and their seasons; facts that didn't exist yet are backfilled."""
+    missing = not (has_table(cx, "ResultFacts") and has_table(cx, "TrainerWinnings"))
+    cx.execute(text(TRAINER_WINNINGS_DDL))
+    ensure_partitions(cx)
+    if missing:
+        backfill(cx)
+
+
+def backfill(cx) -> int:
+    """Add the facts of every result that has none and total them again;
+    returns the number of fact rows added."""
+    added = 0
+    for table, lo, hi in targets(cx, race_seasons(cx)):
+        added += cx.execute(text(_insert(cx, table, STABLE_ON_RACE_DAY, f"""NOT EXISTS (
+            SELECT 1 FROM {table} f WHERE f.raceId = rr.raceId AND f.horseId = rr.horseId)""")),
+                            {"lo": lo, "hi": hi}).rowcount
+    cx.execute(text("DELETE FROM TrainerWinnings"))
+    cx.execute(text("""
+        INSERT INTO TrainerWinnings (trainerId, totalPrize)
+        SELECT trainerId, SUM(prize)
+        FROM ResultFacts
+        WHERE trainerId <> ''
+        GROUP BY trainerId
+    """))
+    return added
+
+
+def clear(cx):
+    """Delete every fact (the tables stay)."""
+    for table in tables(cx):
+        cx.execute(text(f"DELETE FROM {table}"))
+
+
+def rebuild(cx) -> int:
+    """Drop every fact and backfill them all (loses the recorded trainers of old results)."""
+    clear(cx)
+    return backfill(cx)
+
+
+def insert_rows(cx, names: list[str], rows: list[tuple]):
+    """Insert fact rows given as tuples of the `names` columns, each into its season (snapshot restores)."""
+    if is_sqlite(cx):
+        at, by_season = names.index("raceDate"), {}
+        for row in rows:
+            by_season.setdefault(int(str(row[at])[:4]), []).append(row)
+        groups = {table: by_season[int(lo[:4])] for table, lo, _ in targets(cx, by_season)}
+    else:
+        groups = {"ResultFacts": rows}
+    mark = "?" if is_sqlite(cx) else "%s"
+    for table, part in groups.items():
+        cx.exec_driver_sql(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join([mark] * len(names))})",
+                           part)
+
+
+# ---------- incremental maintenance ----------
+def record_races(cx, race_ids):
+    """Snapshot newly inserted races: their results with the horses' current stables,
+    trainers and owners."""
+    if not race_ids:
+        return
+    ids = {"ids": list(race_ids)}
+    written = []
+    for table, lo, hi in targets(cx, _seasons_of(cx, race_ids)):
+        cx.execute(text(_insert(cx, table, "h.stableId", "rr.raceId IN :ids"))
+                   .bindparams(bindparam("ids", expanding=True)), {**ids, "lo": lo, "hi": hi})
+        written.append(table)
+    upsert_add(cx, "TrainerWinnings", "trainerId", ["totalPrize"], f"""
+        SELECT trainerId, SUM(prize) AS totalPrize
+        FROM {union(written)} f WHERE raceId IN :ids AND trainerId <> ''
+        GROUP BY trainerId
+    """, ids)
+
+
+def remove_horses(cx, horse_ids):
+    """Drop the facts of horses that are being deleted (before their results, which say
+    what seasons to look in)."""
+    if not horse_ids:
+        return
+    ids = {"ids": list(horse_ids)}
+    if is_sqlite(cx):
+        raced = set(_horse_seasons(cx, horse_ids))
+        names = [partition(s) for s in reversed(seasons(cx)) if s in raced]
+    else:
+        names = tables(cx)
+    if not names:
+        return
+    trainers = cx.execute(text(f"""
+        SELECT trainerId AS tid, SUM(prize) AS p
+        FROM {union(names)} f
+        WHERE horseId IN :ids AND trainerId <> ''
+        GROUP BY trainerId
+    """).bindparams(bindparam("ids", expanding=True)), ids).mappings().all()
+    if trainers:
+        cx.execute(text("UPDATE TrainerWinnings SET totalPrize = totalPrize - :p WHERE trainerId = :tid"),
+                   [dict(r) for r in trainers])
+    for table in names:
+        cx.execute(text(f"DELETE FROM {table} WHERE horseId IN :ids")
+                   .bindparams(bindparam("ids", expanding=True)), ids)
+
+
+# ---------- archived seasons (hrdb/archive.py) ----------
+def drop_season(cx, season: int):
+    """Take the facts of a season that was archived out, and their prizes out of TrainerWinnings.
+    On SQLite its table is dropped. MySQL deletes the rows: dropping a partition would
+    commit the transaction."""
+    lo, hi = season_dates(season)
+    names = tables(cx, lo, hi)
+    if not names:
+        return
+    dates = {"lo": lo, "hi": hi}
+    trainers = cx.execute(text(f"""
+        SELECT trainerId AS tid, SUM(prize) AS p
+        FROM {union(names)} f
+        WHERE raceDate BETWEEN :lo AND :hi AND trainerId <> ''
+        GROUP BY trainerId
+    """), dates).mappings().all()
+    if trainers:
+        cx.execute(text("UPDATE TrainerWinnings SET totalPrize = totalPrize - :p WHERE trainerId = :tid"),
+                   [dict(r) for r in trainers])
+    if is_sqlite(cx):
+        cx.execute(text(f"DROP TABLE {partition(season)}"))
+        _create_view(cx)
+    else:
+        cx.execute(text("DELETE FROM ResultFacts WHERE raceDate BETWEEN :lo AND :hi"), dates)
+
+
+def load_season(cx, season: int, names: list[str], rows: list[tuple]):
+    """Put back the facts of an archived season (every row of it at once) and add their
+    prizes to TrainerWinnings."""
+    lo, hi = season_dates(season)
+    if rows:
+        insert_rows(cx, names, rows)
+    upsert_add(cx, "TrainerWinnings", "trainerId", ["totalPrize"], f"""
+        SELECT trainerId, SUM(prize) AS totalPrize
+        FROM {source(cx, lo, hi)} f WHERE raceDate BETWEEN :lo AND :hi AND trainerId <> ''
+        GROUP BY trainerId
+    """, {"lo": lo, "hi": hi})
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rebuild", action="store_true", help="drop every fact and backfill them all")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+    if not args.rebuild:
+        ap.print_help()
+        return
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    t0 = time.perf_counter()
+    with engine.begin() as cx:
+        ensure_fact_tables(cx)
+        rows = rebuild(cx)
+        found = seasons(cx) if is_sqlite(cx) else _mysql_partitions(cx)
+    print(f"{rows:,} fact rows in {len(found)} seasons in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
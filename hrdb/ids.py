@@ -0,0 +1,110 @@
+"""Race / trainer ID allocator.
+
+IDs used to come from MAX(CAST(SUBSTRING(id, n) AS UNSIGNED)) + 1, a full scan
+that two admins could run at the same moment and both get the same answer.
+Instead one row per sequence in IdSequences holds the next free number, and a
+caller reserves a block with a single-row UPDATE (row lock on MySQL, the write
+lock on SQLite), so every reservation is O(1) and unique across processes.
+Unused numbers of a block are simply skipped.
+
+The table is seeded once from the existing IDs (and re-seeded after a reload):
+
+    python -m hrdb.ids --seed
+"""
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from hrdb import concurrency
+from hrdb import queries as Q
+from hrdb.backend import has_table, make_engine
+
+# sequence name -> (query giving the highest number in use, ID prefix)
+SEQUENCES = {
+    "race": (Q.NEXT_RACE_NUM, "race"),
+    "trainer": (Q.NEXT_TRAINER_NUM, "trainer"),
+}
+
+ID_SEQUENCES_DDL = """
+    CREATE TABLE IF NOT EXISTS IdSequences (
+      name      VARCHAR(30) NOT NULL,
+      nextValue BIGINT NOT NULL,
+      PRIMARY KEY (name)
+    )
+"""
+
+NEXT_VALUE = "SELECT nextValue FROM IdSequences WHERE name = :n"
+
+
+def _highest_in_use(cx, name: str) -> int:
+    return int(cx.execute(text(Q.pick(SEQUENCES[name][0], cx))).scalar() or 0)
+
+
+def ensure_sequences(engine):
+    """Create IdSequences and seed any missing sequence from the IDs already in use."""
+    with engine.begin() as cx:
+        cx.execute(text(ID_SEQUENCES_DDL))
+        have = set(cx.execute(text("SELECT name FROM IdSequences")).scalars())
+    for name in SEQUENCES:
+        if name in have:
+            continue
+        try:
+            with engine.begin() as cx:
+                cx.execute(text("INSERT INTO IdSequences (name, nextValue) VALUES (:n, :v)"),
+                           {"n": name, "v": _highest_in_use(cx, name) + 1})
+        except IntegrityError:
+            pass  # another process seeded it first
+
+
+def reseed(cx):
+    """Move every sequence past the highest ID in use (after db.sql reloads / restores)."""
+    if not has_table(cx, "IdSequences"):
+        return
+    for name in SEQUENCES:
+        floor = _highest_in_use(cx, name) + 1
+        cx.execute(text("UPDATE IdSequences SET nextValue = :v WHERE name = :n AND nextValue < :v"),
+                   {"n": name, "v": floor})
+
+
+def reserve(engine, name: str, count: int = 1) -> int:
+    """Reserve `count` consecutive numbers and return the first one.
+
+    Runs in its own short transaction so the sequence row is locked only for
+    the UPDATE, not for the caller's whole write.
+    """
+    def bump(cx):
+        cx.execute(text("UPDATE IdSequences SET nextValue = nextValue + :c WHERE name = :n"),
+                   {"c": count, "n": name})
+        return cx.execute(text(NEXT_VALUE), {"n": name}).scalar()
+
+    end = concurrency.transact(engine, "reserve_ids", bump)     # retried on lock errors
+    if end is None:
+        raise RuntimeError(f"ID sequence {name!r} is missing; run ensure_sequences() first")
+    return int(end) - count
+
+
+def new_ids(engine, name: str, count: int = 1) -> list[str]:
+    """`count` fresh IDs like race37, race38, ..."""
+    first = reserve(engine, name, count)
+    prefix = SEQUENCES[name][1]
+    return [f"{prefix}{n}" for n in range(first, first + count)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seed", action="store_true", help="create/seed IdSequences from the existing IDs")
+    args = ap.parse_args()
+    if not args.seed:
+        ap.print_help()
+        return
+    engine = make_engine()
+    ensure_sequences(engine)
+    with engine.begin() as cx:
+        reseed(cx)
+        for name, value in cx.execute(text("SELECT name, nextValue FROM IdSequences ORDER BY name")):
+            print(f"  {name:<10} next = {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Live leaderboard: trainer wins and winnings of a period, kept current from the outbox.
+
+Trainer Winners and Trainer Winnings aggregate the whole period on every press.
+A viewer of the live page loads the leaderboard once instead: one aggregate
+over the period's ResultFacts, read in the same transaction as the outbox
+head (hrdb/outbox.py), so it is exactly the state as of that sequence
+number. After that each refresh asks only for what changed since:
+
+- the race_created events after the viewer's sequence number (a range of the
+  ChangeEvents primary key; usually empty);
+- for the new races in the period, their results per trainer (a primary-key
+  probe of ResultFacts per race).
+
+The viewer adds those to the rows it holds (merge()). A race's results are
+committed with its race_created event, so each race is counted exactly once.
+Events that take results away or replace them (owner_deleted,
+season_archived, season_restored, data_reset) make the viewer load the
+leaderboard again, as does a sequence number the outbox has not reached or
+events pruned (hrdb/outbox.py prune) before the viewer read them. Horse moves don't change it: the facts keep the trainer a
+horse raced for.
+
+    python -m hrdb.leaderboard --season 2025 --follow     # prints the changes as they come
+"""
+import argparse
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import bindparam, text
+
+from hrdb import facts, outbox
+from hrdb import queries as Q
+from hrdb.backend import make_engine
+
+BATCH = 500   # events per refresh; the rest comes with the next one
+RELOAD_ON = ["owner_deleted", "season_archived", "season_restored", "data_reset"]
+KINDS = ["race_created"] + RELOAD_ON
+
+
+@dataclass
+class Changes:
+    seq: int                                    # the sequence number the viewer is at now
+    rows: list = field(default_factory=list)    # per trainer: wins / winnings / runs to add
+    races: list = field(default_factory=list)   # race_created payloads of the new races in the period
+    reload: bool = False                        # results were taken away: load() again
+    more: bool = False                          # BATCH reached: ask again right away
+
+
+def _rows(cx, sql, lo: str, hi: str, race_ids=None) -> list[dict]:
+    stmt = text(facts.on(Q.pick(sql, cx), facts.source(cx, lo, hi)))
+    params = {"lo": lo, "hi": hi}
+    if race_ids is not None:
+        stmt = stmt.bindparams(bindparam("ids", expanding=True))
+        params["ids"] = race_ids
+    return [dict(r) for r in cx.execute(stmt, params).mappings()]
+
+
+def load(cx, lo: str, hi: str) -> tuple[list[dict], int]:
+    """(rows per trainer, outbox sequence number they are current as of) for races between lo and hi.
+    Both are read in the connection's transaction, so they see the same snapshot."""
+    seq = outbox.head(cx)
+    return _rows(cx, Q.LEADERBOARD, lo, hi), seq
+
+
+def changes(cx, after: int, lo: str, hi: str, limit: int = BATCH) -> Changes:
+    """What changed in the leaderboard of lo..hi since sequence number `after`."""
+    head = outbox.head(cx)      # before the events: everything up to it is in the read below
+    if head < after:            # the viewer is ahead of this outbox (another database, an old copy)
+        return Changes(head, reload=True)
+    if head > after and outbox.oldest(cx) > after + 1:     # pruned before this viewer read them
+        return Changes(head, reload=True)
+    events = outbox.read(cx, after, limit, KINDS)
+    more = len(events) == limit
+    out = Changes(events[-1].seq if more else max([head] + [e.seq for e in events]), more=more)
+    if any(e.kind in RELOAD_ON for e in events):
+        out.reload = True
+        return out
+    out.races = [e.payload for e in events if lo <= e.payload["raceDate"] <= hi]
+    if out.races:
+        out.rows = _rows(cx, Q.LEADERBOARD_RACES, lo, hi, [r["raceId"] for r in out.races])
+    return out
+
+
+def merge(board: dict, rows: list[dict]) -> set:
+    """Add per-trainer `rows` to `board` ({trainerId: row}); returns the trainerIds that changed."""
+    for r in rows:
+        have = board.get(r["trainerId"])
+        if have is None:
+            board[r["trainerId"]] = dict(r)
+        else:
+            for col in ("wins", "winnings", "runs"):
+                have[col] += r[col]
+    return {r["trainerId"] for r in rows}
+
+
+def ranked(board: dict) -> list[dict]:
+    """The leaderboard, most winnings first (then most wins, then name)."""
+    return sorted(board.values(), key=lambda r: (-r["winnings"], -r["wins"], r["trainer"]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--season", type=int, help="default: every stored race")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--follow", action="store_true", help="keep refreshing")
+    ap.add_argument("--interval", type=float, default=2.0, help="--follow: seconds between refreshes")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    from hrdb.bootstrap import bootstrap
+    bootstrap(engine)
+    lo, hi = facts.season_dates(args.season) if args.season else (Q.ALL_TIME["lo"], Q.ALL_TIME["hi"])
+
+    def show(board, seq):
+        print(f"as of event #{seq}:")
+        for i, r in enumerate(ranked(board)[:args.top], start=1):
+            print(f"  {i:>3}. {r['trainer']:<30} {r['wins']:>5} wins  {r['winnings']:>14,.2f}")
+
+    with engine.connect() as cx:
+        rows, seq = load(cx, lo, hi)
+    board = {r["trainerId"]: r for r in rows}
+    show(board, seq)
+    while args.follow:
+        time.sleep(args.interval)
+        with engine.connect() as cx:
+            delta = changes(cx, seq, lo, hi)
+            if delta.reload:
+                rows, seq = load(cx, lo, hi)
+        if delta.reload:
+            board = {r["trainerId"]: r for r in rows}
+            show(board, seq)
+            continue
+        seq = delta.seq
+        if delta.races:
+            merge(board, delta.rows)
+            for race in delta.races:
+                print(f"new: {race['raceName'] or race['raceId']} at {race['trackName']} ({race['raceDate']})")
+            show(board, seq)
+
+
+if __name__ == "__main__":
+    main()
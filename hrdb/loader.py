@@ -0,0 +1,381 @@
+"""Streaming loader for SQL scripts and dumps (db.sql, mysqldump, sqlite3 .dump).
+
+The script is read in chunks and split into statements by a tokenizer that
+knows about quoted strings and identifiers and -- / # / block comments (a ';'
+inside 'a;b' no longer ends a statement). Statements are then handled by kind:
+
+- INSERT ... VALUES: consecutive INSERTs into a table are merged into one
+  multi-row INSERT of about `batch_bytes` of SQL (the VALUES lists are joined
+  as text; nothing is re-parsed or re-quoted). On MySQL the tables are spread
+  over `workers` connections and load in parallel; a table always stays on
+  one connection, so its rows keep their order. SQLite has a single writer:
+  it always loads serially. Upserts (ON DUPLICATE KEY) run as written.
+- CREATE INDEX / ALTER TABLE ... ADD KEY/INDEX/FOREIGN KEY: deferred until
+  all rows are in (building an index once is cheaper than maintaining it).
+- anything else (DROP/CREATE TABLE, ...): run in order, after the queued rows
+  are written.
+
+Foreign-key checks are off during the load and the loaded tables are checked
+once at the end (LoadReport.fk_violations). On SQLite the whole script runs in
+one transaction, as before. MySQL commits DDL implicitly anyway, so there each
+batch commits on its own.
+
+Not supported: DELIMITER (stored programs in dumps); MySQL's /*! ... */
+version comments are treated as comments.
+
+    python -m hrdb.loader db.sql
+    python -m hrdb.loader dump.sql.gz --workers 8 --batch-kb 4096
+"""
+import argparse
+import codecs
+import gzip
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import inspect, text
+
+from hrdb.backend import ROOT, fk_checks_off, is_sqlite, make_engine
+
+CHUNK = 1 << 20          # bytes read at a time
+BATCH_BYTES = 1 << 20    # SQL text per multi-row INSERT (MySQL's max_allowed_packet is 4 MB+)
+WORKERS = 4
+PROGRESS_EVERY = 0.5     # seconds between progress() calls
+
+# statements the loader handles itself (it owns the transactions) or that don't apply
+SKIP = ("BEGIN", "COMMIT", "START TRANSACTION", "ROLLBACK", "LOCK TABLES", "UNLOCK TABLES")
+SKIP_SQLITE = ("CREATE DATABASE", "USE ")     # SQLite has a single database per file
+
+# ---------- tokenizer ----------
+def _run(sqlite: bool):
+    """Longest run of statement text (quoted literals included) without ; or a comment."""
+    # literals as "unrolled loops" (linear even when the closing quote is missing)
+    if sqlite:
+        lit = r"'[^']*(?:''[^']*)*'|\"[^\"]*(?:\"\"[^\"]*)*\""
+    else:
+        lit = r"'[^'\\]*(?:(?:\\.|'')[^'\\]*)*'|\"[^\"\\]*(?:(?:\\.|\"\")[^\"\\]*)*\""
+    return re.compile(r"(?:[^;'\"`#/\-]+|" + lit + r"|`[^`]*(?:``[^`]*)*`|-(?!-)|/(?!\*))*", re.S)
+
+
+_RUN = {sq: _run(sq) for sq in (False, True)}
+
+
+def _chunks(source):
+    """(text, bytes read so far) chunks of a path (.gz ok) or an open file."""
+    if hasattr(source, "read"):
+        f, close = source, False
+    else:
+        path = Path(source)
+        f, close = (gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")), True
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    done = 0
+    try:
+        while True:
+            raw = f.read(CHUNK)
+            if not raw:
+                break
+            if isinstance(raw, str):     # text-mode file
+                done += len(raw)
+                yield raw, done
+                continue
+            done += len(raw)
+            yield decoder.decode(raw), done
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail, done
+    finally:
+        if close:
+            f.close()
+
+
+def statements(source, sqlite: bool = False):
+    """Yield (statement, bytes read) for each statement of the script, comments removed."""
+    run = _RUN[sqlite]
+    chunks = _chunks(source)
+    buf, done = "", 0
+    start = 0        # the current statement (after its last comment) starts at buf[start]
+    parts = []       # pieces of the current statement before a comment
+
+    def more() -> bool:
+        """Append the next chunk, dropping what was already consumed."""
+        nonlocal buf, done, start
+        for piece, done in chunks:
+            buf, start = buf[start:] + piece, 0
+            return True
+        return False
+
+    def finish(stmt):
+        stmt = stmt.strip()
+        if stmt[:9].upper() == "DELIMITER":
+            raise ValueError("DELIMITER is not supported by the loader")
+        return stmt
+
+    pos = 0
+    while True:
+        pos = run.match(buf, pos).end()
+        nxt = buf[pos:pos + 2]
+        if nxt[:1] == ";":
+            stmt = finish("".join(parts) + buf[start:pos])
+            parts, start = [], pos + 1
+            pos = start
+            if stmt:
+                yield stmt, done
+            continue
+
+        closer = "*/" if nxt == "/*" else "\n" if nxt[:1] == "#" or nxt == "--" else None
+        end = buf.find(closer, pos + 2) if closer else -1
+        if end >= 0:                                  # drop the comment
+            parts.append(buf[start:pos] + " ")
+            start = pos = end + len(closer)
+            continue
+
+        # end of the buffer, in a literal or a comment: rescan the statement with the next chunk
+        # (a literal that seemed to end at the edge may go on: 'it'|'s')
+        if more():
+            pos = start
+            continue
+        if nxt[:1] in ("'", '"', "`"):
+            raise ValueError(f"unterminated {nxt[:1]} literal near: {buf[pos:pos + 60]!r}")
+        stmt = finish("".join(parts) + buf[start:pos])
+        if stmt:
+            yield stmt, done
+        return
+
+
+# ---------- statement kinds ----------
+_INSERT_HEAD = re.compile(
+    r"(?:INSERT(?:\s+IGNORE)?|REPLACE)\s+INTO\s+(?P<table>`[^`]+`|\"[^\"]+\"|\[[^\]]+\]|[\w.]+)"
+    r"\s*(?:\([^)]*\))?\s*VALUES\s*(?=\()", re.I)
+_ON_DUPLICATE = re.compile(r"\bON\s+(?:DUPLICATE|CONFLICT)\b", re.I)
+_DEFERRED = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\b|ALTER\s+TABLE\b.*\bADD\s+"
+                       r"(?:UNIQUE|INDEX|KEY|CONSTRAINT|FOREIGN\s+KEY|FULLTEXT|SPATIAL)\b", re.I | re.S)
+RAW = {"no_parameters": True}    # run the SQL as written (no %-formatting by pymysql)
+
+
+def _unquote(name: str) -> str:
+    return name.strip('`"[]').split(".")[-1]
+
+
+# ---------- loading ----------
+@dataclass
+class LoadReport:
+    statements: int = 0
+    rows: int = 0
+    tables: set = field(default_factory=set)
+    deferred: int = 0
+    bytes_read: int = 0
+    total_bytes: int | None = None
+    seconds: float = 0.0
+    fk_violations: list = field(default_factory=list)   # (table, columns, parent table, orphan rows)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        fk = (f"; {sum(v[3] for v in self.fk_violations):,} row(s) break foreign keys"
+              if self.fk_violations else "")
+        return (f"{self.statements:,} statements, {self.rows:,} rows into {len(self.tables)} table(s) "
+                f"in {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/sec){fk}")
+
+
+class _Batch:
+    """INSERTs with the same head (table and column list), merged into one multi-row INSERT."""
+
+    def __init__(self, table: str, head: str):
+        self.table, self.head = table, head
+        self.values = []
+        self.size = 0
+
+    def add(self, values: str):
+        self.values.append(values)
+        self.size += len(values)
+
+    def sql(self) -> str:
+        return self.head + ",\n".join(self.values)
+
+
+class _Lanes:
+    """Worker connections: each table's batches run in order on one of them."""
+
+    def __init__(self, engine, workers: int, report: LoadReport):
+        self.engine = engine
+        self.report = report
+        self.pools = [ThreadPoolExecutor(1, thread_name_prefix=f"load{i}") for i in range(workers)]
+        self.conns = [None] * workers
+        self.lane_of = {}
+        self.pending = []
+        self.slots = threading.BoundedSemaphore(workers * 4)   # batches in flight (bounded memory)
+        self.lock = threading.Lock()
+
+    def _cx(self, i):
+        if self.conns[i] is None:
+            cx = self.engine.connect()
+            cx.exec_driver_sql("SET FOREIGN_KEY_CHECKS=0")
+            cx.exec_driver_sql("SET UNIQUE_CHECKS=0")
+            cx.commit()
+            self.conns[i] = cx
+        return self.conns[i]
+
+    def _run(self, i, sql: str):
+        try:
+            cx = self._cx(i)
+            with cx.begin():
+                n = cx.exec_driver_sql(sql, execution_options=RAW).rowcount
+            with self.lock:
+                self.report.rows += max(n, 0)
+        finally:
+            self.slots.release()
+
+    def submit(self, table: str, sql: str):
+        i = self.lane_of.setdefault(table, len(self.lane_of) % len(self.pools))
+        self.slots.acquire()
+        self.pending.append(self.pools[i].submit(self._run, i, sql))
+
+    def wait(self):
+        pending, self.pending = self.pending, []
+        for f in pending:
+            f.result()      # re-raises a worker's error
+
+    def close(self):
+        for p in self.pools:
+            p.shutdown(wait=True)
+        for cx in self.conns:
+            if cx is not None:
+                cx.exec_driver_sql("SET FOREIGN_KEY_CHECKS=1")
+                cx.exec_driver_sql("SET UNIQUE_CHECKS=1")
+                cx.close()
+
+
+def check_foreign_keys(cx, tables) -> list[tuple]:
+    """(table, column, parent table, orphan rows) for every foreign key of `tables` that is broken."""
+    insp = inspect(cx)
+    out = []
+    for table in sorted(tables):
+        if not insp.has_table(table):
+            continue
+        for fk in insp.get_foreign_keys(table):
+            cols, parent, pcols = fk["constrained_columns"], fk["referred_table"], fk["referred_columns"]
+            if not pcols:
+                pcols = insp.get_pk_constraint(parent)["constrained_columns"]
+            on = " AND ".join(f"p.{p} = c.{c}" for c, p in zip(cols, pcols))
+            not_null = " AND ".join(f"c.{c} IS NOT NULL" for c in cols)
+            n = cx.execute(text(f"""
+                SELECT COUNT(*) FROM {table} c
+                WHERE {not_null} AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE {on})
+            """)).scalar()
+            if n:
+                out.append((table, ", ".join(cols), parent, n))
+    return out
+
+
+def load_script(engine, source=ROOT / "db.sql", *, ddl_only: bool = False, workers: int = WORKERS,
+                batch_bytes: int = BATCH_BYTES, check_fks: bool = True, progress=None) -> LoadReport:
+    """Run a SQL script/dump; ddl_only=True skips the INSERTs (empty schema, e.g. for
+    generated data). `progress(report)` is called every PROGRESS_EVERY seconds and at the end."""
+    sqlite = is_sqlite(engine)
+    report = LoadReport()
+    if not hasattr(source, "read"):
+        report.total_bytes = Path(source).stat().st_size
+    t0 = last = time.perf_counter()
+    batches = {}            # INSERT ... VALUES head -> _Batch being filled
+    deferred = []
+
+    with fk_checks_off(engine) as cx:
+        lanes = _Lanes(engine, workers, report) if not sqlite and workers > 1 else None
+
+        def write(table, sql):
+            if lanes is not None:
+                lanes.submit(table, sql)
+            else:
+                report.rows += max(cx.exec_driver_sql(sql, execution_options=RAW).rowcount, 0)
+
+        def flush(head):
+            batch = batches.pop(head, None)
+            if batch is not None and batch.values:
+                write(batch.table, batch.sql())
+
+        def barrier():
+            for head in list(batches):
+                flush(head)
+            if lanes is not None:
+                lanes.wait()
+
+        try:
+            for stmt, report.bytes_read in statements(source, sqlite):
+                report.statements += 1
+                m = _INSERT_HEAD.match(stmt)
+                if m:
+                    if ddl_only:
+                        continue
+                    head, values = stmt[:m.end()], stmt[m.end():]
+                    batch = batches.get(head)
+                    if batch is None:
+                        table = _unquote(m.group("table"))
+                        report.tables.add(table)
+                        batch = batches[head] = _Batch(table, head)
+                    if _ON_DUPLICATE.search(values):
+                        flush(head)             # upserts can't be merged: run as written
+                        write(batch.table, stmt)
+                        continue
+                    batch.add(values)
+                    if batch.size >= batch_bytes:
+                        flush(head)
+                elif _DEFERRED.match(stmt):
+                    deferred.append(stmt)
+                else:
+                    upper = stmt[:20].upper()
+                    if upper.startswith(SKIP) or (sqlite and upper.startswith(SKIP_SQLITE)):
+                        continue
+                    barrier()
+                    cx.exec_driver_sql(stmt, execution_options=RAW)
+
+                if progress and not report.statements % 1000 and time.perf_counter() - last >= PROGRESS_EVERY:
+                    last = time.perf_counter()
+                    report.seconds = last - t0
+                    progress(report)
+            barrier()
+        finally:
+            if lanes is not None:
+                lanes.close()
+
+        for stmt in deferred:
+            cx.exec_driver_sql(stmt, execution_options=RAW)
+        report.deferred = len(deferred)
+        if check_fks and report.tables:
+            report.fk_violations = check_foreign_keys(cx, report.tables)
+
+    report.seconds = time.perf_counter() - t0
+    if progress:
+        progress(report)
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("script", nargs="?", default=str(ROOT / "db.sql"), help="SQL file (.sql or .sql.gz)")
+    ap.add_argument("--sqlite", help="load into this SQLite file instead of the configured backend")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="parallel connections (MySQL)")
+    ap.add_argument("--batch-kb", type=int, default=BATCH_BYTES >> 10, help="SQL text per multi-row INSERT")
+    ap.add_argument("--ddl-only", action="store_true", help="skip the INSERTs")
+    ap.add_argument("--no-fk-check", action="store_true", help="skip the foreign-key check at the end")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+
+    def show(r: LoadReport):
+        pct = f"{100 * r.bytes_read / r.total_bytes:5.1f}%  " if r.total_bytes else ""
+        print(f"  {pct}{r.rows:>12,} rows  {r.rows_per_sec:>10,.0f} rows/sec")
+
+    report = load_script(engine, args.script, ddl_only=args.ddl_only, workers=args.workers,
+                         batch_bytes=args.batch_kb << 10, check_fks=not args.no_fk_check, progress=show)
+    print(report.summary())
+    for table, cols, parent, n in report.fk_violations:
+        print(f"  {table}({cols}) -> {parent}: {n:,} orphan row(s)")
+
+
+if __name__ == "__main__":
+    main()
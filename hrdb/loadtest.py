@@ -0,0 +1,257 @@
+"""Load test of the admin pages: how many concurrent admin sessions one server process sustains.
+
+Starts `streamlit run app.py` headless on a scratch SQLite copy and opens N
+sessions over its websocket, as N browser tabs would. Each session logs in
+as admin, opens one page and keeps clicking through one scenario:
+- approve (default): approve or reject the application it is looking at
+- move: move its own horse to the next stable
+
+For every click the harness records the time until the page is interactive
+again, any st.rerun() included. A level of concurrency is sustained while the
+p95 of that latency stays within --budget-ms. Needs streamlit (the app's own
+dependency; it brings websockets and the message protos).
+
+It writes to the database, so use a scratch copy (pending applications are
+seeded). To compare with another version of the page script, pass it with --app:
+
+    git show HEAD~1:app.py > /tmp/before_app.py
+    python -m hrdb.loadtest --sqlite /tmp/load.sqlite --app /tmp/before_app.py
+    python -m hrdb.loadtest --sqlite /tmp/load.sqlite
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from sqlalchemy import text
+
+from hrdb.backend import ROOT, make_engine
+from hrdb.bootstrap import bootstrap
+
+SCENARIOS = {"approve": "Approve Trainer", "move": "Move Horses"}   # scenario -> admin home button
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))] if values else 0.0
+
+
+def seed_applications(engine, count: int):
+    """Make sure at least `count` applications are pending."""
+    with engine.begin() as cx:
+        pending = cx.execute(text("SELECT COUNT(*) FROM TrainerApplications WHERE status = 'pending'")).scalar()
+        stables = cx.execute(text("SELECT stableId FROM Stable ORDER BY stableId")).scalars().all()
+        if pending < count:
+            cx.execute(text("INSERT INTO TrainerApplications (fname, lname, stableId) VALUES ('Load', :ln, :sid)"),
+                       [{"ln": f"Test{i}", "sid": stables[i % len(stables)]} for i in range(count - pending)])
+
+
+# ---------- one browser session ----------
+class Session:
+    """A websocket session speaking the Streamlit protocol: sends reruns with
+    widget values and collects the elements of the run that follows."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.values = {}     # widget id -> (WidgetState field, value) kept across reruns
+        self.elements = []   # (type, proto) of the latest complete run
+        self.page_hash = ""
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+        self.ws = await connect(self.url.replace("http", "ws", 1) + "/_stcore/stream",
+                                max_size=None, compression=None)
+        await self.rerun()
+
+    async def rerun(self, trigger: str | None = None):
+        """Rerun the script (clicking button `trigger`) and wait until it has finished,
+        including the reruns it requests."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.page_script_hash = self.page_hash
+        for wid, (field, value) in self.values.items():
+            w = state.widget_states.widgets.add()
+            w.id = wid
+            if field == "string_array_value":
+                w.string_array_value.data.extend(value)
+            else:
+                setattr(w, field, value)
+        if trigger:
+            w = state.widget_states.widgets.add()
+            w.id, w.trigger_value = trigger, True
+        await self.ws.send(msg.SerializeToString())
+
+        elements = []
+        while True:
+            raw = await self.ws.recv()
+            fwd = ForwardMsg()
+            fwd.ParseFromString(raw)
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                elements = []
+                self.page_hash = fwd.new_session.page_script_hash or self.page_hash
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                el = fwd.delta.new_element
+                name = el.WhichOneof("type")
+                elements.append((name, getattr(el, name)))
+            elif kind == "script_finished" and fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                self.elements = elements
+                return
+
+    def find(self, kind: str, label: str):
+        for k, p in self.elements:
+            if k == kind and p.label == label:
+                return p
+        raise LookupError(f"no {kind} {label!r} on the page")
+
+    def set(self, kind: str, label: str, value):
+        widget = self.find(kind, label)
+        self.values[widget.id] = ("string_array_value", value) if kind == "multiselect" else ("string_value", value)
+        return widget
+
+    async def click(self, label: str):
+        await self.rerun(self.find("button", label).id)
+
+    def outcome(self) -> tuple[str, str]:
+        """("ok" | "conflict" | "error", message) for the page after a click."""
+        for k, p in self.elements:
+            if k == "exception" or (k == "alert" and p.format == 1):   # Alert.ERROR
+                return "error", p.message if k == "exception" else p.body
+        warnings = [p.body for k, p in self.elements if k == "alert" and p.format == 2]   # Alert.WARNING
+        return ("conflict", warnings[0]) if warnings else ("ok", "")
+
+
+def _own(options, n: int, sessions: int):
+    """The option session `n` works on: applications are split by appId so that
+    sessions only collide when they run out of their own."""
+    mine = [o for o in options if o.startswith("[App #") and int(o[6:o.index("]")]) % sessions == n]
+    return (mine or options)[n % len(mine or options)]
+
+
+async def _open(url: str, scenario: str) -> Session:
+    """A session logged in as admin, on the scenario's page."""
+    s = Session(url)
+    await s.connect()
+    s.set("selectbox", "Select your role", "Admin")
+    await s.rerun()
+    await s.click(SCENARIOS[scenario])
+    return s
+
+
+async def _clicks(s: Session, scenario: str, n: int, sessions: int, until: float) -> list[tuple[float, str, str]]:
+    clicks, i = [], 0
+    while time.time() < until:
+        try:
+            if scenario == "approve":
+                box = s.find("selectbox", "Select an application to review")
+                s.set("selectbox", box.label, _own(box.options, n, sessions))
+                await s.rerun()
+                label = "Approve Trainer" if i % 2 == 0 else "Reject Trainer"
+            else:
+                horses = s.find("multiselect", "Select the horses to move")
+                s.set("multiselect", horses.label, [horses.options[n % len(horses.options)]])
+                await s.rerun()
+                dest = s.find("selectbox", "Select destination stable")
+                s.set("selectbox", dest.label, dest.options[i % len(dest.options)])
+                label = "Move 1 horse(s)"
+            t0 = time.perf_counter()
+            await s.click(label)
+            clicks.append(((time.perf_counter() - t0) * 1000, *s.outcome()))
+        except LookupError:       # nothing to click (e.g. no pending application left): reload
+            await s.rerun()
+        i += 1
+    return clicks
+
+
+async def run_level(url: str, scenario: str, sessions: int, seconds: float) -> dict:
+    opened = await asyncio.gather(*[_open(url, scenario) for _ in range(sessions)])
+    until = time.time() + seconds
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[_clicks(s, scenario, n, sessions, until) for n, s in enumerate(opened)])
+    elapsed = time.perf_counter() - t0
+    for s in opened:
+        await s.ws.close()
+    clicks = [c for r in results for c in r]
+    ms = [c[0] for c in clicks]
+    return {
+        "sessions": sessions,
+        "clicks": len(clicks),
+        "clicks/sec": round(len(clicks) / elapsed, 1),
+        "p50 ms": round(_percentile(ms, 0.50)),
+        "p95 ms": round(_percentile(ms, 0.95)),
+        "max ms": round(max(ms, default=0)),
+        "conflicts": sum(c[1] == "conflict" for c in clicks),
+        "errors": sum(c[1] == "error" for c in clicks),
+        "first error": next((c[2] for c in clicks if c[1] == "error"), ""),
+    }
+
+
+# ---------- server ----------
+def start_server(app: str, sqlite: str, port: int | None = None) -> tuple[subprocess.Popen, str]:
+    """`streamlit run app` on a free port; returns the process and its URL once healthy."""
+    if port is None:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    env = {**os.environ, "HR_DB_BACKEND": "sqlite", "HR_SQLITE_PATH": sqlite,
+           "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+    proc = subprocess.Popen([sys.executable, "-m", "streamlit", "run", app, "--server.headless", "true",
+                             "--server.port", str(port), "--server.address", "127.0.0.1",
+                             "--browser.gatherUsageStats", "false"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(url + "/_stcore/health", timeout=1)
+            return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(f"streamlit exited with code {proc.returncode}")
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("streamlit did not start within 60s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", required=True, help="scratch SQLite file (created from db.sql if missing)")
+    ap.add_argument("--app", default=str(ROOT / "app.py"), help="page script to serve (default: app.py)")
+    ap.add_argument("--scenario", choices=list(SCENARIOS), default="approve")
+    ap.add_argument("--sessions", default="1,4,16,32", help="comma-separated concurrency levels")
+    ap.add_argument("--seconds", type=float, default=20, help="duration of each level")
+    ap.add_argument("--budget-ms", type=float, default=1000, help="p95 click latency a level must stay within")
+    args = ap.parse_args()
+
+    sqlite = os.path.abspath(args.sqlite)
+    engine = make_engine("sqlite", f"sqlite:///{sqlite}")
+    bootstrap(engine)
+    proc, url = start_server(os.path.abspath(args.app), sqlite)
+    sustained = 0
+    try:
+        print(f"{args.app} at {url}, scenario {args.scenario}, {args.seconds:.0f}s per level")
+        for n in (int(n) for n in args.sessions.split(",")):
+            if args.scenario == "approve":
+                seed_applications(engine, max(100, n * 10))
+            row = asyncio.run(run_level(url, args.scenario, n, args.seconds))
+            error = row.pop("first error")
+            print("  " + "  ".join(f"{k}={v}" for k, v in row.items()), flush=True)
+            if error:
+                print(f"    first error: {error}")
+            if row["clicks"] and row["p95 ms"] <= args.budget_ms and not row["errors"]:
+                sustained = n
+    finally:
+        proc.terminate()
+        proc.wait()
+    print(f"sustains {sustained} concurrent admin session(s) at p95 <= {args.budget_ms:.0f} ms"
+          if sustained else f"no level stays within p95 <= {args.budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Query instrumentation: per-statement timings, slow-query log, per-view latency.
+
+Every statement executed through a watched engine is timed with SQLAlchemy
+cursor events and tagged with the page (view) that ran it; the view is held
+in a context variable that app.py sets at the start of each rerun. q() also
+reports how long building its DataFrame took, and the router how long the
+whole page took. Statements slower than HR_SLOW_MS (default 200 ms) go to a
+rolling slow-query log. All of it is shown on the admin Diagnostics page,
+along with the retry / conflict counts of the admin writes (ContentionMetrics).
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from hrdb.cache import normalize
+
+_view = ContextVar("hr_view", default="-")
+_last = ContextVar("hr_last_statement", default=None)   # key of this thread's latest statement
+
+# upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+BUCKETS_MS = [1, 5, 20, 100, 500, 2000]
+MAX_STATEMENTS = 1000    # distinct (view, statement) pairs kept
+SAMPLES = 2000           # latencies kept per view
+
+
+def set_view(view: str):
+    """Tag everything this thread executes from now on with `view`."""
+    _view.set(view or "-")
+
+
+def current_view() -> str:
+    return _view.get()
+
+
+def bucket_labels() -> list[str]:
+    edges = [0] + BUCKETS_MS
+    return [f"{a}–{b} ms" for a, b in zip(edges, edges[1:])] + [f"> {BUCKETS_MS[-1]} ms"]
+
+
+def _bucket(ms: float) -> int:
+    for i, edge in enumerate(BUCKETS_MS):
+        if ms < edge:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _is_read(sql: str) -> bool:
+    head = sql.lstrip().split(None, 1)
+    return bool(head) and head[0].upper() in ("SELECT", "WITH", "PRAGMA", "EXPLAIN")
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))] if values else 0.0
+
+
+class QueryMetrics:
+    """Thread-safe store of statement and page timings."""
+
+    def __init__(self, slow_ms: float | None = None, slow_log_size: int = 200):
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.environ.get("HR_SLOW_MS", 200))
+        self._lock = threading.Lock()
+        self._slow_log_size = slow_log_size
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}   # (view, sql) -> {"calls", "total_ms", "max_ms", "rows", "frame_ms"}
+            self.views = {}        # view -> {"renders": deque, "statements": deque, "db_ms": float}
+            self.slow = deque(maxlen=self._slow_log_size)
+
+    # ---------- recording ----------
+    def _view_entry(self, view):
+        entry = self.views.get(view)
+        if entry is None:
+            entry = self.views[view] = {"renders": deque(maxlen=SAMPLES),
+                                        "statements": deque(maxlen=SAMPLES), "db_ms": 0.0}
+        return entry
+
+    def _stmt_entry(self, view, sql):
+        key = (view, normalize(sql)[:500])
+        if key not in self.statements and len(self.statements) >= MAX_STATEMENTS:
+            key = (view, "(other statements)")
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                            "rows": 0, "frame_ms": 0.0}
+        _last.set(key)
+        return entry
+
+    def record_statement(self, sql: str, seconds: float, rows: int, params=None):
+        view, ms = current_view(), seconds * 1000
+        with self._lock:
+            entry = self._stmt_entry(view, sql)
+            entry["calls"] += 1
+            entry["total_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            if not _is_read(sql):              # reads count their rows in record_frame()
+                entry["rows"] += max(rows, 0)
+            v = self._view_entry(view)
+            v["statements"].append(ms)
+            v["db_ms"] += ms
+            if ms >= self.slow_ms:
+                self.slow.appendleft({"at": time.strftime("%H:%M:%S"), "view": view, "ms": round(ms, 1),
+                                      "rows": rows, "statement": normalize(sql)[:300],
+                                      "params": repr(params)[:200]})
+
+    def record_frame(self, seconds: float, rows: int):
+        """DataFrame built from the latest statement of this thread (a SELECT's
+        row count is only known once its rows are fetched)."""
+        with self._lock:
+            entry = self.statements.get(_last.get())
+            if entry is not None:
+                entry["frame_ms"] += seconds * 1000
+                entry["rows"] += rows
+
+    def record_render(self, view: str, seconds: float):
+        with self._lock:
+            self._view_entry(view)["renders"].append(seconds * 1000)
+
+    def watch(self, engine):
+        """Time every cursor execution on `engine`."""
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, _cursor, _statement, _params, _context, _many):
+            conn.info.setdefault("hr_t0", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, params, _context, _many):
+            t0 = conn.info["hr_t0"].pop()
+            self.record_statement(statement, time.perf_counter() - t0, cursor.rowcount, params)
+
+    # ---------- reports ----------
+    def view_summary(self) -> list[dict]:
+        with self._lock:
+            out = []
+            for view, v in sorted(self.views.items()):
+                renders, stmts = list(v["renders"]), list(v["statements"])
+                out.append({
+                    "view": view,
+                    "renders": len(renders),
+                    "render p50 ms": round(_percentile(renders, 0.50), 1),
+                    "render p95 ms": round(_percentile(renders, 0.95), 1),
+                    "render p99 ms": round(_percentile(renders, 0.99), 1),
+                    "statements": len(stmts),
+                    "statement p95 ms": round(_percentile(stmts, 0.95), 2),
+                    "db total ms": round(v["db_ms"], 1),
+                })
+            return out
+
+    def histogram(self, view: str, kind: str = "renders") -> dict:
+        """{bucket label: count} of the latencies of `view` ("renders" or "statements")."""
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        with self._lock:
+            for ms in self.views.get(view, {}).get(kind, ()):
+                counts[_bucket(ms)] += 1
+        return dict(zip(bucket_labels(), counts))
+
+    def top_statements(self, n: int = 10, by: str = "total_ms") -> list[dict]:
+        with self._lock:
+            rows = [{"view": view, "statement": sql, **{k: round(v, 2) for k, v in e.items()},
+                     "mean_ms": round(e["total_ms"] / e["calls"], 2) if e["calls"] else 0.0}
+                    for (view, sql), e in self.statements.items()]
+        return sorted(rows, key=lambda r: r[by], reverse=True)[:n]
+
+    def slow_log(self) -> list[dict]:
+        with self._lock:
+            return list(self.slow)
+
+
+class ContentionMetrics:
+    """Thread-safe outcome counts and latencies of the retried admin writes (hrdb/concurrency.py)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.ops = {}   # op -> {"calls", "ok", "conflicts", "failed", "retries", "errors", "ms"}
+
+    def record(self, op: str, outcome: str, attempts: int, seconds: float, errors=()):
+        """One call of `op`: outcome is "ok", "conflict" or "failed"; `errors` are the
+        kinds of the lock errors that were retried (or gave up)."""
+        with self._lock:
+            entry = self.ops.get(op)
+            if entry is None:
+                entry = self.ops[op] = {"calls": 0, "ok": 0, "conflicts": 0, "failed": 0, "retries": 0,
+                                        "errors": Counter(), "ms": deque(maxlen=SAMPLES)}
+            entry["calls"] += 1
+            entry[{"ok": "ok", "conflict": "conflicts"}.get(outcome, "failed")] += 1
+            entry["retries"] += attempts - 1
+            entry["errors"].update(errors)
+            entry["ms"].append(seconds * 1000)
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            out = []
+            for op, e in sorted(self.ops.items()):
+                ms = list(e["ms"])
+                out.append({
+                    "write": op,
+                    "calls": e["calls"],
+                    "ok": e["ok"],
+                    "conflicts": e["conflicts"],
+                    "failed": e["failed"],
+                    "retries": e["retries"],
+                    "lock errors": ", ".join(f"{k} ×{n}" for k, n in e["errors"].most_common()),
+                    "p50 ms": round(_percentile(ms, 0.50), 1),
+                    "p95 ms": round(_percentile(ms, 0.95), 1),
+                    "max ms": round(max(ms, default=0.0), 1),
+                })
+            return out
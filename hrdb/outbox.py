@@ -0,0 +1,302 @@
+"""Change events of the admin writes (transactional outbox) and their subscribers.
+
+Every write path (hrdb/writes.py, hrdb/bulk_import.py, hrdb/deletion.py) appends
+typed events to ChangeEvents in the same transaction as the change itself, so
+an event exists if and only if its change was committed:
+
+    race_created      raceId          race name, track, date, time, number of entries
+    result_recorded   raceId/horseId  result, prize
+    horse_moved       horseId         old and new stable, who moved it
+    owner_deleted     ownerId         ownership links removed, horses deleted with the owner
+    trainer_approved  trainerId       application, name, stable
+    trainer_rejected  appId           reason
+    season_archived   season          races / results moved to the archive (hrdb/archive.py)
+    season_restored   season          races / results brought back
+    data_reset        -               the data was replaced (reload, snapshot restore): rebuild
+
+Sequence numbers are gapless and in commit order. They come from the single
+OutboxHead row, which a write updates at its end and keeps locked until it
+commits (a row lock on MySQL; SQLite writes are serialized anyway). A rolled
+back write gives its numbers back, and no event can turn up later below a
+sequence number a subscriber has already read.
+
+A subscriber is a name with a checkpoint in OutboxCheckpoints (the last
+sequence number it handled). Subscriber.poll() hands it the events after the
+checkpoint in batches and moves the checkpoint once the handler returns: at
+least once, in order. Run one process per subscriber name. Events all
+subscribers have seen can be pruned; readers without a checkpoint (the live
+leaderboard) compare their position with oldest() and start over when events
+they have not read are gone.
+
+    python -m hrdb.outbox tail --follow                 # events as JSON lines
+    python -m hrdb.outbox tail --name export --follow   # the same, resuming from a saved checkpoint
+    python -m hrdb.outbox status                        # head and lag of every subscriber
+    python -m hrdb.outbox prune
+"""
+import argparse
+import json
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import bindparam, text
+
+from hrdb.backend import has_table, is_sqlite, make_engine
+
+BATCH = 500  # events per read
+
+KINDS = ["race_created", "result_recorded", "horse_moved", "owner_deleted", "trainer_approved",
+         "trainer_rejected", "season_archived", "season_restored", "data_reset"]
+
+CHANGE_EVENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS ChangeEvents (
+      seq       BIGINT NOT NULL,
+      kind      VARCHAR(30) NOT NULL,
+      entityKey VARCHAR(64) NOT NULL,
+      payload   TEXT NOT NULL,
+      createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (seq)
+    )
+"""
+OUTBOX_HEAD_DDL = """
+    CREATE TABLE IF NOT EXISTS OutboxHead (
+      id  INT NOT NULL,
+      seq BIGINT NOT NULL,
+      PRIMARY KEY (id)
+    )
+"""
+OUTBOX_CHECKPOINTS_DDL = """
+    CREATE TABLE IF NOT EXISTS OutboxCheckpoints (
+      subscriber VARCHAR(64) NOT NULL,
+      seq        BIGINT NOT NULL DEFAULT 0,
+      updatedAt  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (subscriber)
+    )
+"""
+
+HEAD = "SELECT seq FROM OutboxHead WHERE id = 1"
+READ_EVENTS = """
+    SELECT seq, kind, entityKey, payload, createdAt FROM ChangeEvents
+    WHERE seq > :after {kinds}
+    ORDER BY seq
+    LIMIT :n
+"""
+CHECKPOINT = "SELECT seq FROM OutboxCheckpoints WHERE subscriber = :name"
+
+
+@dataclass(frozen=True)
+class Event:
+    seq: int
+    kind: str
+    key: str
+    payload: dict
+    created_at: datetime | str
+
+    def as_dict(self) -> dict:
+        return {"seq": self.seq, "kind": self.kind, "key": self.key, "payload": self.payload,
+                "createdAt": str(self.created_at)}
+
+
+def ensure_outbox_tables(cx):
+    """Create the outbox tables and the head row (idempotent)."""
+    for ddl in (CHANGE_EVENTS_DDL, OUTBOX_HEAD_DDL, OUTBOX_CHECKPOINTS_DDL):
+        cx.execute(text(ddl))
+    if cx.execute(text(HEAD)).scalar() is None:
+        last = cx.execute(text("SELECT MAX(seq) FROM ChangeEvents")).scalar()
+        cx.execute(text("INSERT INTO OutboxHead (id, seq) VALUES (1, :s)"), {"s": last or 0})
+
+
+def _json(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# ---------- writing ----------
+def append(cx, kind: str, events) -> int:
+    """Append (key, payload) events of one kind inside the caller's transaction;
+    returns the sequence number of the last one (0 if there were none).
+
+    Locks the head row until the transaction ends, so call it at the end of the write.
+    """
+    events = list(events)
+    if not events:
+        return 0
+    if kind not in KINDS:
+        raise ValueError(f"unknown event kind {kind!r}")
+    cx.execute(text("UPDATE OutboxHead SET seq = seq + :n WHERE id = 1"), {"n": len(events)})
+    last = cx.execute(text(HEAD)).scalar()
+    if last is None:
+        raise RuntimeError("OutboxHead is missing; run hrdb.bootstrap first")
+    first = int(last) - len(events) + 1
+    # driver-level executemany: an import appends one event per result
+    mark = "?" if is_sqlite(cx) else "%s"
+    dumps = json.JSONEncoder(default=_json).encode
+    cx.exec_driver_sql(f"INSERT INTO ChangeEvents (seq, kind, entityKey, payload) VALUES ({', '.join([mark] * 4)})",
+                       [(first + i, kind, str(key), dumps(payload)) for i, (key, payload) in enumerate(events)])
+    return int(last)
+
+
+def reset(cx, reason: str):
+    """Tell the subscribers that the data was replaced wholesale (data_reset)."""
+    ensure_outbox_tables(cx)    # a restored sqlite snapshot may predate the outbox
+    append(cx, "data_reset", [("-", {"reason": reason})])
+
+
+# ---------- reading ----------
+def head(cx) -> int:
+    """Sequence number of the last committed event."""
+    return int(cx.execute(text(HEAD)).scalar() or 0)
+
+
+def oldest(cx) -> int:
+    """Sequence number of the oldest event not pruned (head + 1 when there is none)."""
+    first = cx.execute(text("SELECT MIN(seq) FROM ChangeEvents")).scalar()
+    return head(cx) + 1 if first is None else int(first)
+
+
+def read(cx, after: int = 0, limit: int = BATCH, kinds=None) -> list[Event]:
+    """Up to `limit` events after sequence number `after`, in order; only those of `kinds` when given."""
+    if kinds:
+        stmt = text(READ_EVENTS.format(kinds="AND kind IN :kinds")).bindparams(bindparam("kinds", expanding=True))
+        params = {"after": after, "n": limit, "kinds": list(kinds)}
+    else:
+        stmt, params = text(READ_EVENTS.format(kinds="")), {"after": after, "n": limit}
+    return [Event(seq, kind, key, json.loads(payload), at) for seq, kind, key, payload, at in
+            cx.execute(stmt, params)]
+
+
+def checkpoint(cx, name: str) -> int | None:
+    """Last sequence number `name` handled (None for an unknown subscriber)."""
+    seq = cx.execute(text(CHECKPOINT), {"name": name}).scalar()
+    return None if seq is None else int(seq)
+
+
+def save_checkpoint(cx, name: str, seq: int):
+    if not cx.execute(text("UPDATE OutboxCheckpoints SET seq = :s, updatedAt = CURRENT_TIMESTAMP "
+                           "WHERE subscriber = :name"), {"s": seq, "name": name}).rowcount:
+        cx.execute(text("INSERT INTO OutboxCheckpoints (subscriber, seq) VALUES (:name, :s)"),
+                   {"name": name, "s": seq})
+
+
+def status(cx) -> list[dict]:
+    """Every subscriber with its checkpoint and the number of events it is behind."""
+    if not has_table(cx, "OutboxCheckpoints"):
+        return []
+    last = head(cx)
+    return [{"subscriber": name, "checkpoint": seq, "behind": last - seq, "updatedAt": at}
+            for name, seq, at in cx.execute(text(
+                "SELECT subscriber, seq, updatedAt FROM OutboxCheckpoints ORDER BY subscriber"))]
+
+
+def prune(engine) -> int:
+    """Delete the events every subscriber has handled; returns how many.
+    Nothing is deleted while no subscriber is registered. Readers without a
+    checkpoint are not waited for: see oldest()."""
+    with engine.begin() as cx:
+        done = cx.execute(text("SELECT MIN(seq) FROM OutboxCheckpoints")).scalar()
+        if done is None:
+            return 0
+        return cx.execute(text("DELETE FROM ChangeEvents WHERE seq <= :s"), {"s": done}).rowcount
+
+
+class Subscriber:
+    """Tails the outbox for `handler(events)` from the checkpoint saved under `name`.
+
+    `kinds` limits the events handed over (the checkpoint still moves past the
+    others). A new subscriber starts at `start` (default: the current head, so
+    only events from now on); `start=0` replays whatever has not been pruned.
+    If the handler raises, the checkpoint stays and the batch comes again.
+    Without a name nothing is saved: the position only lives in the object.
+    """
+
+    def __init__(self, engine, name: str | None, handler, kinds=None, batch: int = BATCH,
+                 start: int | None = None):
+        self.engine, self.name, self.handler = engine, name, handler
+        self.kinds = set(kinds) if kinds else None
+        self.batch = batch
+        with engine.begin() as cx:
+            self.position = head(cx) if start is None else start
+            if name is not None and checkpoint(cx, name) is None:
+                save_checkpoint(cx, name, self.position)
+
+    def poll(self) -> int:
+        """Handle at most one batch; returns the number of events read (0: caught up)."""
+        with self.engine.connect() as cx:
+            saved = None if self.name is None else checkpoint(cx, self.name)
+            if saved is not None:    # (None: its checkpoint row was deleted)
+                self.position = saved
+            events = read(cx, self.position, self.batch)
+        if not events:
+            return 0
+        wanted = [e for e in events if self.kinds is None or e.kind in self.kinds]
+        if wanted:
+            self.handler(wanted)
+        if self.name is not None:
+            with self.engine.begin() as cx:
+                save_checkpoint(cx, self.name, events[-1].seq)
+        self.position = events[-1].seq
+        return len(events)
+
+    def drain(self) -> int:
+        """Poll until caught up; returns the number of events read."""
+        total = 0
+        while n := self.poll():
+            total += n
+        return total
+
+    def run(self, interval: float = 1.0, stop: threading.Event | None = None):
+        """Keep draining, sleeping `interval` seconds whenever caught up, until `stop` is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if not self.drain():
+                stop.wait(interval)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("action", choices=["tail", "status", "prune"])
+    ap.add_argument("--name", help="tail: subscriber whose checkpoint to resume from and save")
+    ap.add_argument("--after", type=int, default=0,
+                    help="tail: start after this sequence number (a known --name resumes from its checkpoint)")
+    ap.add_argument("--kinds", help="tail: comma-separated event kinds to print")
+    ap.add_argument("--follow", action="store_true", help="tail: keep waiting for new events")
+    ap.add_argument("--interval", type=float, default=1.0, help="tail --follow: seconds between polls")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    from hrdb.bootstrap import bootstrap
+    bootstrap(engine)
+    if args.action == "status":
+        with engine.connect() as cx:
+            print(f"head {head(cx)}")
+            for row in status(cx):
+                print(f"  {row['subscriber']:<20} at {row['checkpoint']:>10}  {row['behind']:>8} behind  "
+                      f"{row['updatedAt']}")
+        return
+    if args.action == "prune":
+        print(f"{prune(engine)} event(s) pruned")
+        return
+
+    kinds = args.kinds.split(",") if args.kinds else None
+    unknown = set(kinds or []) - set(KINDS)
+    if unknown:
+        ap.error(f"unknown event kind(s): {', '.join(sorted(unknown))}")
+
+    def emit(events):
+        for e in events:
+            print(json.dumps(e.as_dict(), default=_json), flush=True)
+
+    sub = Subscriber(engine, args.name, emit, kinds, start=args.after)
+    try:
+        sub.run(args.interval) if args.follow else sub.drain()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Keyset pagination and streaming reads for result sets that keep growing.
+
+A paged query is written with three placeholders:
+
+    SELECT ... {keycols} FROM ... WHERE ... {keyset} [GROUP BY ...]
+
+plus its sort order as ((expression, "ASC" | "DESC"), ...). The order must be
+unique (end with a key column) and its expressions non-NULL. A page is the
+next `size` rows after the last key of the previous page, so page N costs the
+same as page 1 (no OFFSET) and only one page is ever held in memory.
+
+`stream()` walks a whole result set in batches through a server-side cursor,
+for exports:
+
+    python -m hrdb.paging trainer_winners --out winners.csv
+"""
+import argparse
+import csv
+import sys
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+
+from hrdb import queries as Q
+from hrdb.backend import make_engine
+
+KEY_PREFIX = "_k"
+
+
+@dataclass
+class Page:
+    rows: list = field(default_factory=list)   # dicts, without the key columns
+    next_key: tuple | None = None              # pass as `after` for the next page; None on the last page
+
+
+def keyset_sql(sql: str, order, after: bool) -> str:
+    """Fill the placeholders of a paged query; `after` adds the "past the last key" filter."""
+    keycols = "".join(f", {expr} AS {KEY_PREFIX}{i}" for i, (expr, _) in enumerate(order))
+    keyset = ""
+    if after:
+        ors = []
+        for i, (expr, direction) in enumerate(order):
+            op = "<" if direction.upper() == "DESC" else ">"
+            terms = [f"{e} = :{KEY_PREFIX}{j}" for j, (e, _) in enumerate(order[:i])]
+            ors.append("(" + " AND ".join(terms + [f"{expr} {op} :{KEY_PREFIX}{i}"]) + ")")
+        # redundant bound on the first column so the planner can range-scan an index on it
+        first, direction = order[0]
+        bound = "<=" if direction.upper() == "DESC" else ">="
+        keyset = f"AND {first} {bound} :{KEY_PREFIX}0 AND ({' OR '.join(ors)})"
+    by = ", ".join(f"{expr} {direction}" for expr, direction in order)
+    return sql.format(keycols=keycols, keyset=keyset) + f" ORDER BY {by} LIMIT :_limit"
+
+
+def page_params(params: dict | None, after, size: int) -> dict:
+    out = dict(params or {}, _limit=size + 1)   # one extra row tells whether there is a next page
+    if after is not None:
+        out.update({f"{KEY_PREFIX}{i}": v for i, v in enumerate(after)})
+    return out
+
+
+def split_page(rows, order, size: int) -> Page:
+    """Page from the (size + 1) rows returned by a keyset_sql() query."""
+    keys = [f"{KEY_PREFIX}{i}" for i in range(len(order))]
+    page = Page(rows=[{k: v for k, v in r.items() if k not in keys} for r in rows[:size]])
+    if len(rows) > size:
+        page.next_key = tuple(rows[size - 1][k] for k in keys)
+    return page
+
+
+def fetch_page(cx, sql, order, params=None, after=None, size=50) -> Page:
+    """One page of a paged query (`sql` may be a per-dialect dict)."""
+    stmt = keyset_sql(Q.pick(sql, cx), order, after is not None)
+    result = cx.execution_options(stream_results=True).execute(text(stmt), page_params(params, after, size))
+    return split_page([dict(r) for r in result.mappings().fetchmany(size + 1)], order, size)
+
+
+def stream(engine, sql, params=None, batch=1000):
+    """Yield the rows of `sql` as lists of dicts, `batch` rows at a time (server-side cursor)."""
+    with engine.connect() as cx:
+        result = cx.execution_options(yield_per=batch).execute(text(Q.pick(sql, cx)), params or {})
+        for part in result.mappings().partitions():
+            yield [dict(r) for r in part]
+
+
+# name -> (query, parameters)
+EXPORTS = {
+    "trainer_winners": (Q.TRAINER_WINNERS, Q.ALL_TIME),
+    "trainer_winnings": (Q.TRAINER_WINNINGS, None),
+    "track_stats": (Q.TRACK_STATS, None),
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("report", choices=sorted(EXPORTS))
+    ap.add_argument("--out", help="CSV file (default: stdout)")
+    ap.add_argument("--batch", type=int, default=1000)
+    args = ap.parse_args()
+
+    fh = open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout
+    writer, n = None, 0
+    sql, params = EXPORTS[args.report]
+    for rows in stream(make_engine(), sql, params, batch=args.batch):
+        if writer is None:
+            writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+            writer.writeheader()
+        writer.writerows(rows)
+        n += len(rows)
+    if args.out:
+        fh.close()
+        print(f"{n:,} rows written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Query-plan regression check for the page queries in hrdb/queries.py.
+
+Generates a synthetic dataset (1M+ RaceResults rows by default), captures the
+EXPLAIN plan of every page query and exits non-zero when a query falls back to
+a full scan (of the table or of a whole index) that is not explicitly allowed below.
+
+    python -m hrdb.plancheck                      # temp SQLite file, 1M results
+    python -m hrdb.plancheck --out plans.json     # also save the captured plans
+    HR_DB_BACKEND=mysql python -m hrdb.plancheck --no-generate   # existing MySQL data
+"""
+import argparse
+import json
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import text
+
+from hrdb import facts, outbox
+from hrdb import queries as Q
+from hrdb.backend import is_sqlite, make_engine
+from hrdb.bootstrap import ensure_schema
+from hrdb.datagen import generate
+from hrdb.ids import NEXT_VALUE
+from hrdb.paging import keyset_sql, page_params
+from hrdb.search import SUGGEST_NEXT, match_params
+
+# queries on ResultFacts read just the seasons in their range; they are checked on
+# one full season of the synthetic data
+SEASON = dict(zip(("lo", "hi"), facts.season_dates(2024)))
+
+# (name, query, params, {table allowed to be read in full: why})
+CASES = [
+    ("next_race_id",         NEXT_VALUE,             {"n": "race"},        {}),
+    ("race_exists",          Q.RACE_EXISTS,          {"rid": "race10"},    {}),
+    ("track_names",          Q.TRACK_NAMES,          {},
+        {"Track": "the track picker lists every track"}),
+    ("horse_choices",        Q.HORSE_CHOICES,        {},
+        {"Horse": "the horse picker lists every horse"}),
+    ("race_results_preview", Q.RACE_RESULTS_PREVIEW, {"rid": "race10"},    {}),
+    ("owners_with_counts",   Q.OWNERS_WITH_COUNTS,   {},
+        {"Owner": "the owner picker lists every owner"}),
+    ("owner_horses",         Q.OWNER_HORSES,         {"oid": "owner10"},   {}),
+    ("horses_left_unowned",  Q.HORSES_LEFT_UNOWNED,  {"oid": "owner10"},  {}),
+    ("horses_with_stable",   Q.HORSES_WITH_STABLE,   {},
+        {"Horse": "the horse picker lists every horse"}),
+    ("stable_choices",       Q.STABLE_CHOICES,       {},
+        {"Stable": "the stable picker lists every stable"}),
+    ("horses_in_stable",     Q.HORSES_IN_STABLE,     {"sid": "stable1"},   {}),
+    ("horse_transfers",      Q.HORSE_TRANSFERS,      {"hid": "horse10"},   {}),
+    ("stable_on_date",       Q.STABLE_ON_DATE,       {"hid": "horse10", "before": "2025-01-01"}, {}),
+    ("next_trainer_id",      NEXT_VALUE,             {"n": "trainer"},     {}),
+    ("pending_applications", Q.PENDING_APPLICATIONS, {},                   {}),
+    ("horses_by_owner",      {d: keyset_sql(Q.HORSES_BY_OWNER[d], Q.HORSES_BY_OWNER_ORDER, False)
+                              for d in ("mysql", "sqlite")},
+        page_params(match_params("Hamid"), None, 50), {}),
+    ("owner_suggest",        SUGGEST_NEXT,
+        {"kind": "owner", "lo": "moh", "hi": "moi"},                       {}),
+    ("trainer_winners",      Q.TRAINER_WINNERS,      Q.ALL_TIME,           {}),
+    ("trainer_winners_page", keyset_sql(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, False),
+        page_params(SEASON, None, 50),                                     {}),
+    ("trainer_winners_next", keyset_sql(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, True),
+        page_params(SEASON, ("2024-06-01", "trainer1", "race1", "horse1"), 50), {}),
+    ("trainer_winnings",     Q.TRAINER_WINNINGS,     {},
+        {"Trainer": "one row per trainer in the report"}),
+    ("trainer_winnings_season", Q.TRAINER_WINNINGS_BETWEEN, SEASON,
+        {"Trainer": "one row per trainer in the report"}),
+    ("track_stats",          Q.TRACK_STATS,          {},
+        {"TrackStats": "summary table, one row per track"}),
+    ("track_stats_season",   Q.TRACK_STATS_BETWEEN,  SEASON,               {}),
+    ("horse_ratings_page",   keyset_sql(Q.HORSE_RATINGS_PAGE, Q.HORSE_RATINGS_ORDER, False),
+        page_params({}, None, 50),
+        {"HorseRatings": "walks idx_horse_ratings best first and stops after one page"}),
+    ("horse_ratings_next",   keyset_sql(Q.HORSE_RATINGS_PAGE, Q.HORSE_RATINGS_ORDER, True),
+        page_params({}, (1600.0, "horse1"), 50), {}),
+    ("trainer_ratings_page", {d: keyset_sql(Q.TRAINER_RATINGS_PAGE[d], Q.TRAINER_RATINGS_ORDER, False)
+                              for d in ("mysql", "sqlite")},
+        page_params({}, None, 50),
+        {"StableRatings": "walks idx_stable_ratings best first and stops after one page"}),
+    ("stable_ratings_page",  keyset_sql(Q.STABLE_RATINGS_PAGE, Q.STABLE_RATINGS_ORDER, False),
+        page_params({}, None, 50),
+        {"StableRatings": "walks idx_stable_ratings best first and stops after one page"}),
+    ("leaderboard_season",   Q.LEADERBOARD,          SEASON,               {}),
+    ("leaderboard_races",    {d: q.replace(":ids", "(:r1, :r2)") for d, q in Q.LEADERBOARD_RACES.items()},
+        {**SEASON, "r1": "race10", "r2": "race11"}, {}),
+    ("change_events",        outbox.READ_EVENTS.format(kinds="AND kind IN (:k1, :k2)"),
+        {"after": 0, "n": outbox.BATCH, "k1": "race_created", "k2": "data_reset"}, {}),
+]
+
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.I)
+_KEYWORDS = {"on", "where", "join", "left", "inner", "group", "order", "limit", "using"}
+
+
+def aliases(sql: str) -> dict:
+    """alias -> table for the FROM/JOIN clauses of `sql`."""
+    out = {}
+    for table, alias in _ALIAS_RE.findall(sql):
+        out[table] = table
+        if alias and alias.lower() not in _KEYWORDS:
+            out[alias] = table
+    return out
+
+
+def explain(cx, sql: str, params: dict) -> tuple[list[str], set[str]]:
+    """(plan lines, tables read in full — by table scan or by walking a whole index)."""
+    names = aliases(sql)
+    if is_sqlite(cx):
+        rows = cx.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+        lines = [r[3] for r in rows]
+        # "SCAN x", "SCAN x USING [COVERING] INDEX i" (but not "SCAN (subquery-1)",
+        # "SCAN CONSTANT ROW", the FROM-less SELECT around scalar subqueries, or the scan of
+        # a MATERIALIZEd subquery, whose own reads are on lines of their own)
+        done = {m.group(1) for ln in lines if (m := re.match(r"MATERIALIZE (\w+)", ln))}
+        scans = {m.group(1) for ln in lines
+                 if (m := re.match(r"SCAN (\w+)\b(?! ROW)", ln)) and m.group(1) not in done}
+    else:
+        rows = cx.execute(text("EXPLAIN " + sql), params).mappings().all()
+        lines = [f"{r['table']}: type={r['type']} key={r['key']} rows={r['rows']}"
+                 + (f" partitions={r['partitions']}" if r.get("partitions") else "") + f" {r['Extra'] or ''}"
+                 for r in rows]
+        scans = {r["table"] for r in rows if r["type"] in ("ALL", "index")}
+    return lines, {names.get(s, s) for s in scans}
+
+
+def check(engine) -> tuple[dict, list[str]]:
+    """Capture every plan; return (plans, failures)."""
+    plans, failures = {}, []
+    with engine.begin() as cx:
+        for name, query, params, allowed in CASES:
+            sql = Q.pick(query, cx)
+            if "ResultFacts" in sql:             # reads the seasons in range (hrdb/facts.py)
+                sql = facts.on(sql, facts.source(cx, params["lo"], params["hi"]))
+            lines, scanned = explain(cx, sql, params)
+            scanned = {re.sub(r"^ResultFacts_\d{4}$", "ResultFacts", t) for t in scanned}
+            bad = sorted(t for t in scanned if t not in allowed)
+            plans[name] = {"plan": lines, "full_scans": sorted(scanned), "regressions": bad}
+            if bad:
+                failures.append(f"{name}: full scan of {', '.join(bad)}")
+    return plans, failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--results", type=int, default=1_000_000)
+    ap.add_argument("--sqlite", help="SQLite file for the synthetic data (default: a temp file)")
+    ap.add_argument("--no-generate", action="store_true", help="check the configured database as-is")
+    ap.add_argument("--out", help="write the captured plans to this JSON file")
+    args = ap.parse_args()
+
+    if args.no_generate:
+        engine = make_engine()
+    else:
+        path = args.sqlite or str(Path(tempfile.mkdtemp()) / "plancheck.sqlite")
+        engine = make_engine("sqlite", f"sqlite:///{path}")
+        generate(engine, args.results)
+
+    ensure_schema(engine)
+
+    plans, failures = check(engine)
+    for name, info in plans.items():
+        print(f"-- {name}")
+        for ln in info["plan"]:
+            print(f"     {ln}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(plans, indent=2))
+
+    if failures:
+        print("\nFULL-SCAN REGRESSIONS:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"\nOK: {len(plans)} queries, no unexpected full scans")
+
+
+if __name__ == "__main__":
+    main()
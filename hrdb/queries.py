@@ -0,0 +1,336 @@
+"""Read queries used by the pages in app.py.
+
+Kept here (instead of inline in the render_* functions) so they can be run,
+EXPLAINed and benchmarked without Streamlit. A query is either a plain SQL
+string or a {"mysql": ..., "sqlite": ...} dict when the dialects disagree;
+use `pick()` to get the right spelling.
+"""
+from hrdb.backend import is_sqlite
+
+
+def pick(query, bind) -> str:
+    """SQL text of `query` for the bind's dialect."""
+    if isinstance(query, dict):
+        return query["sqlite" if is_sqlite(bind) else "mysql"]
+    return query
+
+
+# ------------------------------------------------------------------------------------------------------------------------------------
+# --------------------------------------------------------------- ADMIN --------------------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------------------------
+# ---------- Add Race + Results ----------
+NEXT_RACE_NUM = {
+    "mysql": "SELECT MAX(CAST(SUBSTRING(raceId,5) AS UNSIGNED)) AS n "
+             "FROM Race WHERE raceId LIKE 'race%'",
+    "sqlite": "SELECT MAX(CAST(SUBSTR(raceId,5) AS INTEGER)) AS n "
+              "FROM Race WHERE raceId LIKE 'race%'",
+}
+
+RACE_EXISTS = "SELECT 1 FROM Race WHERE raceId=:rid LIMIT 1"
+
+TRACK_NAMES = "SELECT trackName FROM Track ORDER BY trackName"
+
+HORSE_CHOICES = "SELECT horseId, horseName FROM Horse ORDER BY horseName"
+
+RACE_RESULTS_PREVIEW = """
+    SELECT rr.raceId, rr.horseId, h.horseName, rr.results, rr.prize
+    FROM RaceResults rr
+    JOIN Horse h ON h.horseId = rr.horseId
+    WHERE rr.raceId = :rid
+    ORDER BY rr.prize DESC
+"""
+
+# ---------- Delete Owner ----------
+OWNERS_WITH_COUNTS = """
+    SELECT o.ownerId, o.fname, o.lname,
+          COUNT(ow.horseId) AS horse_count
+    FROM Owner o
+    LEFT JOIN Owns ow ON ow.ownerId = o.ownerId
+    GROUP BY o.ownerId, o.fname, o.lname
+    ORDER BY o.fname, o.lname
+"""
+
+OWNER_HORSES = """
+    SELECT h.horseId, h.horseName,
+          (SELECT COUNT(*) FROM Owns o2 WHERE o2.horseId = h.horseId) AS owner_cnt
+    FROM Owns ow
+    JOIN Horse h ON h.horseId = ow.horseId
+    WHERE ow.ownerId = :oid
+    ORDER BY h.horseName
+"""
+
+# :oid's horses that have no other owner (what deleting the owner also deletes)
+HORSES_LEFT_UNOWNED = """
+    SELECT ow.horseId
+    FROM Owns ow
+    WHERE ow.ownerId = :oid
+      AND NOT EXISTS (SELECT 1 FROM Owns o
+                      WHERE o.horseId = ow.horseId AND o.ownerId <> :oid)
+"""
+
+# ---------- Move Horse ----------
+HORSES_WITH_STABLE = """
+    SELECT h.horseId, h.horseName, h.stableId AS current_stable, s.stableName AS current_stable_name,
+           h.version
+    FROM Horse h
+    JOIN Stable s ON h.stableId = s.stableId
+    ORDER BY h.horseName
+"""
+
+STABLE_CHOICES = "SELECT stableId, stableName FROM Stable ORDER BY stableId"
+
+# The rows of the horses being moved or raced, locked (SQLite: the write transaction already holds the write lock)
+LOCK_HORSES = {
+    "mysql": "SELECT horseId, stableId, version FROM Horse WHERE horseId IN :ids FOR UPDATE",
+    "sqlite": "SELECT horseId, stableId, version FROM Horse WHERE horseId IN :ids",
+}
+
+HORSES_IN_STABLE = """
+    SELECT horseId, horseName, version
+    FROM Horse
+    WHERE stableId = :sid
+    ORDER BY horseName
+"""
+
+HORSE_TRANSFERS = """
+    SELECT t.movedAt, t.fromStable, f.stableName AS fromName, t.toStable, s.stableName AS toName, t.movedBy
+    FROM HorseTransfers t
+    LEFT JOIN Stable f ON f.stableId = t.fromStable
+    LEFT JOIN Stable s ON s.stableId = t.toStable
+    WHERE t.horseId = :hid
+    ORDER BY t.movedAt DESC, t.transferId DESC
+"""
+
+# Stable of a horse at the end of a day (:before = the next day): the last move before it,
+# else where the first move after it came from, else it never moved
+STABLE_ON_DATE = """
+    SELECT COALESCE(
+      (SELECT toStable FROM HorseTransfers
+       WHERE horseId = :hid AND movedAt < :before
+       ORDER BY movedAt DESC, transferId DESC LIMIT 1),
+      (SELECT fromStable FROM HorseTransfers
+       WHERE horseId = :hid AND movedAt >= :before
+       ORDER BY movedAt, transferId LIMIT 1),
+      (SELECT stableId FROM Horse WHERE horseId = :hid)
+    ) AS stableId
+"""
+
+# ---------- Approve Trainer ----------
+NEXT_TRAINER_NUM = {
+    "mysql": """
+        SELECT MAX(CAST(SUBSTRING(trainerId,8) AS UNSIGNED)) AS n
+        FROM Trainer
+        WHERE trainerId LIKE 'trainer%'
+    """,
+    "sqlite": """
+        SELECT MAX(CAST(SUBSTR(trainerId,8) AS INTEGER)) AS n
+        FROM Trainer
+        WHERE trainerId LIKE 'trainer%'
+    """,
+}
+
+PENDING_APPLICATIONS = """
+    SELECT ta.appId, ta.fname, ta.lname, ta.stableId, s.stableName, ta.requestedAt
+    FROM TrainerApplications ta
+    JOIN Stable s ON s.stableId = ta.stableId
+    WHERE ta.status = 'pending'
+    ORDER BY ta.requestedAt DESC
+"""
+
+# ------------------------------------------------------------------------------------------------------------------------------------
+# --------------------------------------------------------------- GUEST --------------------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------------------------
+# Paged queries ({keycols}/{keyset} and the *_ORDER keys are filled in by hrdb/paging.py)
+# Combine multiple trainers (same stable can have many) into one cell per horse.
+# Owners are found through the name index (hrdb/search.py): :lo/:hi and :slo/:shi are the
+# prefix ranges of the search and of its spelling skeleton (search.match_params()).
+HORSES_BY_OWNER = {
+    "mysql": """
+        SELECT
+            h.horseName AS `Horse`,
+            h.age       AS `Age`,
+            COALESCE(GROUP_CONCAT(DISTINCT CONCAT(t.fname, ' ', t.lname)
+                     ORDER BY t.lname SEPARATOR ', '), '—') AS `Trainer(s)`
+            {keycols}
+        FROM Owns  ow
+        JOIN Horse h ON h.horseId = ow.horseId
+        LEFT JOIN Trainer t ON t.stableId = h.stableId
+        WHERE ow.ownerId IN (SELECT entityId FROM NameIndex
+                             WHERE kind = 'owner'
+                               AND ((term >= :lo AND term < :hi) OR (term >= :slo AND term < :shi)))
+              {keyset}
+        GROUP BY h.horseId, h.horseName, h.age
+    """,
+    # SQLite's GROUP_CONCAT takes no ORDER BY/SEPARATOR with DISTINCT: order in a subquery
+    "sqlite": """
+        SELECT
+            h.horseName AS `Horse`,
+            h.age       AS `Age`,
+            COALESCE((SELECT GROUP_CONCAT(nm, ', ')
+                      FROM (SELECT DISTINCT t.fname || ' ' || t.lname AS nm
+                            FROM Trainer t
+                            WHERE t.stableId = h.stableId
+                            ORDER BY t.lname)), '—') AS `Trainer(s)`
+            {keycols}
+        FROM Owns  ow
+        JOIN Horse h ON h.horseId = ow.horseId
+        WHERE ow.ownerId IN (SELECT entityId FROM NameIndex
+                             WHERE kind = 'owner'
+                               AND ((term >= :lo AND term < :hi) OR (term >= :slo AND term < :shi)))
+              {keyset}
+        GROUP BY h.horseId, h.horseName, h.age
+    """,
+}
+HORSES_BY_OWNER_ORDER = (("h.horseName", "ASC"), ("h.horseId", "ASC"))
+
+# :lo / :hi of a report that covers every race date (MySQL's DATE range)
+ALL_TIME = {"lo": "1000-01-01", "hi": "9999-12-31"}
+# first and last race date (the seasons the report filters offer)
+RACE_DATE_SPAN = "SELECT MIN(raceDate) AS first, MAX(raceDate) AS last FROM Race"
+
+# Both trainer reports read the race-time facts kept by hrdb/facts.py: a win is credited to the
+# trainers of the stable the horse ran for, not to the one it is in today. Queries between :lo
+# and :hi name ResultFacts; facts.source() / facts.page() point them at the seasons in range
+TRAINER_WINNERS_PAGE = """
+    SELECT
+        t.fname     AS `Trainer First`,
+        t.lname     AS `Trainer Last`,
+        h.horseName AS `Winning Horse`,
+        r.raceName  AS `Race Name`,
+        f.raceDate  AS `Race Date`,
+        f.trackName AS `Track`
+        {keycols}
+    FROM ResultFacts f
+    JOIN Trainer t ON t.trainerId = f.trainerId
+    JOIN Horse   h ON h.horseId   = f.horseId
+    JOIN Race    r ON r.raceId    = f.raceId
+    WHERE f.position = 1 AND f.raceDate BETWEEN :lo AND :hi {keyset}
+"""
+# the column order of idx_facts_winners, so a page is one walk down the index
+TRAINER_WINNERS_ORDER = (
+    ("f.raceDate", "DESC"),
+    ("f.trainerId", "ASC"),
+    ("f.raceId", "ASC"),
+    ("f.horseId", "ASC"),
+)
+# every winner between :lo and :hi at once (exports)
+TRAINER_WINNERS = TRAINER_WINNERS_PAGE.format(keycols="", keyset="") + \
+    " ORDER BY f.raceDate DESC, f.trainerId, f.raceId, f.horseId"
+
+# per-trainer totals kept next to the facts (TrainerWinnings); trainers without a result show 0
+_TRAINER_WINNINGS = """
+    SELECT {keycol}
+        {trainer}                     AS `Trainer`,
+        COALESCE(w.totalPrize, 0)     AS `Total Winnings`
+    FROM Trainer t
+    LEFT JOIN TrainerWinnings w ON w.trainerId = t.trainerId
+    ORDER BY `Total Winnings` DESC
+"""
+# the same for races between :lo and :hi, summed from idx_facts_dates
+_TRAINER_WINNINGS_BETWEEN = """
+    SELECT {keycol}
+        {trainer}                     AS `Trainer`,
+        COALESCE(w.totalPrize, 0)     AS `Total Winnings`
+    FROM Trainer t
+    LEFT JOIN (SELECT f.trainerId, SUM(f.prize) AS totalPrize
+               FROM ResultFacts f
+               WHERE f.raceDate BETWEEN :lo AND :hi AND f.trainerId <> ''
+               GROUP BY f.trainerId) w ON w.trainerId = t.trainerId
+    ORDER BY `Total Winnings` DESC
+"""
+_TRAINER_NAME = {"mysql": "CONCAT(t.fname, ' ', t.lname)", "sqlite": "t.fname || ' ' || t.lname"}
+TRAINER_WINNINGS = {d: _TRAINER_WINNINGS.format(keycol="", trainer=n) for d, n in _TRAINER_NAME.items()}
+TRAINER_WINNINGS_BETWEEN = {d: _TRAINER_WINNINGS_BETWEEN.format(keycol="", trainer=n)
+                            for d, n in _TRAINER_NAME.items()}
+# with the trainerId, for adding the totals of archived seasons to them (hrdb/archive.py)
+TRAINER_TOTALS = {d: _TRAINER_WINNINGS.format(keycol="t.trainerId,", trainer=n) for d, n in _TRAINER_NAME.items()}
+TRAINER_TOTALS_BETWEEN = {d: _TRAINER_WINNINGS_BETWEEN.format(keycol="t.trainerId,", trainer=n)
+                          for d, n in _TRAINER_NAME.items()}
+
+# Live leaderboard (hrdb/leaderboard.py): wins / winnings / runs per trainer between :lo and :hi,
+# and the same for just the races :ids (primary-key probes of ResultFacts)
+_LEADERBOARD = """
+    SELECT f.trainerId, {trainer} AS trainer,
+           SUM(CASE WHEN f.position = 1 THEN 1 ELSE 0 END) AS wins,
+           SUM(f.prize)                                  AS winnings,
+           COUNT(*)                                      AS runs
+    FROM ResultFacts f
+    JOIN Trainer t ON t.trainerId = f.trainerId
+    WHERE f.raceDate BETWEEN :lo AND :hi {races}
+    GROUP BY f.trainerId, t.fname, t.lname
+"""
+LEADERBOARD = {d: _LEADERBOARD.format(trainer=n, races="") for d, n in _TRAINER_NAME.items()}
+LEADERBOARD_RACES = {d: _LEADERBOARD.format(trainer=n, races="AND f.raceId IN :ids") for d, n in _TRAINER_NAME.items()}
+
+# Reads the summary table maintained by hrdb/summaries.py
+TRACK_STATS = """
+    SELECT
+        trackName         AS `Track`,
+        raceCount         AS `Number of Races`,
+        participantCount  AS `Total Horses Participating`
+    FROM TrackStats
+    WHERE raceCount > 0
+    ORDER BY `Number of Races` DESC, trackName
+"""
+# the same for races between :lo and :hi: a range of idx_race_date, each race's results counted
+# by its key (a join grouped by track would walk idx_race_track through every race instead)
+TRACK_STATS_BETWEEN = """
+    SELECT
+        trackName            AS `Track`,
+        COUNT(*)             AS `Number of Races`,
+        SUM(horses)          AS `Total Horses Participating`
+    FROM (SELECT r.trackName,
+                 (SELECT COUNT(*) FROM RaceResults rr WHERE rr.raceId = r.raceId) AS horses
+          FROM Race r
+          WHERE r.raceDate BETWEEN :lo AND :hi) s
+    GROUP BY trackName
+    ORDER BY `Number of Races` DESC, trackName
+"""
+
+# Ratings (hrdb/ratings.py), best first; trainers are rated by their stable
+HORSE_RATINGS_PAGE = """
+    SELECT
+        h.horseName      AS `Horse`,
+        h.age            AS `Age`,
+        s.stableName     AS `Stable`,
+        ROUND(hr.rating, 1) AS `Rating`,
+        hr.races         AS `Rated Races`,
+        hr.lastRaceDate  AS `Last Race`
+        {keycols}
+    FROM HorseRatings hr
+    JOIN Horse  h ON h.horseId  = hr.horseId
+    JOIN Stable s ON s.stableId = h.stableId
+    WHERE hr.races > 0 {keyset}
+"""
+HORSE_RATINGS_ORDER = (("hr.rating", "DESC"), ("hr.horseId", "DESC"))
+
+_TRAINER_RATINGS_PAGE = """
+    SELECT
+        {trainer}     AS `Trainer`,
+        s.stableName  AS `Stable`,
+        ROUND(sr.rating, 1) AS `Rating`,
+        sr.horses     AS `Rated Horses`
+        {{keycols}}
+    FROM StableRatings sr
+    JOIN Trainer t ON t.stableId = sr.stableId
+    JOIN Stable  s ON s.stableId = sr.stableId
+    WHERE sr.horses > 0 {{keyset}}
+"""
+TRAINER_RATINGS_PAGE = {
+    "mysql": _TRAINER_RATINGS_PAGE.format(trainer="CONCAT(t.fname, ' ', t.lname)"),
+    "sqlite": _TRAINER_RATINGS_PAGE.format(trainer="t.fname || ' ' || t.lname"),
+}
+TRAINER_RATINGS_ORDER = (("sr.rating", "DESC"), ("t.trainerId", "ASC"))
+
+STABLE_RATINGS_PAGE = """
+    SELECT
+        s.stableName  AS `Stable`,
+        s.location    AS `Location`,
+        ROUND(sr.rating, 1) AS `Rating`,
+        sr.horses     AS `Rated Horses`
+        {keycols}
+    FROM StableRatings sr
+    JOIN Stable s ON s.stableId = sr.stableId
+    WHERE sr.horses > 0 {keyset}
+"""
+STABLE_RATINGS_ORDER = (("sr.rating", "DESC"), ("sr.stableId", "DESC"))
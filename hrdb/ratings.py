@@ -0,0 +1,411 @@
+"""Horse ratings computed from finishing orders, and the stable and trainer ratings derived from them.
+
+    HorseRatings  (horseId)   Elo-style rating, rated races, date of the last one
+    StableRatings (stableId)  mean rating of the stable's horses, weighted by their races
+                              (kept as sums, so a write only adds the changes of its horses)
+
+A race counts as every pairwise match-up in it. A horse that finished ahead of
+another won that pair, and two horses with the same result ('last') drew. 'no
+show' entries did not run. A horse's rating moves by K/(field - 1) times the
+sum, over its opponents, of (score - expected score). The expected score comes
+from the rating gap, as in Elo (400 points = 10:1). Horses start at 1500, with
+K=40 for their first 10 races and K=20 after that. Trainers are rated by their
+stable, as in the other trainer reports.
+
+recompute() reads the history one row per race (HISTORY) and replays it in
+date order, one batch per race day.
+A day's races are padded into a (races x field x field) block and rated with a
+few array operations, so the Python loop runs once per race day instead of once
+per result. When a horse runs twice on one day, its later race goes in a later
+batch. record_races() applies new races on top of the stored ratings, in the
+same transaction as the insert. A race dated before races that are already
+rated is applied as the latest one until the next recompute.
+
+    python -m hrdb.ratings --recompute            # --sqlite FILE
+"""
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from hrdb import queries as Q
+from hrdb.backend import has_table, is_sqlite, make_engine
+from hrdb.summaries import upsert_add
+from hrdb.rules import RESULT_OPTIONS
+
+BASE, SCALE = 1500.0, 400.0
+K_NEW, K, PROVISIONAL = 40.0, 20.0, 10     # K for a horse's first PROVISIONAL races, then K
+BATCH = 100_000
+PLACES = [p for p in RESULT_OPTIONS if p != "no show"]     # finishing order, best first
+
+RATING_TABLES = {
+    "HorseRatings": """
+        CREATE TABLE IF NOT EXISTS HorseRatings (
+          horseId      VARCHAR(15) NOT NULL,
+          rating       DOUBLE NOT NULL,
+          races        INT NOT NULL DEFAULT 0,
+          lastRaceDate DATE,
+          PRIMARY KEY (horseId)
+        )
+    """,
+    "StableRatings": """
+        CREATE TABLE IF NOT EXISTS StableRatings (
+          stableId  VARCHAR(30) NOT NULL,
+          rating    DOUBLE NOT NULL DEFAULT 0,
+          ratingSum DOUBLE NOT NULL DEFAULT 0,
+          races     INT NOT NULL DEFAULT 0,
+          horses    INT NOT NULL DEFAULT 0,
+          PRIMARY KEY (stableId)
+        )
+    """,
+}
+
+COLUMNS = ["raceId", "horseId", "results", "raceDate", "raceTime"]
+RESULTS = f"""
+    SELECT rr.raceId, rr.horseId, rr.results, r.raceDate, r.raceTime
+    FROM RaceResults rr
+    JOIN Race r ON r.raceId = rr.raceId
+    WHERE rr.results IN ({", ".join(f"'{p}'" for p in PLACES)})
+"""
+
+# The whole history for a recompute: one row per race, with its horses ("h1,h2,...") and their
+# places (one digit each) packed into two strings, in the same order. The driver then builds five
+# values per race instead of five per result, which was most of the time.
+_PLACE = "CASE rr.results " + " ".join(f"WHEN '{p}' THEN '{i}'" for i, p in enumerate(PLACES)) + " END"
+HISTORY = {
+    "mysql": f"""
+        SELECT r.raceDate, r.raceTime, COUNT(*),
+               GROUP_CONCAT(rr.horseId ORDER BY rr.horseId SEPARATOR ','),
+               GROUP_CONCAT({_PLACE} ORDER BY rr.horseId SEPARATOR '')
+        FROM Race r
+        JOIN RaceResults rr ON rr.raceId = r.raceId
+        WHERE rr.results IN ({", ".join(f"'{p}'" for p in PLACES)})
+        GROUP BY r.raceId, r.raceDate, r.raceTime
+    """,
+    "sqlite": f"""
+        SELECT r.raceDate, r.raceTime, COUNT(*), GROUP_CONCAT(rr.horseId, ','), GROUP_CONCAT({_PLACE}, '')
+        FROM Race r
+        JOIN RaceResults rr ON rr.raceId = r.raceId
+        WHERE rr.results IN ({", ".join(f"'{p}'" for p in PLACES)})
+        GROUP BY r.raceId
+    """,
+}
+
+# the stored ratings a write adds to, locked (SQLite: the write transaction already holds the write lock)
+STORED = {
+    "mysql": "SELECT horseId, rating, races, lastRaceDate FROM HorseRatings WHERE horseId IN :ids FOR UPDATE",
+    "sqlite": "SELECT horseId, rating, races, lastRaceDate FROM HorseRatings WHERE horseId IN :ids",
+}
+
+
+@dataclass
+class RatingReport:
+    results: int = 0
+    races: int = 0
+    horses: int = 0
+    batches: int = 0
+    seconds: float = 0.0        # whole recompute
+    rate_seconds: float = 0.0   # the vectorized replay alone
+
+    def summary(self) -> str:
+        return (f"{self.results:,} results in {self.races:,} races rated for {self.horses:,} horses "
+                f"({self.batches:,} batches): replay {self.rate_seconds:.2f}s, total {self.seconds:.2f}s")
+
+
+def _ids(stmt: str, *names: str):
+    return text(stmt).bindparams(*(bindparam(n, expanding=True) for n in names))
+
+
+# ---------- schema ----------
+def ensure_rating_tables(cx):
+    """Create the rating tables; a table that didn't exist yet is filled by a recompute."""
+    missing = [name for name in RATING_TABLES if not has_table(cx, name)]
+    for name in missing:
+        cx.execute(text(RATING_TABLES[name]))
+    if missing:
+        recompute(cx)
+
+
+# ---------- the rating kernel ----------
+def _rate_block(rating, races, horse, race, place):
+    """Rate races in which no horse appears twice. Result i is horse[i] finishing place[i]
+    in race race[i] (0..n-1); results are sorted by race, then place. Updates rating and
+    races in place."""
+    sizes = np.bincount(race)
+    start = (np.cumsum(sizes) - sizes)[race]
+    slot = np.arange(len(race)) - start
+
+    # score: 1 per horse finishing behind, 1/2 per horse with the same result
+    key = race * len(PLACES) + place
+    upper, lower = np.searchsorted(key, key, "right"), np.searchsorted(key, key, "left")
+    score = (start + sizes[race] - upper) + 0.5 * (upper - lower - 1)
+
+    # expected score against j: q_i / (q_i + q_j) with q = 10^(rating / SCALE); empty slots
+    # have q = 0 and count 1 each, and the horse against itself counts 1/2
+    q = np.zeros((len(sizes), int(sizes.max())))
+    q[race, slot] = 10 ** (rating[horse] / SCALE)
+    qi = q[race, slot][:, None]
+    expected = (qi / (qi + q[race])).sum(axis=1) - 0.5 - (q.shape[1] - sizes[race])
+
+    k = np.where(races[horse] < PROVISIONAL, K_NEW, K)
+    rating[horse] += k * (score - expected) / np.maximum(sizes[race] - 1, 1)
+    races[horse] += 1
+
+
+def _replay(rating, races, horse, race, day, place) -> int:
+    """Apply results in race order (race = chronological race number) and return the
+    number of batches. One batch is one race day, split further when a horse runs
+    more than once on that day."""
+    n_races = int(race.max()) + 1
+    race_day = np.zeros(n_races, np.int64)
+    race_day[race] = day
+
+    # a horse's later race on the same day must be rated after its earlier one
+    by_horse = np.lexsort((race, horse))
+    h, r = horse[by_horse], race[by_horse]
+    again = (h[1:] == h[:-1]) & (r[1:] != r[:-1]) & (race_day[r[1:]] == race_day[r[:-1]])
+    later, earlier = r[1:][again], r[:-1][again]
+    level = np.zeros(n_races, np.int64)
+    while len(later):
+        new = level.copy()
+        np.maximum.at(new, later, level[earlier] + 1)
+        if np.array_equal(new, level):
+            break
+        level = new
+    batch = np.unique(race_day * (int(level.max()) + 1) + level, return_inverse=True)[1][race]
+
+    order = np.lexsort((place, race, batch))
+    horse, race, place, batch = horse[order], race[order], place[order], batch[order]
+    seq = np.cumsum(np.r_[True, race[1:] != race[:-1]]) - 1       # race number in this order
+    bounds = np.flatnonzero(np.r_[True, batch[1:] != batch[:-1], True])
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        _rate_block(rating, races, horse[s:e], seq[s:e] - seq[s], place[s:e])
+    return len(bounds) - 1
+
+
+# ---------- reading results ----------
+def _load(cx, race_ids) -> pd.DataFrame:
+    """The rated results (no 'no show') of the races `race_ids` (the whole history: _history())."""
+    result = cx.execute(_ids(RESULTS + " AND rr.raceId IN :ids", "ids"), {"ids": list(race_ids)})
+    parts = []
+    while rows := result.fetchmany(BATCH):
+        parts.append(pd.DataFrame(rows, columns=COLUMNS))
+    result.close()
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+
+
+def _races(dates: pd.Series, times: pd.Series):
+    """(chronological numbers, day numbers) of races given one row each, in date, time, then row order."""
+    dates, times = dates.astype(str), times.astype(str).str.zfill(8)     # MySQL TIME: 9:00:00
+    rank = np.empty(len(dates), np.int64)
+    rank[np.argsort((dates + " " + times).to_numpy(str), kind="stable")] = np.arange(len(dates))
+    days = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce").fillna(pd.Timestamp(0))
+    return rank, days.to_numpy("datetime64[D]").astype(np.int64)
+
+
+def _arrays(df: pd.DataFrame):
+    """(horse codes, horse ids, chronological race numbers, race day numbers, places)."""
+    horse, horse_ids = pd.factorize(df["horseId"])
+    race_code, race_ids = pd.factorize(df["raceId"])
+
+    # one row per race, in first-seen order
+    first = np.zeros(len(race_ids), np.int64)
+    first[race_code[::-1]] = np.arange(len(df) - 1, -1, -1)
+    rank, race_day = _races(df["raceDate"].iloc[first].reset_index(drop=True),
+                            df["raceTime"].iloc[first].reset_index(drop=True))
+
+    place = df["results"].map({p: i for i, p in enumerate(PLACES)}).to_numpy(np.int64)
+    return horse, np.asarray(horse_ids), rank[race_code], race_day[race_code], place
+
+
+def _history(cx):
+    """The arrays of _arrays() for the whole history, read as HISTORY rows. The horse IDs
+    are factorized once, straight from the unpacked strings, in sorted order (the
+    HorseRatings rows are then written in primary-key order)."""
+    if not is_sqlite(cx):
+        cx.execute(text("SET SESSION group_concat_max_len = 16777216"))     # default: 1024 bytes a race
+    result = cx.connection.cursor()
+    result.execute(Q.pick(HISTORY, cx))
+    dates, times, sizes, horses, places = [], [], [], [], []
+    while rows := result.fetchmany(BATCH):
+        d, t, n, h, p = zip(*rows)
+        dates += d
+        times += t
+        sizes += n
+        horses += h
+        places += p
+    result.close()
+    if not horses:
+        none = np.zeros(0, np.int64)
+        return none, np.array([], object), none, none, none
+
+    place = np.frombuffer("".join(places).encode(), np.uint8).astype(np.int64) - ord("0")
+    horse, horse_ids = pd.factorize(np.array(",".join(horses).split(","), object))
+    order = np.argsort(horse_ids.astype(str))       # sorting the distinct IDs is far cheaper than sort=True
+    at = np.empty(len(order), np.int64)
+    at[order] = np.arange(len(order))
+    horse, horse_ids = at[horse], horse_ids[order]
+    rank, race_day = _races(pd.Series(dates), pd.Series(times))
+    race = np.repeat(np.arange(len(sizes)), sizes)
+    return horse, np.asarray(horse_ids), rank[race], race_day[race], place
+
+
+def _last_days(n: int, horse, day, start=None) -> np.ndarray:
+    last = np.full(n, np.iinfo(np.int64).min) if start is None else start
+    np.maximum.at(last, horse, day)
+    return last
+
+
+def _write(cx, horse_ids, rating, races, last):
+    # driver-level executemany, as hrdb/search.py: a recompute writes one row per horse
+    mark = "?" if is_sqlite(cx) else "%s"
+    sql = f"INSERT INTO HorseRatings (horseId, rating, races, lastRaceDate) VALUES ({mark}, {mark}, {mark}, {mark})"
+    days = np.datetime_as_string(last.astype("datetime64[D]")).tolist()
+    rows = list(zip(horse_ids.tolist(), rating.tolist(), races.tolist(), days))
+    for i in range(0, len(rows), BATCH):
+        cx.exec_driver_sql(sql, rows[i:i + BATCH])
+
+
+# ---------- full and incremental ----------
+def recompute(cx) -> RatingReport:
+    """Rate the whole race history from scratch."""
+    t0 = time.perf_counter()
+    horse, horse_ids, race, day, place = _history(cx)
+    report = RatingReport(results=len(horse), races=len(np.unique(race)))
+    cx.execute(text("DELETE FROM HorseRatings"))
+    if len(horse):
+        rating, races = np.full(len(horse_ids), BASE), np.zeros(len(horse_ids), np.int64)
+        t1 = time.perf_counter()
+        report.batches = _replay(rating, races, horse, race, day, place)
+        report.rate_seconds = time.perf_counter() - t1
+        _write(cx, horse_ids, rating, races, _last_days(len(horse_ids), horse, day))
+        report.horses = len(horse_ids)
+    refresh_stables(cx)
+    if is_sqlite(cx):
+        cx.execute(text("ANALYZE HorseRatings"))    # rewritten wholesale: refresh the planner's stats
+        cx.execute(text("ANALYZE StableRatings"))
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def record_races(cx, race_ids):
+    """Rate newly inserted races (their RaceResults rows) on top of the stored ratings.
+
+    Locks the entrants' Horse and HorseRatings rows first (MySQL), so writes that
+    share a horse apply one after the other. Callers lock the Horse rows before
+    their inserts too (Q.LOCK_HORSES): the foreign-key checks of the inserts take
+    shared locks, and two writers upgrading them would deadlock.
+    """
+    if not race_ids:
+        return
+    df = _load(cx, race_ids)
+    if df.empty:
+        return
+    horse, horse_ids, race, day, place = _arrays(df)
+    rating, races = np.full(len(horse_ids), BASE), np.zeros(len(horse_ids), np.int64)
+    last = np.full(len(horse_ids), np.iinfo(np.int64).min)
+    at = {h: i for i, h in enumerate(horse_ids.tolist())}
+    ids = {"ids": sorted(at)}
+    stable_of = {r.horseId: r.stableId for r in cx.execute(_ids(Q.pick(Q.LOCK_HORSES, cx), "ids"), ids)}
+    stored = cx.execute(_ids(Q.pick(STORED, cx), "ids"), ids).all()    # a locking read: the latest ratings
+    for hid, r, n, d in stored:
+        i = at[hid]
+        rating[i], races[i] = r, n
+        if d is not None:
+            last[i] = np.datetime64(str(d)[:10], "D").astype(np.int64)
+    before = rating * races, races.copy()
+
+    _replay(rating, races, horse, race, day, place)
+    cx.execute(_ids("DELETE FROM HorseRatings WHERE horseId IN :ids", "ids"), ids)
+    _write(cx, horse_ids, rating, races, _last_days(len(horse_ids), horse, day, last))
+
+    stables = {}
+    d_sum, d_races, new = rating * races - before[0], races - before[1], before[1] == 0
+    for hid, sid in stable_of.items():
+        i = at[hid]
+        s = stables.setdefault(sid, [0.0, 0, 0])
+        s[0], s[1], s[2] = s[0] + d_sum[i], s[1] + int(d_races[i]), s[2] + int(new[i])
+    _add_to_stables(cx, stables)
+
+
+def _add_to_stables(cx, changes: dict):
+    """Add {stableId: [rating * races, races, horses]} onto StableRatings and re-derive the ratings."""
+    for sid, (rating_sum, races, horses) in changes.items():
+        upsert_add(cx, "StableRatings", "stableId", ["ratingSum", "races", "horses"],
+                   "SELECT :sid AS stableId, :s AS ratingSum, :n AS races, :h AS horses",
+                   {"sid": sid, "s": rating_sum, "n": races, "h": horses})
+    if changes:
+        cx.execute(_ids("UPDATE StableRatings SET rating = CASE WHEN races > 0 THEN ratingSum / races ELSE 0 END "
+                        "WHERE stableId IN :ids", "ids"), {"ids": list(changes)})
+
+
+def refresh_stables(cx):
+    """Re-derive every stable's rating from its horses."""
+    cx.execute(text("DELETE FROM StableRatings"))
+    cx.execute(text("""
+        INSERT INTO StableRatings (stableId, rating, ratingSum, races, horses)
+        SELECT h.stableId, SUM(hr.rating * hr.races) / SUM(hr.races), SUM(hr.rating * hr.races),
+               SUM(hr.races), COUNT(*)
+        FROM Horse h
+        JOIN HorseRatings hr ON hr.horseId = h.horseId
+        WHERE hr.races > 0
+        GROUP BY h.stableId
+    """))
+
+
+def move_horses(cx, horse_ids, to_stable: str):
+    """Carry the horses' ratings from their current stables to `to_stable`.
+    Call before the Horse rows are updated."""
+    if not horse_ids:
+        return
+    stables = cx.execute(_ids("""
+        SELECT h.stableId, SUM(hr.rating * hr.races), SUM(hr.races), COUNT(*)
+        FROM HorseRatings hr JOIN Horse h ON h.horseId = hr.horseId
+        WHERE hr.horseId IN :ids AND hr.races > 0 AND h.stableId <> :to
+        GROUP BY h.stableId
+    """, "ids"), {"ids": list(horse_ids), "to": to_stable}).all()
+    if not stables:
+        return
+    changes = {sid: [-s, -int(n), -int(h)] for sid, s, n, h in stables}
+    changes[to_stable] = [sum(s for _, s, _, _ in stables), sum(int(n) for _, _, n, _ in stables),
+                          sum(int(h) for _, _, _, h in stables)]
+    _add_to_stables(cx, changes)
+
+
+def remove_horses(cx, horse_ids):
+    """Drop the ratings of horses that are being deleted (call before the Horse rows go).
+    The horses they raced against keep what they gained or lost until a recompute."""
+    if not horse_ids:
+        return
+    ids = {"ids": list(horse_ids)}
+    stables = cx.execute(_ids("""
+        SELECT h.stableId, SUM(hr.rating * hr.races), SUM(hr.races), COUNT(*)
+        FROM HorseRatings hr JOIN Horse h ON h.horseId = hr.horseId
+        WHERE hr.horseId IN :ids AND hr.races > 0
+        GROUP BY h.stableId
+    """, "ids"), ids).all()
+    _add_to_stables(cx, {sid: [-s, -int(n), -int(h)] for sid, s, n, h in stables})
+    cx.execute(_ids("DELETE FROM HorseRatings WHERE horseId IN :ids", "ids"), ids)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--recompute", action="store_true", help="rate the whole history again")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+    if not args.recompute:
+        ap.print_help()
+        return
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    with engine.begin() as cx:
+        for name in RATING_TABLES:
+            cx.execute(text(RATING_TABLES[name]))
+        report = recompute(cx)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
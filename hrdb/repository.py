@@ -0,0 +1,397 @@
+"""Data access for the pages, without Streamlit: horses, owners, races, trainers, tracks.
+
+    repo = Repository(make_engine(), QueryCache())
+    repo.tracks.stats()                          # -> list of row dicts
+    repo.trainers.winners_page(size=50)          # -> Page (hrdb/paging.py)
+    rid = repo.races.add("Derby", "Riyadh", "2025-01-01", "18:00:00", entries)
+
+The schema is bootstrapped lazily (hrdb/bootstrap.py), once per process, by
+the first call that touches the database. Reads go through the query cache
+when one is given; the returned rows are shared with the cache, so treat them
+as read-only. Writes run in their own transaction and keep the summary tables
+current (hrdb/writes.py, hrdb/deletion.py); the admin page writes are retried
+on lock errors and raise ConflictError on stale data (hrdb/concurrency.py).
+The trainer and track reports add the archived seasons of their period, when
+there are any (hrdb/archive.py). Every write appends change events that
+subscribers can tail (repo.subscribe, hrdb/outbox.py).
+"""
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import text
+
+from hrdb import archive, concurrency, facts, ids, leaderboard, outbox, paging, ratings, search, snapshot, summaries
+from hrdb import writes
+from hrdb import queries as Q
+from hrdb.analytics import Analytics
+from hrdb.bootstrap import bootstrap
+from hrdb.cache import QueryCache
+from hrdb.deletion import DeleteReport, delete_owners
+from hrdb.leaderboard import Changes
+from hrdb.loader import LoadReport
+from hrdb.paging import Page
+from hrdb.schema import load_sql_script
+
+Row = dict[str, Any]
+
+# Sample applications for the Approve Trainer page (FOR TESTING)
+SAMPLE_APPLICATIONS = [("Ahmed", "Abed"), ("Faisal", "Hassan"), ("Mona", "Saeed"),
+                       ("Khalid", "Omar"), ("Sara", "Ali")]
+
+
+def _dates(period: tuple[str, str] | None) -> dict:
+    """:lo / :hi of a (first, last) race-date period; every date when None."""
+    return dict(Q.ALL_TIME) if period is None else {"lo": period[0], "hi": period[1]}
+
+
+class Repository:
+    def __init__(self, engine, cache: QueryCache | None = None):
+        self.engine = engine
+        self.cache = cache
+        self.horses = Horses(self)
+        self.owners = Owners(self)
+        self.races = Races(self)
+        self.trainers = Trainers(self)
+        self.tracks = Tracks(self)
+        self.stables = Stables(self)
+        self._analytics: Analytics | None = None
+
+    # ---------- plumbing ----------
+    def ready(self):
+        bootstrap(self.engine)
+
+    def begin(self):
+        """Transaction on a bootstrapped database."""
+        self.ready()
+        return self.engine.begin()
+
+    def transact(self, op: str, fn):
+        """fn(cx) in a write transaction, retried on lock errors (hrdb/concurrency.py)."""
+        self.ready()
+        return concurrency.transact(self.engine, op, fn)
+
+    def rows(self, sql, params: dict | None = None, cache: bool = True) -> list[Row]:
+        """Rows of a read query (`sql` may be a per-dialect dict)."""
+        self.ready()
+        sql = Q.pick(sql, self.engine)
+
+        def load():
+            with self.engine.connect() as cx:
+                return [dict(r) for r in cx.execute(text(sql), params or {}).mappings()]
+
+        if cache and self.cache is not None:
+            return self.cache.fetch(sql, params, load)
+        return load()
+
+    def page(self, sql, order, params: dict | None = None, after: tuple | None = None,
+             size: int = 50, fetch=paging.fetch_page) -> Page:
+        """One keyset page (cached like rows()); facts.page reads the seasons of ResultFacts."""
+        self.ready()
+
+        def load():
+            with self.engine.connect() as cx:
+                return fetch(cx, sql, order, params, after, size)
+
+        if self.cache is None:
+            return load()
+        page_sql = paging.keyset_sql(Q.pick(sql, self.engine), order, after is not None)
+        return self.cache.fetch(page_sql, paging.page_params(params, after, size), load)
+
+    def facts_rows(self, sql, period: tuple[str, str]) -> list[Row]:
+        """rows() of a query on ResultFacts between :lo and :hi, reading only the seasons
+        of the (first, last) `period` (hrdb/facts.py)."""
+        self.ready()
+        with self.engine.connect() as cx:
+            src = facts.source(cx, *period)
+        return self.rows(facts.on(Q.pick(sql, self.engine), src), _dates(period))
+
+    def archived(self, period: tuple[str, str] | None) -> bool:
+        """Whether archived seasons (hrdb/archive.py) fall in the (first, last) period."""
+        d = _dates(period)
+        return bool(self.rows(archive.ARCHIVED, {"first": int(d["lo"][:4]), "last": int(d["hi"][:4])}))
+
+    def with_archive(self, report, period: tuple[str, str] | None) -> list[Row]:
+        """An archive report (hrdb/archive.py) of the period, hot and archived seasons together."""
+        self.ready()
+        with self.engine.connect() as cx:
+            return report(cx, period)
+
+    def analytics(self) -> Analytics:
+        """The columnar copy of the race results behind the analytics reports (hrdb/analytics.py)."""
+        self.ready()
+        if self._analytics is None:
+            self._analytics = Analytics(self.engine)
+        return self._analytics
+
+    # ---------- maintenance ----------
+    def reload_sample_data(self, progress=None) -> LoadReport:
+        """Reload db.sql; the tables it drops (and their indexes/trigger) are recreated."""
+        report = load_sql_script(self.engine, progress=progress)
+        bootstrap(self.engine, force=True)
+        with self.engine.begin() as cx:
+            summaries.rebuild(cx)
+            search.rebuild(cx)
+            ratings.recompute(cx)
+            ids.reseed(cx)    # keep the ID sequences past the reloaded IDs
+            cx.execute(text("DELETE FROM HorseTransfers"))   # moves of the horses that were replaced
+            facts.rebuild(cx)
+            outbox.reset(cx, "sample data reloaded")
+        return report
+
+    def rebuild_summaries(self):
+        with self.begin() as cx:
+            summaries.rebuild(cx)
+
+    def recompute_ratings(self) -> ratings.RatingReport:
+        """Rate the whole race history again (hrdb/ratings.py)."""
+        with self.begin() as cx:
+            return ratings.recompute(cx)
+
+    def save_snapshot(self, name: str | None = None, fmt: str = "parquet") -> snapshot.SnapshotReport:
+        """Snapshot every table under snapshot.SNAPSHOT_DIR (hrdb/snapshot.py)."""
+        self.ready()
+        name = name or f"{self.engine.dialect.name}-{datetime.now():%Y%m%d-%H%M%S}"
+        return snapshot.save(self.engine, snapshot.SNAPSHOT_DIR / name, fmt)
+
+    def restore_snapshot(self, name: str) -> snapshot.SnapshotReport:
+        self.ready()
+        report = snapshot.restore(self.engine, snapshot.SNAPSHOT_DIR / name)
+        bootstrap(self.engine, force=True)     # a sqlite snapshot replaces the schema too
+        if self.cache is not None:
+            self.cache.clear()
+        return report
+
+    def verify_snapshot(self, name: str) -> list[tuple]:
+        self.ready()
+        return snapshot.verify(self.engine, snapshot.SNAPSHOT_DIR / name)
+
+    def snapshots(self) -> list[tuple[str, dict]]:
+        return snapshot.list_snapshots()
+
+    # ---------- change events ----------
+    def subscribe(self, name: str | None, handler, kinds=None, start: int | None = None) -> outbox.Subscriber:
+        """A subscriber to the change events of the writes (hrdb/outbox.py); drive it with poll() / run()."""
+        self.ready()
+        return outbox.Subscriber(self.engine, name, handler, kinds, start=start)
+
+    def outbox_status(self) -> tuple[int, list[Row]]:
+        """(last sequence number, subscribers with their lag)."""
+        self.ready()
+        with self.engine.connect() as cx:
+            return outbox.head(cx), outbox.status(cx)
+
+
+class _Part:
+    def __init__(self, repo: Repository):
+        self.repo = repo
+
+
+class Horses(_Part):
+    def choices(self) -> list[Row]:
+        """horseId, horseName of every horse, by name."""
+        return self.repo.rows(Q.HORSE_CHOICES)
+
+    def with_stable(self) -> list[Row]:
+        return self.repo.rows(Q.HORSES_WITH_STABLE)
+
+    def by_owner_page(self, lname: str, after: tuple | None = None, size: int = 50) -> Page:
+        """Horses (with age and trainers) of owners with a last-name word starting with `lname`
+        (or a spelling variant of it, see hrdb/search.py)."""
+        params = search.match_params(lname)
+        if params is None:      # nothing searchable (only punctuation)
+            return Page()
+        return self.repo.page(Q.HORSES_BY_OWNER, Q.HORSES_BY_OWNER_ORDER, params, after, size)
+
+    def ratings_page(self, after: tuple | None = None, size: int = 50) -> Page:
+        """Rated horses, best first."""
+        return self.repo.page(Q.HORSE_RATINGS_PAGE, Q.HORSE_RATINGS_ORDER, None, after, size)
+
+    def in_stable(self, stable_id: str) -> list[Row]:
+        """horseId, horseName, version of the stable's horses, by name."""
+        return self.repo.rows(Q.HORSES_IN_STABLE, {"sid": stable_id})
+
+    def transfers(self, horse_id: str) -> list[Row]:
+        """The horse's stable moves, newest first."""
+        return self.repo.rows(Q.HORSE_TRANSFERS, {"hid": horse_id})
+
+    def stable_on(self, horse_id: str, day: date) -> str | None:
+        """stableId the horse was in at the end of `day` (None for an unknown horse)."""
+        rows = self.repo.rows(Q.STABLE_ON_DATE, {"hid": horse_id, "before": str(day + timedelta(days=1))})
+        return rows[0]["stableId"] if rows else None
+
+    def transfer(self, horse_ids: list[str], new_stable: str, versions: dict | None = None) -> dict[str, str]:
+        """Move many horses at once (all or nothing); returns {horseId: old stable} of those
+        that moved. Pass {horseId: version} as shown to refuse (ConflictError) if any was moved since."""
+        return self.repo.transact("transfer_horses",
+                                  lambda cx: writes.transfer_horses(cx, horse_ids, new_stable, versions))
+
+    def move(self, horse_id: str, new_stable: str, version: int | None = None) -> str:
+        """Move a horse to another stable; returns the old stable. Pass the horse's
+        version as shown to refuse (ConflictError) if it was moved since."""
+        return self.repo.transact("move_horse",
+                                  lambda cx: writes.move_horse(cx, horse_id, new_stable, version))
+
+
+class Owners(_Part):
+    def with_counts(self) -> list[Row]:
+        return self.repo.rows(Q.OWNERS_WITH_COUNTS)
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[str]:
+        """Owner last names completing `prefix` (as-you-type suggestions)."""
+        self.repo.ready()
+        with self.repo.engine.connect() as cx:
+            return search.suggest(cx, "owner", prefix, limit)
+
+    def horses(self, owner_id: str) -> list[Row]:
+        """The owner's horses and how many owners each one has."""
+        return self.repo.rows(Q.OWNER_HORSES, {"oid": owner_id})
+
+    def horses_left_unowned(self, owner_id: str) -> list[Row]:
+        """Horses that deleting the owner would delete too."""
+        return self.repo.rows(Q.HORSES_LEFT_UNOWNED, {"oid": owner_id})
+
+    def delete(self, owner_ids: list[str]) -> DeleteReport:
+        """Delete owners, their links and their now-unowned horses in one transaction."""
+        return self.repo.transact("delete_owner", lambda cx: delete_owners(cx, owner_ids))
+
+
+class Races(_Part):
+    def exists(self, race_id: str) -> bool:
+        return bool(self.repo.rows(Q.RACE_EXISTS, {"rid": race_id}, cache=False))
+
+    def add(self, race_name, track: str, race_date: str, race_time: str, entries) -> str:
+        """Create a race with its (horseId, result, prize) entries; returns the new raceId."""
+        self.repo.ready()
+        rid = ids.new_ids(self.repo.engine, "race")[0]   # reserved before the insert transaction
+        self.repo.transact("add_race",
+                           lambda cx: writes.add_race(cx, rid, race_name, track, race_date, race_time, entries))
+        return rid
+
+    def results(self, race_id: str) -> list[Row]:
+        return self.repo.rows(Q.RACE_RESULTS_PREVIEW, {"rid": race_id})
+
+    def seasons(self) -> list[int]:
+        """Every season (year) from the first race's to the latest race's, archived ones included."""
+        span = self.repo.rows(Q.RACE_DATE_SPAN)[0]
+        cold = [r["season"] for r in self.repo.rows(archive.ARCHIVED, {"first": 0, "last": 9999})]
+        if not span["first"]:
+            return sorted(cold)
+        return sorted(set(cold) | set(range(int(str(span["first"])[:4]), int(str(span["last"])[:4]) + 1)))
+
+    def import_file(self, source, fmt=None, progress=None):
+        """Bulk import a results file (hrdb/bulk_import.py); returns its ImportReport."""
+        from hrdb.bulk_import import import_results
+        self.repo.ready()
+        return import_results(self.repo.engine, source, fmt, progress=progress)
+
+
+class Trainers(_Part):
+    def __init__(self, repo: Repository):
+        super().__init__(repo)
+        self._boards = {}   # (lo, hi) -> the last leaderboard() loaded
+        self._boards_lock = threading.Lock()     # shared by the app's script threads
+
+    def winners_page(self, after: tuple | None = None, size: int = 50,
+                     period: tuple[str, str] | None = None) -> Page:
+        """Trainers of first-place horses, newest races first; only races in the
+        (first, last) date `period` when given."""
+        return self.repo.page(Q.TRAINER_WINNERS_PAGE, Q.TRAINER_WINNERS_ORDER, _dates(period), after, size,
+                              fetch=archive.winners_page)
+
+    def winnings(self, period: tuple[str, str] | None = None) -> list[Row]:
+        """Prize money per trainer, of every race or of the races in `period`."""
+        if self.repo.archived(period):
+            return self.repo.with_archive(archive.trainer_winnings, period)
+        if period is None:
+            return self.repo.rows(Q.TRAINER_WINNINGS)
+        return self.repo.facts_rows(Q.TRAINER_WINNINGS_BETWEEN, period)
+
+    def leaderboard(self, period: tuple[str, str] | None = None, since: int = 0) -> tuple[list[Row], int]:
+        """(wins / winnings / runs per trainer of the stored races in `period`, the outbox
+        sequence number they are current as of); keep it current with leaderboard_changes().
+
+        Viewers share the last one loaded: it is a valid starting point at any age, since
+        the changes after its sequence number bring it up to date, or ask for a reload
+        when the outbox has pruned them. Pass `since` (the
+        sequence number of a reload) for one at least that recent."""
+        self.repo.ready()
+        d = _dates(period)
+        key = d["lo"], d["hi"]
+        with self._boards_lock:     # one load at a time: the others then share it
+            shared = self._boards.get(key)
+            if shared is None or shared[1] < since:
+                with self.repo.engine.connect() as cx:
+                    shared = self._boards[key] = leaderboard.load(cx, *key)
+        rows, seq = shared
+        return [dict(r) for r in rows], seq     # the caller merges changes into its copy
+
+    def leaderboard_changes(self, after: int, period: tuple[str, str] | None = None) -> Changes:
+        """What changed in leaderboard(period) since outbox sequence number `after` (hrdb/leaderboard.py)."""
+        self.repo.ready()
+        d = _dates(period)
+        with self.repo.engine.connect() as cx:
+            return leaderboard.changes(cx, after, d["lo"], d["hi"])
+
+    def ratings_page(self, after: tuple | None = None, size: int = 50) -> Page:
+        """Trainers by the rating of their stable, best first."""
+        return self.repo.page(Q.TRAINER_RATINGS_PAGE, Q.TRAINER_RATINGS_ORDER, None, after, size)
+
+    def pending_applications(self) -> list[Row]:
+        return self.repo.rows(Q.PENDING_APPLICATIONS)
+
+    def seed_pending_if_needed(self):
+        """Insert a few pending applications if there are none (FOR TESTING)."""
+        from datetime import datetime, timedelta
+        count = "SELECT COUNT(*) AS n FROM TrainerApplications WHERE status='pending'"
+        # runs on every render of the approve page: a plain read unless there is nothing pending
+        if self.repo.rows(count, cache=False)[0]["n"]:
+            return
+
+        def seed(cx):
+            if cx.execute(text(count)).scalar():   # another session seeded meanwhile
+                return
+            stables = cx.execute(text("SELECT stableId FROM Stable ORDER BY stableName LIMIT 5")).scalars().all()
+            base_time = datetime.now()
+            # up to the number of stables we have
+            for i, ((fn, ln), sid) in enumerate(zip(SAMPLE_APPLICATIONS, stables)):
+                cx.execute(text("""
+                    INSERT INTO TrainerApplications (fname, lname, stableId, requestedAt)
+                    VALUES (:fn, :ln, :sid, :ts)
+                """), {"fn": fn, "ln": ln, "sid": sid,
+                       "ts": (base_time + timedelta(minutes=i * 10)).strftime("%Y-%m-%d %H:%M:%S")})
+
+        self.repo.transact("seed_applications", seed)
+
+    def approve(self, app_id: int) -> str:
+        """Create the trainer of a pending application; returns the new trainerId.
+        ConflictError if another admin decided the application first."""
+        self.repo.ready()
+        tid = ids.new_ids(self.repo.engine, "trainer")[0]
+        self.repo.transact("approve_trainer", lambda cx: writes.approve_trainer(cx, app_id, tid))
+        return tid
+
+    def reject(self, app_id: int, reason: str | None = None):
+        self.repo.transact("reject_trainer", lambda cx: writes.reject_trainer(cx, app_id, reason))
+
+
+class Tracks(_Part):
+    def names(self) -> list[str]:
+        return [r["trackName"] for r in self.repo.rows(Q.TRACK_NAMES)]
+
+    def stats(self, period: tuple[str, str] | None = None) -> list[Row]:
+        """Races and participations per track, of every race or of the races in `period`."""
+        if self.repo.archived(period):
+            return self.repo.with_archive(archive.track_stats, period)
+        if period is None:
+            return self.repo.rows(Q.TRACK_STATS)
+        return self.repo.rows(Q.TRACK_STATS_BETWEEN, _dates(period))
+
+
+class Stables(_Part):
+    def choices(self) -> list[Row]:
+        return self.repo.rows(Q.STABLE_CHOICES)
+
+    def ratings_page(self, after: tuple | None = None, size: int = 50) -> Page:
+        """Rated stables, best first."""
+        return self.repo.page(Q.STABLE_RATINGS_PAGE, Q.STABLE_RATINGS_ORDER, None, after, size)
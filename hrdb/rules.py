@@ -0,0 +1,19 @@
+"""Validation rules shared by the Add Race page and the bulk importer."""
+
+RESULT_OPTIONS = ["first", "second", "third", "fourth", "last", "no show"] # As found in the appendix
+
+
+def validate_results(entries) -> list[str]:
+    """Check (horseId, result, prize) entries of ONE race; returns error messages."""
+    errors = []
+    seen = set()
+    for hid, res, prize in entries:
+        if hid in seen:
+            errors.append("Duplicate horse selected.")
+            break
+        seen.add(hid)
+        if res not in RESULT_OPTIONS:
+            errors.append(f"Invalid result for horse {hid}.")
+        if prize is None or prize < 0:
+            errors.append(f"Prize must be ≥ 0 for horse {hid}.")
+    return errors
@@ -0,0 +1,130 @@
+"""Schema migrations that db.sql does not cover (it only defines primary keys)."""
+from sqlalchemy import inspect, text
+
+from hrdb.backend import ROOT, is_sqlite, has_table
+from hrdb.loader import load_script
+
+# (index name, table, columns) — secondary indexes behind the joins/filters of the pages.
+INDEXES = [
+    ("idx_trainer_stable", "Trainer",     "stableId"),               # Trainer ⋈ Horse on stable
+    ("idx_horse_stable",   "Horse",       "stableId"),               # Horse ⋈ Trainer / Stable
+    ("idx_results_horse",  "RaceResults", "horseId, prize"),         # results per horse (+ covering prize sums)
+    ("idx_results_result", "RaceResults", "results, raceId, horseId"),  # rr.results = 'first'
+    ("idx_race_track",     "Race",        "trackName, raceId"),      # per-track stats
+    ("idx_race_date",      "Race",        "raceDate, raceId"),       # newest races first (paged winners)
+    ("idx_owner_lname",    "Owner",       "lname"),                  # owner lookups by last name
+    ("idx_owns_horse",     "Owns",        "horseId"),                # owners of a horse (PK starts with ownerId)
+    ("idx_horse_name",     "Horse",       "horseName, horseId"),     # horse pickers, ordered by name
+    ("idx_apps_status",    "TrainerApplications", "status, requestedAt"),  # pending applications
+    ("idx_horse_ratings",  "HorseRatings",  "rating, horseId"),      # rating tables, best first
+    ("idx_stable_ratings", "StableRatings", "rating, stableId"),
+    ("idx_transfers_horse", "HorseTransfers", "horseId, movedAt, transferId"),  # a horse's stable on a date
+]
+
+
+def ensure_indexes(cx, indexes=None):
+    """Create any missing index from INDEXES, or from `indexes` (idempotent).
+    Tables that don't exist yet are skipped."""
+    indexes = INDEXES if indexes is None else indexes
+    if is_sqlite(cx):
+        for name, table, cols in indexes:
+            if not has_table(cx, table):
+                continue
+            cx.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+        return
+
+    # MySQL has no CREATE INDEX IF NOT EXISTS: look the names up first
+    existing = {
+        (row.TABLE_NAME.lower(), row.INDEX_NAME)
+        for row in cx.execute(text("""
+            SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+        """))
+    }
+    for name, table, cols in indexes:
+        if (table.lower(), name) not in existing and has_table(cx, table):
+            cx.execute(text(f"CREATE INDEX {name} ON {table} ({cols})"))
+
+
+# (table, column, definition) — columns added to db.sql's tables.
+COLUMNS = [
+    ("Horse", "version", "INT NOT NULL DEFAULT 0"),   # bumped by every move (compare-and-swap, hrdb/concurrency.py)
+]
+
+
+def ensure_columns(cx):
+    """Add any missing column from COLUMNS (idempotent). Tables that don't exist yet are skipped."""
+    for table, column, definition in COLUMNS:
+        if not has_table(cx, table):
+            continue
+        if column not in {c["name"] for c in inspect(cx).get_columns(table)}:
+            cx.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+# Pending trainer applications (created on first visit of the Approve Trainer page)
+TRAINER_APPLICATIONS_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS TrainerApplications (
+          appId INT AUTO_INCREMENT PRIMARY KEY,
+          fname VARCHAR(30) NOT NULL,
+          lname VARCHAR(30) NOT NULL,
+          stableId VARCHAR(30) NOT NULL,
+          requestedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          status ENUM('pending','approved','rejected') NOT NULL DEFAULT 'pending',
+          decidedAt DATETIME NULL,
+          decisionBy VARCHAR(50) NULL,
+          decisionReason TEXT NULL,
+          approvedTrainerId VARCHAR(15) NULL,
+          FOREIGN KEY (stableId) REFERENCES Stable(stableId)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS TrainerApplications (
+          appId INTEGER PRIMARY KEY AUTOINCREMENT,
+          fname VARCHAR(30) NOT NULL,
+          lname VARCHAR(30) NOT NULL,
+          stableId VARCHAR(30) NOT NULL,
+          requestedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          status VARCHAR(10) NOT NULL DEFAULT 'pending'
+                 CHECK (status IN ('pending','approved','rejected')),
+          decidedAt DATETIME NULL,
+          decisionBy VARCHAR(50) NULL,
+          decisionReason TEXT NULL,
+          approvedTrainerId VARCHAR(15) NULL,
+          FOREIGN KEY (stableId) REFERENCES Stable(stableId)
+        )
+    """,
+}
+
+
+# Append-only history of stable moves (one row per horse moved; kept when the horse is deleted)
+# movedAt is written by writes.transfer_horses from the application clock (the default is UTC on SQLite)
+HORSE_TRANSFERS_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS HorseTransfers (
+          transferId BIGINT AUTO_INCREMENT PRIMARY KEY,
+          horseId    VARCHAR(15) NOT NULL,
+          fromStable VARCHAR(30) NOT NULL,
+          toStable   VARCHAR(30) NOT NULL,
+          movedAt    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          movedBy    VARCHAR(50) NULL
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS HorseTransfers (
+          transferId INTEGER PRIMARY KEY AUTOINCREMENT,
+          horseId    VARCHAR(15) NOT NULL,
+          fromStable VARCHAR(30) NOT NULL,
+          toStable   VARCHAR(30) NOT NULL,
+          movedAt    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          movedBy    VARCHAR(50) NULL
+        )
+    """,
+}
+
+
+# ---------- Reload data from db.sql ----------
+def load_sql_script(engine, script_path=ROOT / "db.sql", ddl_only=False, progress=None):
+    """Run db.sql (or another script) with foreign-key checks off (streamed, see hrdb/loader.py).
+    ddl_only=True skips the INSERTs (empty schema, e.g. for generated data)."""
+    return load_script(engine, script_path, ddl_only=ddl_only, progress=progress)
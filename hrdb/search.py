@@ -0,0 +1,265 @@
+"""Name search index: owner last names, trainer names and horse names.
+
+`LIKE '%term%'` can't use a b-tree index, so every owner search scanned
+Owner. Instead each name is broken into terms kept in NameIndex
+(kind, term, entityId), and a search is a prefix range on the primary key:
+
+    "Al-Sa'ūd"  ->  al, saud, alsaud                folded: lower case, no accents,
+                    ~al, ~sd, ~alsd                 "~" skeletons (see below)
+
+A query is folded the same way and matches an entity when the query is a
+prefix of one of its terms (so "saud", "Al Saud", "alsa" all find
+"Al-Sa'ūd"). The skeleton terms make transliteration variants meet:
+Mohammed / Muhammad / Mohamed / محمد all become "~mhmd", Khalid / Khaled
+"~khld", Yousef / Youssef / Yusuf "~ysf" (vowels after the first letter,
+doubled letters and a final h are dropped; Arabic letters are transliterated
+first). Matching is by word prefix, not by any substring: "med" no longer
+finds "Ahmed".
+
+The index is kept current by the write paths (owner/horse deletion, trainer
+approval) and rebuilt after bulk loads:
+
+    python -m hrdb.search --rebuild
+    python -m hrdb.search owner "mohamad"          # suggestions + timing
+"""
+import argparse
+import re
+import time
+import unicodedata
+
+from sqlalchemy import bindparam, text
+
+from hrdb import queries as Q
+from hrdb.backend import has_table, is_sqlite, make_engine
+
+NAME_INDEX_DDL = {
+    # binary collation: the prefix ranges below compare plain ASCII bytes
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS NameIndex (
+          kind     VARCHAR(10) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+          term     VARCHAR(60) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+          entityId VARCHAR(30) NOT NULL,
+          PRIMARY KEY (kind, term, entityId)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS NameIndex (
+          kind     VARCHAR(10) NOT NULL,
+          term     VARCHAR(60) NOT NULL,
+          entityId VARCHAR(30) NOT NULL,
+          PRIMARY KEY (kind, term, entityId)
+        )
+    """,
+}
+
+# kind -> (table, id column, name columns); owners are searched by last name
+SOURCES = {
+    "owner":   ("Owner", "ownerId", "lname"),
+    "trainer": ("Trainer", "trainerId", "fname, lname"),
+    "horse":   ("Horse", "horseId", "horseName"),
+}
+
+MAX_TERM = 60
+BATCH = 5000
+
+# first term (and one of its entities) in a prefix range
+SUGGEST_NEXT = """
+    SELECT term, entityId FROM NameIndex
+    WHERE kind = :kind AND term >= :lo AND term < :hi
+    ORDER BY term LIMIT 1
+"""
+
+# ---------- normalization ----------
+ARABIC = {
+    "ا": "a", "أ": "a", "إ": "a", "آ": "a", "ى": "a", "ء": "", "ؤ": "w", "ئ": "y",
+    "ب": "b", "ت": "t", "ث": "th", "ج": "j", "ح": "h", "خ": "kh", "د": "d", "ذ": "dh",
+    "ر": "r", "ز": "z", "س": "s", "ش": "sh", "ص": "s", "ض": "d", "ط": "t", "ظ": "z",
+    "ع": "a", "غ": "gh", "ف": "f", "ق": "q", "ك": "k", "ل": "l", "م": "m", "ن": "n",
+    "ه": "h", "ة": "h", "و": "w", "ي": "y", "ـ": "",
+}
+_DROP = dict.fromkeys(map(ord, "'`’ʿʾ"), None)      # apostrophes join: Sa'eed -> saeed
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_SKELETON_SUBS = [("ph", "f"), ("ck", "k"), ("q", "k"), ("c", "k"), ("dh", "d"), ("th", "t")]
+_VOWELS = set("aeiouyw")
+
+
+def fold(name: str) -> list[str]:
+    """Words of `name`: lower case, accents and Arabic script folded to a-z0-9."""
+    s = unicodedata.normalize("NFKD", name or "").translate(_DROP)
+    s = "".join(ARABIC.get(ch, ch) for ch in s if not unicodedata.combining(ch))
+    return [w for w in _NON_WORD.split(s.lower()) if w]
+
+
+def skeleton(word: str) -> str:
+    """Consonant skeleton shared by transliteration variants (Mohammed, Muhammad -> mhmd)."""
+    for a, b in _SKELETON_SUBS:
+        word = word.replace(a, b)
+    if not word:
+        return ""
+    head = "a" if word[0] in "aeiou" else word[0]
+    out = [head]
+    for ch in word[1:]:
+        if ch not in _VOWELS and ch != out[-1]:
+            out.append(ch)
+    if len(out) > 1 and out[-1] == "h":
+        out.pop()
+    return "".join(out)
+
+
+def terms(*parts: str) -> set[str]:
+    """Index terms of a name (given as one or more parts, e.g. first and last name)."""
+    words = [w for p in parts for w in fold(p)]
+    out = set()
+    variants = list(words)
+    if len(words) > 1:
+        variants.append("".join(words))                  # "Al Saud" -> alsaud
+    for w in words:
+        if w[:2] in ("al", "el") and len(w) > 4:
+            variants.append(w[2:])                       # "Alsaud" also as saud
+    for w in variants:
+        out.add(w[:MAX_TERM])
+        sk = skeleton(w)
+        if sk:
+            out.add(("~" + sk)[:MAX_TERM])
+    return out
+
+
+def _after(prefix: str) -> str:
+    """Smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def match_params(query: str) -> dict | None:
+    """:lo/:hi/:slo/:shi prefix ranges for `query` (None when it has no letters or digits)."""
+    words = fold(query)
+    if not words:
+        return None
+    lo = "".join(words)[:MAX_TERM]
+    sk = skeleton(lo)
+    # a one-letter skeleton ("moh" -> m) would match every name with that initial: empty range
+    slo = ("~" + sk)[:MAX_TERM] if len(sk) > 1 else "~"
+    return {"lo": lo, "hi": _after(lo), "slo": slo, "shi": _after(slo) if len(sk) > 1 else "~"}
+
+
+# ---------- maintenance ----------
+def index_entities(cx, kind: str, rows):
+    """Add the terms of (id, name parts...) rows."""
+    # driver-level executemany, as hrdb/datagen.py: bulk loads add millions of terms
+    mark = "?" if is_sqlite(cx) else "%s"
+    sql = f"INSERT INTO NameIndex (kind, term, entityId) VALUES ({mark}, {mark}, {mark})"
+    seen = {}       # many entities share a name
+    batch = []
+    for entity_id, *parts in rows:
+        key = tuple(p or "" for p in parts)
+        if key not in seen:
+            seen[key] = terms(*key)
+        batch.extend((kind, t, entity_id) for t in seen[key])
+        if len(batch) >= BATCH:
+            cx.exec_driver_sql(sql, batch)
+            batch = []
+    if batch:
+        cx.exec_driver_sql(sql, batch)
+
+
+def remove(cx, kind: str, id_query: str, params: dict | None = None):
+    """Drop the terms of the entities returned by `id_query` (a SELECT of ids)."""
+    cx.execute(text(f"DELETE FROM NameIndex WHERE kind = :kind AND entityId IN ({id_query})"),
+               dict(params or {}, kind=kind))
+
+
+def _source(kind: str, where: str = "") -> str:
+    table, id_col, name_cols = SOURCES[kind]
+    return f"SELECT {id_col}, {name_cols} FROM {table} " + (f"WHERE {id_col} IN :ids" if where else "")
+
+
+def _names(cx, kind: str, ids: list[str]) -> dict:
+    """{id: (name parts...)} of the given entities."""
+    stmt = text(_source(kind, "ids")).bindparams(bindparam("ids", expanding=True))
+    return {entity_id: parts for entity_id, *parts in cx.execute(stmt, {"ids": ids})}
+
+
+def index_ids(cx, kind: str, ids: list[str]):
+    """Index the given entities (e.g. just inserted) from their base table."""
+    index_entities(cx, kind, [(i, *parts) for i, parts in _names(cx, kind, ids).items()])
+
+
+def rebuild(cx, kinds=None):
+    """Recompute the index from the base tables."""
+    for kind in kinds or SOURCES:
+        cx.execute(text("DELETE FROM NameIndex WHERE kind = :k"), {"k": kind})
+        result = cx.execute(text(_source(kind)))
+        while rows := result.fetchmany(BATCH):
+            index_entities(cx, kind, rows)
+
+
+def ensure_name_index(cx) -> bool:
+    """Create NameIndex; a table that didn't exist yet is filled by a rebuild. True if created."""
+    if has_table(cx, "NameIndex"):
+        return False
+    cx.execute(text(Q.pick(NAME_INDEX_DDL, cx)))
+    cx.execute(text("CREATE INDEX idx_names_entity ON NameIndex (kind, entityId)"))
+    rebuild(cx)
+    return True
+
+
+# ---------- lookups ----------
+def _distinct_terms(cx, kind: str, lo: str, hi: str, n: int) -> list[str]:
+    """Entity ids of up to n distinct terms in [lo, hi): one index seek per term,
+    however many entities share a term."""
+    ids = []
+    while len(ids) < n:
+        row = cx.execute(text(SUGGEST_NEXT), {"kind": kind, "lo": lo, "hi": hi}).first()
+        if row is None:
+            break
+        ids.append(row.entityId)
+        lo = row.term + "\x00"                  # next distinct term
+    return ids
+
+
+def suggest(cx, kind: str, query: str, limit: int = 8) -> list[str]:
+    """Up to `limit` distinct names completing `query`, exact prefix matches before spelling variants."""
+    params = match_params(query)
+    if params is None:
+        return []
+    ids = _distinct_terms(cx, kind, params["lo"], params["hi"], limit * 2)
+    if len(ids) < limit * 2:                    # room left: add the spelling variants
+        ids += _distinct_terms(cx, kind, params["slo"], params["shi"], limit * 2 - len(ids))
+    if not ids:
+        return []
+    ids = list(dict.fromkeys(ids))
+    found = _names(cx, kind, ids)
+    names = []
+    for i in ids:                               # keep the index order
+        name = " ".join(p.strip() for p in found.get(i, ()) if p)
+        if name and name not in names:
+            names.append(name)
+            if len(names) == limit:
+                break
+    return names
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("kind", nargs="?", choices=sorted(SOURCES))
+    ap.add_argument("query", nargs="?")
+    ap.add_argument("--rebuild", action="store_true", help="recompute the index")
+    args = ap.parse_args()
+
+    engine = make_engine()
+    if args.rebuild:
+        t0 = time.perf_counter()
+        with engine.begin() as cx:
+            if not ensure_name_index(cx):
+                rebuild(cx)
+        print(f"name index rebuilt in {time.perf_counter() - t0:.1f}s")
+    if args.kind and args.query:
+        with engine.connect() as cx:
+            t0 = time.perf_counter()
+            names = suggest(cx, args.kind, args.query)
+            ms = (time.perf_counter() - t0) * 1000
+        print("\n".join(names) or "(no match)")
+        print(f"-- {ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Database snapshots: save every table to a directory, restore it, check for drift.
+
+A snapshot is a directory with a manifest.json and either
+
+    parquet   one zstd-compressed Parquet file per table (any backend, MySQL <-> SQLite)
+    sqlite    a page-level copy of the SQLite file (SQLite backup API; SQLite only)
+
+Restoring replays no SQL text. Parquet snapshots are bulk-inserted from Arrow
+batches, and sqlite snapshots are copied back page by page, so a reset is
+bound by disk bandwidth instead of per-statement parsing (compare "Reload data
+from db.sql"). The summary and rating tables, the name index and the ID sequences are
+saved too, so nothing needs to be rebuilt after a restore.
+
+The manifest records each table's row count and a digest of its contents
+(rows in primary-key order). `verify` compares the live database with it
+(drift), and a restore first checks the sha256 of the snapshot files.
+
+    python -m hrdb.snapshot save snapshots/base                  # --format sqlite
+    python -m hrdb.snapshot verify snapshots/base                # exit 1 on drift
+    python -m hrdb.snapshot restore snapshots/base
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import bindparam, inspect, text
+
+from hrdb import facts, ids, outbox, versions
+from hrdb.backend import ROOT, backend_name, fk_checks_off, has_table, is_sqlite, make_engine
+
+SNAPSHOT_DIR = Path(os.environ.get("HR_SNAPSHOT_DIR") or ROOT / "snapshots")
+BATCH = 50_000
+
+# Restored in this order and cleared in the reverse one. old_info comes first so it
+# is cleared last: deleting Horse fires trg_horse_to_oldinfo, which refills it.
+# DataVersions is per database and is never restored. ResultFacts is saved as one
+# table and restored into its seasons (a view over season tables on SQLite, hrdb/facts.py).
+# ArchivedSeasons is the catalog of the archive (hrdb/archive.py); the files stay where they are.
+# The outbox (hrdb/outbox.py) is not saved and its sequence only moves forward: a sqlite
+# snapshot does carry the outbox tables, so restore() puts back the live head (the higher
+# one) and checkpoints over them. Either way a restore appends a data_reset event.
+TABLES = ["old_info", "Stable", "Horse", "Owner", "Owns", "Trainer", "Track", "Race", "RaceResults",
+          "TrainerApplications", "IdSequences", "TrackStats",
+          "NameIndex", "HorseRatings", "StableRatings", "HorseTransfers", "ResultFacts", "TrainerWinnings",
+          "ArchivedSeasons"]
+
+
+@dataclass
+class SnapshotReport:
+    path: Path
+    rows: dict = field(default_factory=dict)     # table -> rows
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (f"{sum(self.rows.values()):,} rows in {len(self.rows)} tables, "
+                f"{self.bytes / 1e6:.1f} MB, {self.seconds:.2f}s ({self.path})")
+
+
+# ---------- table contents ----------
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet snapshots need pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _kind(col_type) -> str:
+    """'int', 'float' or 'str' (dates and times are kept as text, as SQLite stores them)."""
+    try:
+        py = col_type.python_type
+    except NotImplementedError:
+        return "str"
+    if py is int:
+        return "int"
+    if py is float or py.__name__ == "Decimal":
+        return "float"
+    return "str"
+
+
+def _text(v):
+    if v is None or isinstance(v, str):
+        return v
+    if isinstance(v, timedelta):          # MySQL TIME
+        s = int(v.total_seconds())
+        return f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+    if isinstance(v, datetime):
+        return v.isoformat(" ")
+    return str(v)
+
+
+_CAST = {"int": lambda v: v if v is None else int(v),
+         "float": lambda v: v if v is None else float(v),
+         "str": _text}
+
+
+def columns(cx, table: str) -> list[tuple[str, str]]:
+    """(column, kind) of a table, in table order."""
+    return [(c["name"], _kind(c["type"])) for c in inspect(cx).get_columns(table)]
+
+
+def _order_by(cx, table: str, cols) -> str:
+    pk = inspect(cx).get_pk_constraint(table)["constrained_columns"]
+    return ", ".join(pk or [c for c, _ in cols])
+
+
+def read_table(cx, table: str, cols, where: str = "", params: dict | None = None):
+    """Batches (lists of row tuples, normalized by column kind) of a table in primary-key order;
+    only the rows matching `where` when given."""
+    names = ", ".join(c for c, _ in cols)
+    casts = [_CAST[k] for _, k in cols]
+    where = f" WHERE {where}" if where else ""
+    result = cx.execute(text(f"SELECT {names} FROM {table}{where} ORDER BY {_order_by(cx, table, cols)}"),
+                        params or {})
+    while rows := result.fetchmany(BATCH):
+        yield [tuple(f(v) for f, v in zip(casts, row)) for row in rows]
+
+
+def table_digests(cx, tables=None) -> dict:
+    """{table: {"rows": n, "digest": sha256 of the contents}} of the existing tables."""
+    out = {}
+    for table in tables or TABLES:
+        if not has_table(cx, table):
+            continue
+        h, n = hashlib.sha256(), 0
+        for batch in read_table(cx, table, columns(cx, table)):
+            h.update(repr(batch).encode())
+            n += len(batch)
+        out[table] = {"rows": n, "digest": h.hexdigest()}
+    return out
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ---------- save ----------
+def save(engine, path, fmt: str = "parquet") -> SnapshotReport:
+    """Write a snapshot of every table to the directory `path`."""
+    t0 = time.perf_counter()
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    report = SnapshotReport(path)
+    manifest = {"format": fmt, "created": datetime.now().isoformat(timespec="seconds"),
+                "backend": engine.dialect.name, "tables": {}}
+
+    if fmt == "sqlite":
+        if not is_sqlite(engine):
+            raise ValueError("sqlite snapshots need the SQLite backend; use parquet")
+        target = path / "db.sqlite"
+        target.unlink(missing_ok=True)
+        dst = sqlite3.connect(target)
+        with engine.connect() as cx:
+            cx.connection.driver_connection.backup(dst)     # consistent copy, page by page
+        dst.execute("PRAGMA journal_mode=DELETE")           # a single self-contained file
+        dst.close()
+        snap = make_engine("sqlite", f"sqlite:///file:{target}?mode=ro&uri=true", readonly=True)
+        with snap.connect() as cx:
+            manifest["tables"] = table_digests(cx)
+        snap.dispose()
+        manifest["file"], manifest["sha256"] = target.name, file_sha256(target)
+        report.bytes = target.stat().st_size
+    elif fmt == "parquet":
+        pa, pq = _arrow()
+        arrow_types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+        with engine.connect() as cx, cx.begin():             # one consistent read
+            for table in TABLES:
+                if not has_table(cx, table):
+                    continue
+                cols = columns(cx, table)
+                schema = pa.schema([(c, arrow_types[k]) for c, k in cols])
+                file = path / f"{table}.parquet"
+                h, n = hashlib.sha256(), 0
+                with pq.ParquetWriter(file, schema, compression="zstd") as writer:
+                    for batch in read_table(cx, table, cols):
+                        h.update(repr(batch).encode())
+                        n += len(batch)
+                        writer.write_batch(pa.RecordBatch.from_arrays(
+                            [pa.array(v, type=schema.field(i).type) for i, v in enumerate(zip(*batch))],
+                            schema=schema))
+                manifest["tables"][table] = {"rows": n, "digest": h.hexdigest(),
+                                             "file": file.name, "sha256": file_sha256(file)}
+                report.bytes += file.stat().st_size
+    else:
+        raise ValueError(f"unknown snapshot format {fmt!r} (expected 'parquet' or 'sqlite')")
+
+    (path / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    report.rows = {t: m["rows"] for t, m in manifest["tables"].items()}
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+# ---------- restore ----------
+def read_manifest(path) -> dict:
+    return json.loads((Path(path) / "manifest.json").read_text())
+
+
+def _check_files(path: Path, manifest: dict):
+    files = ([(manifest["file"], manifest["sha256"])] if manifest["format"] == "sqlite"
+             else [(m["file"], m["sha256"]) for m in manifest["tables"].values()])
+    for name, sha in files:
+        if file_sha256(path / name) != sha:
+            raise ValueError(f"{name} does not match its checksum in manifest.json (corrupt or edited)")
+
+
+def _drop_indexes(cx, tables) -> list[str]:
+    """Drop the (non-primary-key) indexes of SQLite tables; returns their CREATE statements."""
+    rows = cx.execute(text("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN :tables
+    """).bindparams(bindparam("tables", expanding=True)), {"tables": tables}).all()
+    for name, _ in rows:
+        cx.execute(text(f"DROP INDEX {name}"))
+    return [sql for _, sql in rows]
+
+
+def restore(engine, path) -> SnapshotReport:
+    """Replace the contents of every table saved in the snapshot. The schema must
+    exist (hrdb/bootstrap.py) for parquet snapshots; sqlite ones carry their own."""
+    t0 = time.perf_counter()
+    path = Path(path)
+    manifest = read_manifest(path)
+    _check_files(path, manifest)
+    report = SnapshotReport(path, rows={t: m["rows"] for t, m in manifest["tables"].items()})
+
+    with engine.connect() as cx:
+        before = versions.read(cx) if has_table(cx, "DataVersions") else {}
+        live = has_table(cx, "OutboxHead")
+        head = outbox.head(cx) if live else 0
+        checkpoints = outbox.status(cx) if live else []
+
+    if manifest["format"] == "sqlite":
+        if not is_sqlite(engine):
+            raise ValueError("sqlite snapshots can only be restored into the SQLite backend")
+        src = sqlite3.connect(f"file:{path / manifest['file']}?mode=ro", uri=True)
+        with engine.connect() as cx:
+            src.backup(cx.connection.driver_connection)
+        src.close()
+        report.bytes = (path / manifest["file"]).stat().st_size
+    else:
+        _, pq = _arrow()
+        tables = [t for t in TABLES if t in manifest["tables"]]
+        mark = "?" if is_sqlite(engine) else "%s"
+        with fk_checks_off(engine) as cx:
+            for table in reversed(tables):
+                if table == "ResultFacts":
+                    facts.clear(cx)
+                else:
+                    cx.execute(text(f"DELETE FROM {table}"))
+            # SQLite: build the secondary indexes once after the load instead of row by row
+            indexes = _drop_indexes(cx, tables + facts.tables(cx)) if is_sqlite(cx) else []
+            for table in tables:
+                file = pq.ParquetFile(path / manifest["tables"][table]["file"])
+                names = file.schema_arrow.names
+                sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join([mark] * len(names))})"
+                for batch in file.iter_batches(batch_size=BATCH):
+                    rows = list(zip(*(col.to_pylist() for col in batch.columns)))
+                    if rows and table == "ResultFacts":
+                        facts.insert_rows(cx, names, rows)
+                    elif rows:
+                        cx.exec_driver_sql(sql, rows)
+                report.bytes += (path / manifest["tables"][table]["file"]).stat().st_size
+            for sql in indexes:
+                cx.execute(text(sql))
+
+    with engine.begin() as cx:
+        ids.reseed(cx)
+        if manifest["format"] == "sqlite":
+            # the page copy brought the snapshot's outbox back: no sequence number may be
+            # handed out twice, and the subscribers keep what they have handled
+            outbox.ensure_outbox_tables(cx)
+            cx.execute(text("UPDATE OutboxHead SET seq = :s WHERE id = 1 AND seq < :s"), {"s": head})
+            cx.execute(text("DELETE FROM OutboxCheckpoints"))
+            for row in checkpoints:
+                outbox.save_checkpoint(cx, row["subscriber"], row["checkpoint"])
+        outbox.reset(cx, f"snapshot {path.name} restored")
+        # the versions must move forward even where the snapshot's counters are older
+        if has_table(cx, "DataVersions"):
+            after = versions.read(cx)
+            for t in versions.TABLES:
+                cx.execute(text("UPDATE DataVersions SET version = :v WHERE tableName = :t"),
+                           {"v": max(before.get(t, 0), after.get(t, 0)) + 1, "t": t})
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+# ---------- drift ----------
+def verify(engine, path) -> list[tuple]:
+    """(table, snapshot rows, live rows, same contents?) for every table of the snapshot."""
+    manifest = read_manifest(path)
+    with engine.connect() as cx:
+        live = table_digests(cx, list(manifest["tables"]))
+    out = []
+    for table, snap in manifest["tables"].items():
+        now = live.get(table, {"rows": 0, "digest": None})
+        out.append((table, snap["rows"], now["rows"], now["digest"] == snap["digest"]))
+    return out
+
+
+def list_snapshots(root=SNAPSHOT_DIR) -> list[tuple[str, dict]]:
+    """(directory name, manifest) of the snapshots under `root`, newest first."""
+    root = Path(root)
+    found = [(p.name, read_manifest(p)) for p in root.iterdir() if (p / "manifest.json").exists()] \
+        if root.exists() else []
+    return sorted(found, key=lambda s: s[1]["created"], reverse=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("action", choices=["save", "restore", "verify", "list"])
+    ap.add_argument("path", nargs="?", help=f"snapshot directory (default: a new one under {SNAPSHOT_DIR})")
+    ap.add_argument("--format", choices=["parquet", "sqlite"], default="parquet")
+    ap.add_argument("--sqlite", help="use this SQLite file instead of the configured backend")
+    args = ap.parse_args()
+
+    engine = make_engine("sqlite", f"sqlite:///{args.sqlite}") if args.sqlite else make_engine()
+    if args.action == "list":
+        for name, m in list_snapshots():
+            print(f"{name:<24} {m['created']}  {m['format']:<8} {sum(t['rows'] for t in m['tables'].values()):>12,} rows")
+        return
+    if args.action == "save":
+        path = args.path or SNAPSHOT_DIR / f"{backend_name()}-{datetime.now():%Y%m%d-%H%M%S}"
+        print("saved", save(engine, path, args.format).summary())
+        return
+    if not args.path:
+        ap.error(f"{args.action} needs the snapshot directory")
+    if args.action == "restore":
+        print("restored", restore(engine, args.path).summary())
+        return
+    drift = False
+    for table, snap_rows, live_rows, same in verify(engine, args.path):
+        drift |= not same
+        print(f"  {table:<20} {snap_rows:>12,} {live_rows:>12,}  {'ok' if same else 'CHANGED'}")
+    print("drift detected" if drift else "no drift")
+    sys.exit(1 if drift else 0)
+
+
+if __name__ == "__main__":
+    main()
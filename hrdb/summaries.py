@@ -0,0 +1,140 @@
+"""Materialized summaries of the race history behind the Track Stats report.
+
+    TrackStats     (trackName) races run + horse participations per track
+
+They are kept up to date inside the same transaction as the write that
+changes the underlying rows (race added, horses deleted, season archived),
+so the reports read a handful of rows instead of re-aggregating all race
+history. They cover the races stored in the database, not archived ones.
+`rebuild()` recomputes everything from scratch (repair / after a reload):
+
+    python -m hrdb.summaries --rebuild
+"""
+import argparse
+
+from sqlalchemy import bindparam, text
+
+from hrdb.backend import has_table, is_sqlite, make_engine
+
+SUMMARY_TABLES = {
+    "TrackStats": """
+        CREATE TABLE IF NOT EXISTS TrackStats (
+          trackName        VARCHAR(30) NOT NULL,
+          raceCount        INT NOT NULL DEFAULT 0,
+          participantCount INT NOT NULL DEFAULT 0,
+          PRIMARY KEY (trackName)
+        )
+    """,
+}
+# per-horse / per-stable winnings no report read; dropped from databases that still have them
+DROPPED_TABLES = ["HorseWinnings", "StableWinnings"]
+
+
+def upsert_add(cx, table: str, key: str, cols: list[str], select_sql: str, params: dict):
+    """INSERT ... SELECT that adds onto existing rows instead of failing on the key.
+    A list value in `params` is bound as an expanding IN (...) parameter."""
+    col_list = ", ".join([key] + cols)
+    if is_sqlite(cx):
+        sets = ", ".join(f"{c} = {table}.{c} + excluded.{c}" for c in cols)
+        # "WHERE true" keeps SQLite from parsing ON CONFLICT as a join constraint
+        sql = f"INSERT INTO {table} ({col_list}) SELECT * FROM ({select_sql}) WHERE true " \
+              f"ON CONFLICT({key}) DO UPDATE SET {sets}"
+    else:
+        sets = ", ".join(f"{c} = {c} + VALUES({c})" for c in cols)
+        sql = f"INSERT INTO {table} ({col_list}) {select_sql} ON DUPLICATE KEY UPDATE {sets}"
+    stmt = text(sql)
+    expanding = [bindparam(k, expanding=True) for k, v in params.items() if isinstance(v, list)]
+    if expanding:
+        stmt = stmt.bindparams(*expanding)
+    cx.execute(stmt, params)
+
+
+# ---------- schema ----------
+def ensure_summary_tables(cx):
+    """Create the summary tables; a table that didn't exist yet is filled by a rebuild."""
+    for name in DROPPED_TABLES:
+        cx.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    missing = [name for name in SUMMARY_TABLES if not has_table(cx, name)]
+    for name in missing:
+        cx.execute(text(SUMMARY_TABLES[name]))
+    if missing:
+        rebuild(cx)
+
+
+def rebuild(cx):
+    """Recompute every summary from the base tables."""
+    for name in SUMMARY_TABLES:
+        cx.execute(text(f"DELETE FROM {name}"))
+    cx.execute(text("""
+        INSERT INTO TrackStats (trackName, raceCount, participantCount)
+        SELECT r.trackName, COUNT(DISTINCT r.raceId), COUNT(rr.horseId)
+        FROM Race r
+        LEFT JOIN RaceResults rr ON rr.raceId = r.raceId
+        GROUP BY r.trackName
+    """))
+
+
+# ---------- incremental maintenance ----------
+def record_races(cx, race_ids):
+    """Add newly inserted races (and their RaceResults rows) to the summaries."""
+    if not race_ids:
+        return
+    ids = {"ids": list(race_ids)}
+    upsert_add(cx, "TrackStats", "trackName", ["raceCount", "participantCount"], """
+        SELECT r.trackName, COUNT(DISTINCT r.raceId) AS raceCount, COUNT(rr.horseId) AS participantCount
+        FROM Race r
+        LEFT JOIN RaceResults rr ON rr.raceId = r.raceId
+        WHERE r.raceId IN :ids
+        GROUP BY r.trackName
+    """, ids)
+
+
+def remove_horses(cx, horse_ids):
+    """Take horses out of the summaries. Call before their RaceResults rows are deleted."""
+    if not horse_ids:
+        return
+    ids = {"ids": list(horse_ids)}
+    # per-track deltas of just these horses, then one keyed UPDATE
+    tracks = cx.execute(text("""
+        SELECT r.trackName AS trk, COUNT(*) AS n
+        FROM RaceResults rr JOIN Race r ON r.raceId = rr.raceId
+        WHERE rr.horseId IN :ids
+        GROUP BY r.trackName
+    """).bindparams(bindparam("ids", expanding=True)), ids).mappings().all()
+    if tracks:
+        cx.execute(text("UPDATE TrackStats SET participantCount = participantCount - :n WHERE trackName = :trk"),
+                   [dict(r) for r in tracks])
+
+
+def remove_season(cx, lo: str, hi: str):
+    """Take the races between lo and hi out of the summaries (they are being archived,
+    hrdb/archive.py). Call before their RaceResults rows are deleted."""
+    dates = {"lo": lo, "hi": hi}
+    tracks = cx.execute(text("""
+        SELECT r.trackName AS trk, COUNT(DISTINCT r.raceId) AS races, COUNT(rr.horseId) AS n
+        FROM Race r
+        LEFT JOIN RaceResults rr ON rr.raceId = r.raceId
+        WHERE r.raceDate BETWEEN :lo AND :hi
+        GROUP BY r.trackName
+    """), dates).mappings().all()
+    if tracks:
+        cx.execute(text("UPDATE TrackStats SET raceCount = raceCount - :races, "
+                        "participantCount = participantCount - :n WHERE trackName = :trk"),
+                   [dict(r) for r in tracks])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rebuild", action="store_true", help="recompute every summary table")
+    args = ap.parse_args()
+    if not args.rebuild:
+        ap.print_help()
+        return
+    with make_engine().begin() as cx:
+        ensure_summary_tables(cx)
+        rebuild(cx)
+    print("Summary tables rebuilt.")
+
+
+if __name__ == "__main__":
+    main()
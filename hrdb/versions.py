@@ -0,0 +1,69 @@
+"""Per-table data versions, so readers in other processes can tell whether anything changed.
+
+DataVersions holds one counter per table. Every transaction committed through
+an engine made by make_engine() bumps the counters of the tables it wrote, in
+that same transaction (one UPDATE at COMMIT; the written tables are picked up
+from the statements, as the query cache does). The HTTP API (hrdb/api.py)
+builds its ETags from these counters. Writes made outside this code (e.g. the
+mysql client) are not seen.
+"""
+from sqlalchemy import bindparam, event, inspect, text
+
+from hrdb.cache import written_tables
+
+DATA_VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS DataVersions (
+      tableName VARCHAR(64) NOT NULL,
+      version   BIGINT NOT NULL DEFAULT 0,
+      PRIMARY KEY (tableName)
+    )
+"""
+
+# tables with a counter (lower case, as written_tables() reports them)
+TABLES = ["stable", "horse", "owner", "owns", "trainer", "track", "race", "raceresults",
+          "trainerapplications", "trackstats", "old_info",
+          "nameindex", "horseratings", "stableratings", "horsetransfers", "resultfacts",
+          "trainerwinnings", "archivedseasons"]
+
+BUMP = text("UPDATE DataVersions SET version = version + 1 WHERE tableName IN :tables") \
+    .bindparams(bindparam("tables", expanding=True))
+
+
+def ensure_versions(cx):
+    """Create DataVersions and a counter for every table in TABLES (idempotent)."""
+    cx.execute(text(DATA_VERSIONS_DDL))
+    have = set(cx.execute(text("SELECT tableName FROM DataVersions")).scalars())
+    missing = [{"t": t} for t in TABLES if t not in have]
+    if missing:
+        cx.execute(text("INSERT INTO DataVersions (tableName, version) VALUES (:t, 0)"), missing)
+
+
+def read(cx) -> dict[str, int]:
+    """{table: version} of every counted table."""
+    return dict(cx.execute(text("SELECT tableName, version FROM DataVersions")).all())
+
+
+def watch(engine):
+    """Bump the counters of the written tables when a transaction on `engine` commits."""
+    ready = []   # set once DataVersions is known to exist (it is created by hrdb/bootstrap.py)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, _cursor, statement, _params, _context, _many):
+        tables = written_tables(statement) & set(TABLES)
+        if tables:
+            conn.info.setdefault("hr_version_tables", set()).update(tables)
+
+    @event.listens_for(engine, "commit")
+    def _on_commit(conn):
+        tables = conn.info.pop("hr_version_tables", None)
+        if not tables:
+            return
+        if not ready:
+            if not inspect(conn).has_table("DataVersions"):
+                return
+            ready.append(True)
+        conn.execute(BUMP, {"tables": sorted(tables)})
+
+    @event.listens_for(engine, "rollback")
+    def _on_rollback(conn):
+        conn.info.pop("hr_version_tables", None)
@@ -0,0 +1,162 @@
+"""Admin write paths behind the Add Race, Move Horse and Approve Trainer pages
+(owner deletion is in hrdb/deletion.py).
+
+Each function runs inside the caller's transaction and keeps the summary,
+fact and rating tables current, so app.py, the bulk importer and the benchmarks all go
+through the same statements. Every change is also appended to the outbox as
+change events (hrdb/outbox.py). Rows another admin may have changed meanwhile are
+updated by compare-and-swap and raise ConflictError (hrdb/concurrency.py).
+Horses are moved with a few set-based statements per 500 horses, and every move is
+appended to the HorseTransfers history.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+from hrdb import queries as Q
+from hrdb import archive, facts, outbox, ratings, search, summaries
+from hrdb.concurrency import ConflictError
+
+INSERT_RACE = """
+    INSERT INTO Race (raceId, raceName, trackName, raceDate, raceTime)
+    VALUES (:id, :nm, :trk, :dt, :tm)
+"""
+INSERT_RESULT = """
+    INSERT INTO RaceResults (raceId, horseId, results, prize)
+    VALUES (:rid, :hid, :res, :pr)
+"""
+# movedAt from the application clock, like the race dates it is compared with (STABLE_ON_DATE);
+# the column default is UTC on SQLite, so a move just after local midnight would land on the day before
+INSERT_TRANSFERS = """
+    INSERT INTO HorseTransfers (horseId, fromStable, toStable, movedAt, movedBy)
+    SELECT horseId, stableId, :to, :at, :by FROM Horse
+    WHERE horseId IN :ids AND stableId <> :to
+"""
+UPDATE_STABLES = """
+    UPDATE Horse SET stableId = :to, version = version + 1
+    WHERE horseId IN :ids AND stableId <> :to
+"""
+TRANSFER_CHUNK = 500  # horses per set-based statement (keeps IN lists short)
+
+
+def add_race(cx, race_id: str, race_name, track: str, race_date: str, race_time: str, entries):
+    """Insert a race and its (horseId, result, prize) entries; ValueError if its date
+    falls in an archived season (hrdb/archive.py)."""
+    archive.check_open(cx, race_date)
+    race = {"id": race_id, "nm": race_name or None, "trk": track, "dt": race_date, "tm": race_time}
+    results = [{"rid": race_id, "hid": hid, "res": res, "pr": prize} for hid, res, prize in entries]
+    # the entrants first, before the inserts' foreign-key checks (see ratings.record_races)
+    cx.execute(_ids(Q.pick(Q.LOCK_HORSES, cx)), {"ids": sorted({r["hid"] for r in results})})
+    cx.execute(text(INSERT_RACE), race)
+    cx.execute(text(INSERT_RESULT), results)
+    summaries.record_races(cx, [race_id])
+    facts.record_races(cx, [race_id])
+    ratings.record_races(cx, [race_id])
+    record_events(cx, [race], results)
+
+
+def record_events(cx, races: list[dict], results: list[dict]):
+    """race_created / result_recorded events of inserted races (INSERT_RACE / INSERT_RESULT parameters)."""
+    entries = {}
+    for r in results:
+        entries[r["rid"]] = entries.get(r["rid"], 0) + 1
+    outbox.append(cx, "race_created", [(r["id"], {"raceId": r["id"], "raceName": r["nm"], "trackName": r["trk"],
+                                                  "raceDate": r["dt"], "raceTime": r["tm"],
+                                                  "entries": entries.get(r["id"], 0)}) for r in races])
+    outbox.append(cx, "result_recorded", [(f"{r['rid']}/{r['hid']}", {"raceId": r["rid"], "horseId": r["hid"],
+                                                                     "results": r["res"], "prize": r["pr"]})
+                                          for r in results])
+
+
+def _ids(sql: str):
+    return text(sql).bindparams(bindparam("ids", expanding=True))
+
+
+def _few(horse_ids) -> str:
+    more = f" and {len(horse_ids) - 3} more" if len(horse_ids) > 3 else ""
+    return ", ".join(horse_ids[:3]) + more
+
+
+def transfer_horses(cx, horse_ids, new_stable: str, versions: dict | None = None,
+                    moved_by: str = "Admin") -> dict[str, str]:
+    """Move horses (with their ratings) to `new_stable` and record each
+    move in HorseTransfers; returns {horseId: old stable} of the horses that moved.
+    Horses already in `new_stable` are left alone.
+
+    All or nothing: with `versions` ({horseId: Horse.version as the caller saw it})
+    no horse moves if any of them was moved since, nor if one no longer exists
+    (ConflictError). Run it in a write transaction (hrdb/concurrency.py) so the
+    rows stay locked between the check and the update.
+    """
+    horse_ids = list(dict.fromkeys(horse_ids))
+    chunks = [horse_ids[i:i + TRANSFER_CHUNK] for i in range(0, len(horse_ids), TRANSFER_CHUNK)]
+    rows = {}
+    for chunk in chunks:
+        rows.update({hid: (sid, v) for hid, sid, v in
+                     cx.execute(_ids(Q.pick(Q.LOCK_HORSES, cx)), {"ids": chunk})})
+    missing = [hid for hid in horse_ids if hid not in rows]
+    if missing:
+        raise ConflictError(f"Horse(s) {_few(missing)} no longer exist.")
+    stale = [hid for hid, v in (versions or {}).items() if rows[hid][1] != v]
+    if stale:
+        raise ConflictError(f"Horse(s) {_few(stale)} were moved by someone else.")
+
+    moved = {hid: rows[hid][0] for hid in horse_ids if rows[hid][0] != new_stable}
+    params = {"to": new_stable, "by": moved_by, "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    for chunk in chunks:
+        chunk = [hid for hid in chunk if hid in moved]
+        if not chunk:
+            continue
+        ratings.move_horses(cx, chunk, new_stable)
+        cx.execute(_ids(INSERT_TRANSFERS), {**params, "ids": chunk})
+        if cx.execute(_ids(UPDATE_STABLES), {**params, "ids": chunk}).rowcount != len(chunk):
+            raise ConflictError("Some of the horses were moved by someone else.")
+    outbox.append(cx, "horse_moved", [(hid, {"horseId": hid, "fromStable": old, "toStable": new_stable,
+                                             "movedBy": moved_by}) for hid, old in moved.items()])
+    return moved
+
+
+def move_horse(cx, horse_id: str, new_stable: str, version: int | None = None) -> str:
+    """Move one horse; returns its old stable. With `version` the move only applies if
+    nobody moved the horse since; otherwise ConflictError."""
+    moved = transfer_horses(cx, [horse_id], new_stable, None if version is None else {horse_id: version})
+    return moved.get(horse_id, new_stable)
+
+
+def approve_trainer(cx, app_id: int, trainer_id: str):
+    """Create the trainer of a pending application and mark it approved.
+
+    The application is claimed first (only while still pending), so of two admins
+    deciding it at once one wins and the other gets ConflictError.
+    """
+    claimed = cx.execute(text("""
+        UPDATE TrainerApplications
+        SET status='approved', decidedAt=CURRENT_TIMESTAMP,
+            decisionBy='Admin', approvedTrainerId=:tid
+        WHERE appId=:id AND status='pending'
+    """), {"tid": trainer_id, "id": app_id}).rowcount
+    if not claimed:
+        raise ConflictError(f"Application #{app_id} is no longer pending.")
+    cx.execute(text("""
+        INSERT INTO Trainer (trainerId, lname, fname, stableId)
+        SELECT :tid, lname, fname, stableId
+        FROM TrainerApplications
+        WHERE appId = :id
+    """), {"tid": trainer_id, "id": app_id})
+    search.index_ids(cx, "trainer", [trainer_id])
+    trainer = cx.execute(text("SELECT fname, lname, stableId FROM Trainer WHERE trainerId = :tid"),
+                         {"tid": trainer_id}).mappings().one()
+    outbox.append(cx, "trainer_approved", [(trainer_id, {"trainerId": trainer_id, "appId": app_id, **trainer})])
+
+
+def reject_trainer(cx, app_id: int, reason=None):
+    """Mark a pending application rejected (ConflictError if it was decided meanwhile)."""
+    claimed = cx.execute(text("""
+        UPDATE TrainerApplications
+        SET status='rejected', decidedAt=CURRENT_TIMESTAMP,
+            decisionBy='Admin', decisionReason=:rsn
+        WHERE appId=:id AND status='pending'
+    """), {"rsn": reason, "id": app_id}).rowcount
+    if not claimed:
+        raise ConflictError(f"Application #{app_id} is no longer pending.")
+    outbox.append(cx, "trainer_rejected", [(app_id, {"appId": app_id, "reason": reason})])
@@ -0,0 +1,34 @@
+"""Bulk import: bad races are skipped and reported, the rest of their chunk is written."""
+import io
+
+from sqlalchemy import text
+
+from hrdb.backend import make_engine
+from hrdb.bootstrap import bootstrap
+from hrdb.bulk_import import import_results
+
+CSV = """raceKey,raceName,trackName,raceDate,raceTime,horseId,results,prize
+bad-date,Bad Date,Bahrain,garbage!!,14:00,horse1,first,1000
+good,Good Race,Bahrain,2024-03-01,14:00,horse1,first,1000
+good,Good Race,Bahrain,2024-03-01,14:00,horse2,second,500
+no-such-day,Leap,Bahrain,2024-02-30,14:00,horse1,first,1000
+bad-time,Late,Bahrain,2024-03-02,25:99,horse1,first,1000
+"""
+
+
+def test_bad_date_and_time_skip_only_their_race(tmp_path):
+    engine = make_engine("sqlite", f"sqlite:///{tmp_path / 'hr.sqlite'}")
+    bootstrap(engine)
+    with engine.connect() as cx:
+        before = cx.execute(text("SELECT COUNT(*) FROM Race")).scalar()
+
+    report = import_results(engine, io.StringIO(CSV), "csv", chunk_rows=100)    # one chunk
+
+    assert (report.races, report.rows, report.skipped_races) == (1, 2, 3)
+    assert any("bad-date" in e and "raceDate" in e for e in report.errors)
+    assert any("no-such-day" in e and "raceDate" in e for e in report.errors)
+    assert any("bad-time" in e and "raceTime" in e for e in report.errors)
+    with engine.connect() as cx:
+        assert cx.execute(text("SELECT COUNT(*) FROM Race")).scalar() == before + 1
+        assert cx.execute(text("SELECT raceDate, raceTime FROM Race WHERE raceName = 'Good Race'")).one() \
+            == ("2024-03-01", "14:00:00")